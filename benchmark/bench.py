@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+headless benchmark of render and editing hot paths
+
+usage:
+    python benchmark/bench.py [--lines 1000,10000] [--repeat 3] [--output result.json]
+    python benchmark/bench.py --compare old.json new.json
+
+Editor benchmarks run on the Qt "offscreen" platform.
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import platform
+import tempfile
+import argparse
+import datetime
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from benchmark.corpus import make_rst, make_md, make_py, DEFAULT_LINES  # noqa: E402
+
+BENCHMARKS = ['rst2htmlcode', 'rst_edit', 'md2htmlcode', 'htmlcode', 'lexer', 'open', 'save']
+
+
+def measure(func, repeat):
+    """ return: seconds of every run """
+    values = []
+    for x in range(repeat):
+        t1 = time.perf_counter()
+        func()
+        values.append(time.perf_counter() - t1)
+    return values
+
+
+def get_versions():
+    import docutils
+    import markdown
+    import pygments
+    from PyQt5.QtCore import QT_VERSION_STR, PYQT_VERSION_STR
+    from PyQt5.Qsci import QSCINTILLA_VERSION_STR
+    from meditor import __app_version__
+    # markdown 2.x: markdown.__version__ is a module
+    markdown_version = getattr(markdown, '__version__', None)
+    if not isinstance(markdown_version, str):
+        markdown_version = markdown.version
+    return {
+        'meditor': __app_version__,
+        'python': platform.python_version(),
+        'docutils': docutils.__version__,
+        'markdown': markdown_version,
+        'pygments': pygments.__version__,
+        'qt': QT_VERSION_STR,
+        'pyqt': PYQT_VERSION_STR,
+        'qscintilla': QSCINTILLA_VERSION_STR,
+    }
+
+
+class Bench(object):
+    def __init__(self, repeat, graphviz):
+        self.repeat = repeat
+        self.graphviz = graphviz
+        self.results = []
+        self._editor = None
+        self._tmpdir = tempfile.mkdtemp(prefix='meditor-bench-')
+
+    def close(self):
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def editor(self):
+        if self._editor is None:
+            from PyQt5 import QtCore, QtWidgets
+            from meditor import globalvars
+            from meditor.editor import Editor
+            self._app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+            globalvars.init()
+            settings = QtCore.QSettings(
+                os.path.join(self._tmpdir, 'bench.ini'), QtCore.QSettings.IniFormat)
+            self._editor = Editor(settings, None)
+        return self._editor
+
+    def add(self, name, line_count, text, values):
+        result = {
+            'name': name,
+            'lines': line_count,
+            'bytes': len(text.encode('utf-8')),
+            'repeat': len(values),
+            'min': min(values),
+            'median': statistics.median(values),
+            'mean': statistics.mean(values),
+        }
+        self.results.append(result)
+        print('%-14s %8s lines  min %9.1fms  median %9.1fms' % (
+            name, line_count, result['min'] * 1000, result['median'] * 1000))
+        sys.stdout.flush()
+
+    def run(self, names, line_counts):
+        from meditor import output
+        for line_count in line_counts:
+            rst_text = make_rst(line_count, graphviz=self.graphviz)
+            md_text = make_md(line_count, graphviz=self.graphviz)
+            py_text = make_py(line_count)
+            if 'rst2htmlcode' in names:
+                values = measure(lambda: output.rst2htmlcode(rst_text, settings={}), self.repeat)
+                self.add('rst2htmlcode', line_count, rst_text, values)
+            if 'rst_edit' in names:
+                self.bench_rst_edit(line_count, rst_text)
+            if 'md2htmlcode' in names:
+                values = measure(lambda: output.md2htmlcode(md_text, settings={}), self.repeat)
+                self.add('md2htmlcode', line_count, md_text, values)
+            if 'htmlcode' in names:
+                values = measure(lambda: output.htmlcode(py_text, 'bench.py'), self.repeat)
+                self.add('htmlcode', line_count, py_text, values)
+            if 'lexer' in names:
+                self.bench_lexer(line_count, rst_text)
+            if 'open' in names or 'save' in names:
+                self.bench_file(names, line_count, rst_text)
+
+    def bench_rst_edit(self, line_count, text):
+        """ render again after a word in the middle is changed """
+        from meditor import output
+        lines = text.split('\n')
+        x = len(lines) // 2
+        while '*' not in lines[x]:
+            x += 1
+        lines[x] = lines[x].replace('*', '*x', 1)
+        texts = [text, '\n'.join(lines)]
+
+        def render():
+            # every run is an edit of the last text
+            texts.reverse()
+            output.rst2htmlcode(texts[1], settings={'incremental': incremental})
+
+        for name, incremental in (('rst_edit', True), ('rst_edit_full', False)):
+            render()
+            values = measure(render, self.repeat)
+            self.add(name, line_count, text, values)
+
+    def bench_lexer(self, line_count, text):
+        editor = self.editor()
+        editor.setLexerByFilename('bench.rst')
+        editor.pauseLexer(True)
+        editor.setText(text)
+        editor.pauseLexer(False)
+        lexer = editor.lexer()
+        length = editor.length()
+        values = measure(lambda: lexer.do_StylingText(0, length), self.repeat)
+        self.add('lexer', line_count, text, values)
+
+    def bench_file(self, names, line_count, text):
+        editor = self.editor()
+        filename = os.path.join(self._tmpdir, 'bench_%s.rst' % line_count)
+        with open(filename, 'wt', encoding='utf-8', newline='') as f:
+            f.write(text)
+        if 'open' in names:
+            values = measure(lambda: editor._open(filename), self.repeat)
+            self.add('open', line_count, text, values)
+        if 'save' in names:
+            editor._open(filename)
+            values = measure(lambda: editor._save(filename), self.repeat)
+            self.add('save', line_count, text, values)
+
+
+def compare(old_file, new_file):
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    old_results = dict(((r['name'], r['lines']), r) for r in old['results'])
+    print('%-14s %8s  %10s  %10s  %7s' % ('name', 'lines', 'old(ms)', 'new(ms)', 'ratio'))
+    for result in new['results']:
+        key = (result['name'], result['lines'])
+        if key not in old_results:
+            continue
+        old_value = old_results[key]['median']
+        new_value = result['median']
+        print('%-14s %8s  %10.1f  %10.1f  %6.2fx' % (
+            key[0], key[1], old_value * 1000, new_value * 1000,
+            new_value / old_value if old_value else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='meditor benchmark')
+    parser.add_argument('--lines', default=','.join('%s' % x for x in DEFAULT_LINES),
+                        help='line counts, separated by comma')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help='benchmarks, separated by comma: %s' % ','.join(BENCHMARKS))
+    parser.add_argument('--graphviz', action='store_true',
+                        help='include graphviz blocks, "dot" is required')
+    parser.add_argument('--output', help='write results to JSON file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two JSON results')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    names = args.only.split(',') if args.only else BENCHMARKS
+    line_counts = [int(x) for x in args.lines.split(',')]
+    bench = Bench(args.repeat, args.graphviz)
+    try:
+        bench.run(names, line_counts)
+    finally:
+        bench.close()
+    data = {
+        'date': datetime.datetime.now().isoformat(),
+        'platform': platform.platform(),
+        'versions': get_versions(),
+        'repeat': args.repeat,
+        'graphviz': args.graphviz,
+        'results': bench.results,
+    }
+    if args.output:
+        with open(args.output, 'wt') as f:
+            json.dump(data, f, indent=2)
+        print('write results to %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- encoding:utf-8 -*-
+"""
+generate reStructuredText, Markdown and Python documents for benchmark
+
+The same seed always generates the same documents.
+
+usage: python benchmark/corpus.py [--lines 1000,10000] [--graphviz] output_dir
+"""
+import os
+import random
+import argparse
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+    'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam '
+    'quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+    'consequat duis aute irure in reprehenderit voluptate velit esse cillum '
+    '中文 测试 文本 编辑器 预览'
+).split()
+ASCII_WORDS = [word for word in WORDS if word.isascii()]
+
+DEFAULT_LINES = [1000, 10000, 50000, 200000]
+
+
+def sentence(rnd, count=12):
+    return ' '.join(rnd.choice(WORDS) for _ in range(count))
+
+
+class RstGenerator(object):
+    def __init__(self, seed=0, graphviz=False):
+        self.rnd = random.Random(seed)
+        self.graphviz = graphviz
+        self.count = 0
+        self.level = -1
+
+    def title(self):
+        # a section level can not be skipped
+        level = self.rnd.randint(0, min(2, self.level + 1))
+        self.level = level
+        text = 'Section %s %s' % (self.count, self.rnd.choice(WORDS))
+        self.count += 1
+        # wide characters take two columns
+        return [text, '=-~^'[level] * len(text) * 2, '']
+
+    def paragraph(self):
+        rnd = self.rnd
+        lines = []
+        for x in range(rnd.randint(2, 5)):
+            words = sentence(rnd).split()
+            words[1] = '*%s*' % words[1]
+            words[3] = '**%s**' % words[3]
+            words[5] = '``%s``' % words[5]
+            if x == 0:
+                words[7] = '`%s <http://example.com/%s>`_' % (words[7], self.count)
+            if x == 1:
+                words[8] = ':math:`x^{%s}`' % self.count
+            lines.append(' '.join(words))
+        return lines + ['']
+
+    def bullets(self):
+        return ['- %s' % sentence(self.rnd, 6) for _ in range(self.rnd.randint(3, 6))] + ['']
+
+    def table(self):
+        lines = ['+--------+------------------+', '| Name   | Value            |', '+========+==================+']
+        for x in range(self.rnd.randint(2, 4)):
+            value = ' '.join(self.rnd.choice(ASCII_WORDS) for _ in range(2))
+            lines.append('| %-6s | %-16s |' % ('n%s' % x, value[:16]))
+            lines.append('+--------+------------------+')
+        return lines + ['']
+
+    def code(self):
+        lines = ['.. code-block:: python', '']
+        for x in range(self.rnd.randint(3, 8)):
+            lines.append('    value_%s = compute(%s, "%s")' % (x, x, self.rnd.choice(WORDS)))
+        return lines + ['']
+
+    def directive(self):
+        kind = self.rnd.choice(['note', 'warning', 'tip'])
+        return ['.. %s::' % kind, '', '   %s' % sentence(self.rnd), '']
+
+    def math(self):
+        return ['.. math::', '', '   \\int_0^{%s} f(x) dx = \\sum_{k=0}^{n} a_k' % self.count, '']
+
+    def dot(self):
+        return ['.. dot::', '', '   digraph G { a -> b; b -> c; c -> a%s; }' % self.count, '']
+
+    def generate(self, line_count):
+        lines = ['=' * 20, 'Benchmark Document', '=' * 20, '', '.. contents::', '']
+        blocks = [self.paragraph, self.paragraph, self.bullets, self.table,
+                  self.code, self.directive, self.math]
+        if self.graphviz:
+            blocks.append(self.dot)
+        while len(lines) < line_count:
+            lines += self.title()
+            for x in range(self.rnd.randint(2, 5)):
+                lines += self.rnd.choice(blocks)()
+        return '\n'.join(lines[:line_count]) + '\n'
+
+
+class MdGenerator(object):
+    def __init__(self, seed=0, graphviz=False):
+        self.rnd = random.Random(seed)
+        self.graphviz = graphviz
+        self.count = 0
+
+    def title(self):
+        self.count += 1
+        return ['#' * self.rnd.randint(1, 3) + ' Section %s' % self.count, '']
+
+    def paragraph(self):
+        rnd = self.rnd
+        lines = []
+        for x in range(rnd.randint(2, 5)):
+            words = sentence(rnd).split()
+            words[1] = '*%s*' % words[1]
+            words[3] = '**%s**' % words[3]
+            words[5] = '`%s`' % words[5]
+            if x == 0:
+                words[7] = '[%s](http://example.com/%s)' % (words[7], self.count)
+            if x == 1:
+                words[8] = '\\(x^{%s}\\)' % self.count
+            lines.append(' '.join(words))
+        return lines + ['']
+
+    def bullets(self):
+        return ['* %s' % sentence(self.rnd, 6) for _ in range(self.rnd.randint(3, 6))] + ['']
+
+    def table(self):
+        lines = ['| Name | Value |', '| ---- | ----- |']
+        for x in range(self.rnd.randint(2, 4)):
+            lines.append('| n%s | %s |' % (x, sentence(self.rnd, 2)))
+        return lines + ['']
+
+    def code(self):
+        lines = ['```python']
+        for x in range(self.rnd.randint(3, 8)):
+            lines.append('value_%s = compute(%s, "%s")' % (x, x, self.rnd.choice(WORDS)))
+        return lines + ['```', '']
+
+    def admonition(self):
+        return ['!!! note', '    %s' % sentence(self.rnd), '']
+
+    def math(self):
+        return ['$$\\int_0^{%s} f(x) dx$$' % self.count, '']
+
+    def dot(self):
+        return ['```dot', 'digraph G { a -> b; b -> c; c -> a%s; }' % self.count, '```', '']
+
+    def generate(self, line_count):
+        lines = ['# Benchmark Document', '', '[TOC]', '']
+        blocks = [self.paragraph, self.paragraph, self.bullets, self.table,
+                  self.code, self.admonition, self.math]
+        if self.graphviz:
+            blocks.append(self.dot)
+        while len(lines) < line_count:
+            lines += self.title()
+            for x in range(self.rnd.randint(2, 5)):
+                lines += self.rnd.choice(blocks)()
+        return '\n'.join(lines[:line_count]) + '\n'
+
+
+def make_py(line_count, seed=0):
+    rnd = random.Random(seed)
+    lines = ['#!/usr/bin/env python', '# -*- encoding:utf-8 -*-', '']
+    count = 0
+    while len(lines) < line_count:
+        lines += [
+            '',
+            'def function_%s(value, name="%s"):' % (count, rnd.choice(WORDS)),
+            '    """ %s """' % sentence(rnd, 6),
+            '    if value > %s:' % rnd.randint(0, 100),
+            '        return [x * 2 for x in range(value)]  # %s' % rnd.choice(WORDS),
+            '    return {"name": name, "value": value}',
+        ]
+        count += 1
+    return '\n'.join(lines[:line_count]) + '\n'
+
+
+def make_rst(line_count, seed=0, graphviz=False):
+    return RstGenerator(seed, graphviz).generate(line_count)
+
+
+def make_md(line_count, seed=0, graphviz=False):
+    return MdGenerator(seed, graphviz).generate(line_count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='generate benchmark corpus')
+    parser.add_argument('--lines', default=','.join('%s' % x for x in DEFAULT_LINES),
+                        help='line counts, separated by comma')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--graphviz', action='store_true', help='include graphviz blocks')
+    parser.add_argument('output_dir')
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for line_count in [int(x) for x in args.lines.split(',')]:
+        for ext, text in [
+            ('rst', make_rst(line_count, args.seed, args.graphviz)),
+            ('md', make_md(line_count, args.seed, args.graphviz)),
+            ('py', make_py(line_count, args.seed)),
+        ]:
+            filename = os.path.join(args.output_dir, 'bench_%s.%s' % (line_count, ext))
+            with open(filename, 'wt', encoding='utf-8', newline='') as f:
+                f.write(text)
+            print(filename)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ import datetime
 import logging.handlers
 import argparse
 import threading
+import multiprocessing
 import platform
 from functools import partial
 
@@ -30,60 +31,75 @@ from . import output
 from . import globalvars
 from .util import toUtf8, toBytes, download, unzip
 from .findreplace import FindReplaceDialog
+from .timingview import TimingView
+from .outlineview import OutlineView
 from .gaction import GlobalAction
+from .preview import PreviewScheduler, PreviewCache, PreviewStats, StageTimer
+from .renderer import RenderServer
 from . import qrc_icon_theme
 
 
-previewEvent = threading.Event()
-
 # for logger
 logger = None
 
 
 def previewWorker(self):
     while True:
-        previewEvent.wait()
-        if self.previewQuit:
+        job = self.previewScheduler.take()
+        if job is None:
             logger.debug('Preview exit')
             break
-        previewEvent.clear()
-        previewText = self.previewData['text']
-        previewPath = self.previewData['path']
-        logger.debug('Preview %s' % previewPath)
+        previewText = job.text
+        previewPath = job.path
+        logger.debug('Preview %s (generation %s)' % (previewPath, job.generation))
         ext = os.path.splitext(previewPath)[1].lower()
         settings = {}
+        ok = True
         if not previewText:
-            self.previewHtml = ''
+            previewHtml = ''
         elif ext in ['.rst', '.rest']:
-            if self.previewData['mathjax']:
+            if job.mathjax:
                 if os.path.exists(__mathjax_full_path__):
                     settings['mathjax'] = __mathjax_full_path__
-            self.previewHtml = output.rst2htmlcode(previewText,
-                                                   theme=self.rst_theme,
-                                                   settings=settings)
+            if self.previewRstIncremental:
+                settings['incremental'] = True
+            ok, previewHtml = self.renderServer.render(
+                'rst2htmlcode', previewText,
+                theme=self.rst_theme, settings=settings, timer=job.timer)
         elif ext in ['.md', '.markdown']:
-            if self.previewData['mathjax']:
+            if job.mathjax:
                 if os.path.exists(__mathjax_full_path__):
                     mathjax_path = __mathjax_full_path__
                 else:
                     mathjax_path = __mathjax_min_path__
                 mathjax = """<script type="text/javascript" src="file:///%s"></script>""" % mathjax_path
                 settings['mathjax'] = mathjax
-            self.previewHtml = output.md2htmlcode(previewText,
-                                                  theme=self.md_theme,
-                                                  settings=settings)
+            ok, previewHtml = self.renderServer.render(
+                'md2htmlcode', previewText,
+                theme=self.md_theme, settings=settings, timer=job.timer)
         elif ext in ['.gv']:
-            self.previewHtml = output.graphviz2htmlcode(previewText)
+            ok, previewHtml = self.renderServer.render(
+                'graphviz2htmlcode', previewText, timer=job.timer)
         elif ext in ['.htm', '.html', '.php', '.asp']:
-            self.previewHtml = previewText
+            previewHtml = previewText
         elif ext in EXTENSION_LEXER:
-            self.previewHtml = output.htmlcode(previewText, previewPath)
+            ok, previewHtml = self.renderServer.render(
+                'htmlcode', previewText, previewPath, timer=job.timer)
         else:
-            previewPath = \
+            ok = False
+            previewHtml = \
                 '<html><body><h1>Error</h1><p>Unknown extension: %s</p></body></html>' \
                 % ext
+        if ok and job.cache_key:
+            # the result is valid even if out of date, failure may be transient
+            self.previewCache.put(job.cache_key, previewHtml)
+        if not self.previewScheduler.isCurrent(job):
+            logger.debug('Preview generation %s is out of date, discard' % job.generation)
+            continue
+        job.html = previewHtml
         logger.warn('preview %s' % previewPath)
-        self.updatePreviewViewRequest.emit()
+        job.timer.restart()
+        self.updatePreviewViewRequest.emit(job)
     return
 
 
@@ -92,10 +108,16 @@ class MainWindow(QtWidgets.QMainWindow):
     md_theme = 'default'
     settings = None
     icon_theme = None
-    previewData = None
+    previewScheduler = None
+    previewCache = None
+    previewStats = None
+    previewTimedJob = None
+    renderServer = None
+    previewMathJax = False
+    previewRstIncremental = False
+    previewPath = ''
     previewHtml = ''
-    previewQuit = False
-    updatePreviewViewRequest = QtCore.pyqtSignal()
+    updatePreviewViewRequest = QtCore.pyqtSignal(object)
     previewViewVisibleNotify = QtCore.pyqtSignal(bool)
     _toolbar = None
 
@@ -140,11 +162,16 @@ class MainWindow(QtWidgets.QMainWindow):
         self.settings.setValue('global_drop', value)
         self.setAcceptDrops(value)
 
-        self.previewData = {
-            'text': '',
-            'path': '',
-            'mathjax': False,
-        }
+        self.previewScheduler = PreviewScheduler()
+        value = self.settings.value('preview/cache_size', 32, type=int)
+        self.settings.setValue('preview/cache_size', value)
+        self.previewCache = PreviewCache(value * 1024 * 1024)
+        value = self.settings.value('preview/render_process', True, type=bool)
+        self.settings.setValue('preview/render_process', value)
+        self.renderServer = RenderServer(value)
+        self.previewStats = PreviewStats()
+        # pre-warm render process during loading window
+        self.renderServer.start()
         # main window
         self.findDialog = FindReplaceDialog(self)
 
@@ -170,6 +197,14 @@ class MainWindow(QtWidgets.QMainWindow):
         self.dock_workspace.visibilityChanged.connect(
             partial(self.onDockVisibility, 'workspace'))
         self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, self.dock_workspace)
+
+        self.dock_outlineview = QtWidgets.QDockWidget(self.tr('Outline'), self)
+        self.dock_outlineview.setObjectName('dock_outlineview')
+        self.outlineview = OutlineView(self.dock_outlineview)
+        self.dock_outlineview.setWidget(self.outlineview)
+        self.dock_outlineview.visibilityChanged.connect(
+            partial(self.onDockVisibility, 'outlineview'))
+        self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, self.dock_outlineview)
         # right dock window
         self.dock_webview = QtWidgets.QDockWidget(self.tr('Preview'), self)
         self.dock_webview.setObjectName('dock_webview')
@@ -188,10 +223,22 @@ class MainWindow(QtWidgets.QMainWindow):
             partial(self.onDockVisibility, 'codeview'))
         self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.dock_codeview)
 
+        self.dock_timingview = QtWidgets.QDockWidget(self.tr('Preview Timings'), self)
+        self.dock_timingview.setObjectName('dock_timingview')
+        self.timingview = TimingView(self.previewStats, self.dock_timingview)
+        self.dock_timingview.setWidget(self.timingview)
+        self.dock_timingview.visibilityChanged.connect(
+            partial(self.onDockVisibility, 'timingview'))
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.dock_timingview)
+
         value = settings.value('view/workspace', True, type=bool)
         settings.setValue('view/workspace', value)
         self.dock_workspace.setVisible(value)
 
+        value = settings.value('view/outlineview', False, type=bool)
+        settings.setValue('view/outlineview', value)
+        self.dock_outlineview.setVisible(value)
+
         value = settings.value('view/webview', True, type=bool)
         settings.setValue('view/webview', value)
         self.dock_webview.setVisible(value)
@@ -199,6 +246,10 @@ class MainWindow(QtWidgets.QMainWindow):
         value = settings.value('view/codeview', True, type=bool)
         settings.setValue('view/codeview', value)
         self.dock_codeview.setVisible(value)
+
+        value = settings.value('view/timingview', False, type=bool)
+        settings.setValue('view/timingview', value)
+        self.dock_timingview.setVisible(value)
         # event
         self.tab_editor.statusChanged.connect(self.onEditorStatusChange)
         self.tab_editor.showMessageRequest.connect(self.showMessage)
@@ -207,8 +258,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.tab_editor.modificationChanged.connect(self.onEditorModified)
         self.tab_editor.filenameChanged.connect(self.onFileRenamed)
         self.tab_editor.fileLoaded.connect(self.onEditorFileLoaded)
+        self.tab_editor.currentChanged.connect(self.onEditorCurrentChanged)
 
         self.webview.exportHtml.connect(partial(self.onMenuExport, 'html'))
+        self.webview.htmlLoaded.connect(self.onWebViewLoaded)
 
         self.workspace.showMessageRequest.connect(self.showMessage)
         self.workspace.fileLoaded.connect(self.onWorkspaceFileLoaded)
@@ -232,6 +285,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.previewWorker = threading.Thread(target=previewWorker, args=(self,))
         logger.debug(' Preview worker start '.center(80, '-'))
         self.previewWorker.start()
+        self.tab_editor.recover()
         self.tab_editor.do_switch_editor(0)
         self.previewCurrentText(force=True)
 
@@ -321,7 +375,20 @@ class MainWindow(QtWidgets.QMainWindow):
         cmd.setCheckable(True)
         action.setChecked(value)
         cmd.setChecked(value)
-        self.previewData['mathjax'] = value
+        self.previewMathJax = value
+
+        action = QtWidgets.QAction(
+            self.tr('Incremental reStructuredText'), self, checkable=True)
+        action.triggered.connect(
+            partial(self.onMenuPreview, 'preview_rst_incremental'))
+        value = settings.value('preview/rst_incremental', False, type=bool)
+        settings.setValue('preview/rst_incremental', value)
+        cmd = g_action.register('mainwindow.preview_rst_incremental', action)
+        cmd.setText(action.text())
+        cmd.setCheckable(True)
+        action.setChecked(value)
+        cmd.setChecked(value)
+        self.previewRstIncremental = value
         # theme
         # docutils theme
         default_cssAction = QtWidgets.QAction(
@@ -499,12 +566,14 @@ class MainWindow(QtWidgets.QMainWindow):
         act = self.dock_workspace.toggleViewAction()
         act.setShortcut(QtGui.QKeySequence('F5'))
         menu.addAction(act)
+        menu.addAction(self.dock_outlineview.toggleViewAction())
         act = self.dock_webview.toggleViewAction()
         act.setShortcut(QtGui.QKeySequence('F6'))
         menu.addAction(act)
         act = self.dock_codeview.toggleViewAction()
         act.setShortcut(QtGui.QKeySequence('F7'))
         menu.addAction(act)
+        menu.addAction(self.dock_timingview.toggleViewAction())
         menu.addSeparator()
         menu.addAction(self._toolbar.toggleViewAction())
 
@@ -545,6 +614,7 @@ class MainWindow(QtWidgets.QMainWindow):
         menu.addAction(self.action('preview_oninput'))
         menu.addAction(self.action('preview_sync'))
         menu.addAction(self.action('preview_mathjax'))
+        menu.addAction(self.action('preview_rst_incremental'))
 
         menu.addSeparator()
         self.tab_editor.menuSetting(menu)
@@ -635,6 +705,14 @@ class MainWindow(QtWidgets.QMainWindow):
         self.statusLexer = QtWidgets.QLabel('Lexer', self)
         self.statusBar().addPermanentWidget(self.statusLexer)
 
+        self.statusStyling = QtWidgets.QLabel('Styling', self)
+        self.statusBar().addPermanentWidget(self.statusStyling)
+        self.statusStyling.setVisible(False)
+
+        self.statusMode = QtWidgets.QLabel('Mode', self)
+        self.statusBar().addPermanentWidget(self.statusMode)
+        self.statusMode.setVisible(False)
+
         self.showMessage(self.tr('Ready'))
 
     def showMessage(self, message):
@@ -644,8 +722,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.settings.setValue('geometry', self.saveGeometry())
         self.settings.setValue('windowState', self.saveState())
         self.settings.setValue('view/workspace', self.dock_workspace.isVisible())
+        self.settings.setValue('view/outlineview', self.dock_outlineview.isVisible())
         self.settings.setValue('view/webview', self.dock_webview.isVisible())
         self.settings.setValue('view/codeview', self.dock_codeview.isVisible())
+        self.settings.setValue('view/timingview', self.dock_timingview.isVisible())
         self.settings.setValue('vim_mode', self.action('vim_mode').isChecked())
         self.tab_editor.updateSettings()
         self.webview.updateSettings()
@@ -666,9 +746,9 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.settings.sync()
 
-        self.previewQuit = True
-        previewEvent.set()
+        self.previewScheduler.quit()
         self.previewWorker.join()
+        self.renderServer.stop()
         logger.warn(' rsteditor end '.center(80, '='))
         event.accept()
 
@@ -707,6 +787,12 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.statusCursor.setText(value.center(length, ' '))
             elif key == 'length':
                 self.statusLength.setText(value.center(length, ' '))
+            elif key == 'styling':
+                self.statusStyling.setText(self.tr('Styling %s') % value)
+                self.statusStyling.setVisible(bool(value))
+            elif key == 'mode':
+                self.statusMode.setText(self.tr('Large file') if value == 'large' else value)
+                self.statusMode.setVisible(bool(value))
 
     def onMenuNewWindow(self):
         if sys.platform == 'win32' and self._app_exec.endswith('.py'):
@@ -811,6 +897,12 @@ class MainWindow(QtWidgets.QMainWindow):
             SHCNE_ASSOCCHANGED, SHCNF_IDLIST, None, None)
 
     def onDockVisibility(self, dock, value):
+        if dock == 'timingview':
+            value and self.timingview.refresh()
+            return
+        if dock == 'outlineview':
+            value and self.outlineview.refresh()
+            return
         if value:
             if dock == 'webview':
                 self.webview.setFocus(QtCore.Qt.TabFocusReason)
@@ -829,8 +921,11 @@ class MainWindow(QtWidgets.QMainWindow):
             self.settings.setValue('preview/sync', checked)
         elif label == 'preview_mathjax':
             self.settings.setValue('preview/mathjax', checked)
-            self.previewData['mathjax'] = checked
+            self.previewMathJax = checked
             self.previewCurrentText()
+        elif label == 'preview_rst_incremental':
+            self.settings.setValue('preview/rst_incremental', checked)
+            self.previewRstIncremental = checked
 
     def onMenuRstThemeChanged(self, label, checked):
         self.rst_theme = label
@@ -984,6 +1079,10 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def onEditorFileLoaded(self, index):
         self.updateWindowTitle(index)
+        self.outlineview.setEditor(self.tab_editor.currentWidget())
+
+    def onEditorCurrentChanged(self, index):
+        self.outlineview.setEditor(self.tab_editor.widget(index))
 
     def do_scroll_preview(self):
         widget = self.tab_editor.currentWidget()
@@ -1032,24 +1131,84 @@ class MainWindow(QtWidgets.QMainWindow):
         self.move(qr.topLeft())
 
     def do_preview(self, index, force=False):
-        if previewEvent.is_set():
-            logger.debug('Preview is working..., ignore')
-        elif force or self.dock_codeview.isVisible() or self.dock_webview.isVisible():
+        if force or self.dock_codeview.isVisible() or self.dock_webview.isVisible():
             widget = self.tab_editor.widget(index)
-            self.previewData['text'] = widget.text()
-            self.previewData['path'] = widget.getFileName()
-            previewEvent.set()
+            if not widget:
+                return
+            if widget.isLargeFile():
+                logger.debug('Preview is skipped for large file: %s' % widget.getFileName())
+                return
+            if widget.isLoading():
+                # previewed when loading is finished
+                return
+            timer = StageTimer()
+            text = widget.text()
+            path = widget.getFileName()
+            cache_key = self.previewCacheKey(text, path, self.previewMathJax)
+            timer.mark('snapshot')
+            html = self.previewCache.get(cache_key)
+            if html is not None:
+                logger.debug('Preview cache hit: %s' % path)
+                job = self.previewScheduler.complete(
+                    id(widget), text, path, self.previewMathJax, html, timer)
+                timer.mark('cache')
+                self.onUpdatePreviewView(job)
+                return
+            # the newest snapshot always replaces a queued one
+            self.previewScheduler.submit(
+                id(widget), text, path, self.previewMathJax, cache_key, timer)
+
+    def previewCacheKey(self, text, path, mathjax):
+        ext = os.path.splitext(path)[1].lower()
+        if ext in ['.rst', '.rest']:
+            theme = self.rst_theme
+        elif ext in ['.md', '.markdown']:
+            theme = self.md_theme
+        else:
+            theme = ''
+        pygments = self.settings.value('pygments', 'null', type=str)
+        # path: base url of preview and title of code html
+        return self.previewCache.makeKey(text, path, theme, mathjax, pygments)
 
     def previewCurrentText(self, force=False):
         self.do_preview(self.tab_editor.currentIndex(), force=force)
 
-    def onUpdatePreviewView(self):
+    def onUpdatePreviewView(self, job):
+        job.timer.mark('handoff')
+        if not self.previewScheduler.isCurrent(job):
+            logger.debug('Preview generation %s is out of date, ignore' % job.generation)
+            return
+        self.previewHtml = job.html
+        self.previewPath = job.path
+        self.previewTimedJob = None
         if self.dock_webview.isVisible():
-            self.webview.setHtml(self.previewHtml, self.previewData.get('path'))
+            self.previewTimedJob = job
+            self.webview.updateHtml(self.previewHtml, self.previewPath)
         if self.dock_codeview.isVisible():
             self.codeview.setValue(self.previewHtml)
-            self.codeview.setFileName(self.previewData.get('path') + '.html')
+            self.codeview.setFileName(self.previewPath + '.html')
+            job.timer.mark('codeview')
         self.do_scroll_preview()
+        if not self.previewTimedJob:
+            self.finishPreviewTimings(job)
+
+    def onWebViewLoaded(self, seconds):
+        job = self.previewTimedJob
+        if not job:
+            return
+        self.previewTimedJob = None
+        job.timer.add('load', seconds)
+        self.finishPreviewTimings(job)
+
+    def finishPreviewTimings(self, job):
+        stages = job.timer.stages
+        stages['total'] = job.timer.total()
+        self.previewStats.add(stages)
+        logger.info(
+            'Preview timings %s: %s' % (job.path, job.timer),
+            extra={'preview_timings': dict(stages)})
+        if self.dock_timingview.isVisible():
+            self.timingview.refresh()
 
     def updateWindowTitle(self, index):
         title = __app_name__ + ' - ' + self.tab_editor.title(index, full=True)
@@ -1057,6 +1216,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
 def main():
+    # for render process in frozen application
+    multiprocessing.freeze_support()
     globalvars.init()
     parser = argparse.ArgumentParser()
     parser.add_argument('--version', action='version',
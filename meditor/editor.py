@@ -1,17 +1,24 @@
 
+import io
 import sys
 import time
+import codecs
 import os.path
 import logging
 import locale
+from collections import OrderedDict
 from functools import partial
 
 from PyQt5 import QtGui, QtCore, QtWidgets
 from PyQt5.Qsci import QSCINTILLA_VERSION, QsciScintilla, QsciPrinter
-import chardet
+from chardet.universaldetector import UniversalDetector
 from mtable import MarkupTable
 
 from .scilib import EXTENSION_LEXER
+from .outline import OutlineIndex, outline_kind, line_end_regex
+from .loader import FileLoader
+from .saver import SaveJob, submit_save, write_file
+from .journal import Journal, read_journal, new_journal_key
 
 from .gaction import GlobalAction
 from .util import toUtf8
@@ -38,6 +45,85 @@ EOL_DESCRIPTION = {
     'mac': QsciScintilla.EolMac,
 }
 
+# bytes of file head to detect long lines and encoding of large file
+LARGE_FILE_SAMPLE = 1024 * 1024
+# most bytes fed to detector
+ENCODING_SAMPLE = 1024 * 1024
+ENCODING_CHUNK = 64 * 1024
+ENCODING_CACHE_SIZE = 256
+
+BOMS = [
+    (codecs.BOM_UTF8, 'UTF-8-SIG'),
+    (codecs.BOM_UTF32_LE, 'UTF-32'),
+    (codecs.BOM_UTF32_BE, 'UTF-32'),
+    (codecs.BOM_UTF16_LE, 'UTF-16'),
+    (codecs.BOM_UTF16_BE, 'UTF-16'),
+]
+
+# (path, size, mtime) => encoding
+encoding_cache = OrderedDict()
+
+
+def read_chunks(f, size):
+    """ yield chunks of binary file from head, size: -1 is all """
+    f.seek(0)
+    while size != 0:
+        chunk = f.read(ENCODING_CHUNK if size < 0 else min(size, ENCODING_CHUNK))
+        if not chunk:
+            break
+        if size > 0:
+            size -= len(chunk)
+        yield chunk
+
+
+def detect_encoding(f, size=ENCODING_SAMPLE):
+    """
+    detect encoding from head of binary file
+    BOM and UTF-8 are validated without chardet.
+    return: encoding name of chardet or None
+    """
+    f.seek(0)
+    head = f.read(4)
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    ascii = True
+    try:
+        for chunk in read_chunks(f, size):
+            decoder.decode(chunk)
+            ascii = ascii and chunk.isascii()
+        if f.read(1) == b'':
+            # a character is cut at budget only
+            decoder.decode(b'', final=True)
+        return 'ASCII' if ascii else 'UTF-8'
+    except UnicodeDecodeError:
+        pass
+    detector = UniversalDetector()
+    for chunk in read_chunks(f, size):
+        detector.feed(chunk)
+        if detector.done:
+            break
+    detector.close()
+    return detector.result.get('encoding')
+
+
+def file_stat(filename):
+    stat = os.stat(filename)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def file_key(filename):
+    return (os.path.abspath(filename),) + file_stat(filename)
+
+
+def cache_encoding(filename, encoding):
+    key = file_key(filename)
+    encoding_cache[key] = encoding
+    encoding_cache.move_to_end(key)
+    while len(encoding_cache) > ENCODING_CACHE_SIZE:
+        encoding_cache.popitem(last=False)
+
 
 class Editor(QsciScintilla):
     """
@@ -51,6 +137,12 @@ class Editor(QsciScintilla):
     loadRequest = QtCore.pyqtSignal('QString')
     closeRequest = QtCore.pyqtSignal()
     closeAppRequest = QtCore.pyqtSignal()
+    outlineChanged = QtCore.pyqtSignal()
+    chunkLoaded = QtCore.pyqtSignal(object, bytes, bool)
+    loadProgress = QtCore.pyqtSignal(int)
+    loadFinished = QtCore.pyqtSignal(bool)
+    saveDone = QtCore.pyqtSignal(object)
+    saveFinished = QtCore.pyqtSignal('QString', bool)
 
     _settings = None
     _find_dialog = None
@@ -64,6 +156,31 @@ class Editor(QsciScintilla):
     _lexerStart = 0
     _lexerEnd = 0
     _file_encoding = 'utf8'
+    _rst_tokenizer = 'regex'
+    _rst_async_styling = False
+    _rst_viewport_styling = True
+    _styling_progress = 100
+    # large file mode: no lexer, no wrap and no preview
+    _large_file = False
+    # wrap mode before large file mode
+    _wrap_mode = QsciScintilla.WrapCharacter
+    _large_file_size = 16
+    _large_file_line_length = 10000
+    _outline = None
+    # file larger than size in MB is loaded in background
+    _background_load_size = 4
+    _loader = None
+    # increased by every modification of text
+    _revision = 0
+    _save_job = None
+    _save_pending = None
+    _save_fsync = False
+    # crash recovery journal of edits
+    _enable_journal = True
+    _journal = None
+    _journal_key = None
+    # size and mtime of file after it was read or written by editor
+    _file_stat = None
     _modified = False
     _min_margin_width = 3
     _font = None
@@ -113,9 +230,51 @@ class Editor(QsciScintilla):
 
         self.setWrapVisualFlags(QsciScintilla.WrapFlagByBorder)
 
+        # large file threshold: file size in MB or length of line
+        value = self._settings.value('editor/large_file_size', self._large_file_size, type=int)
+        self._settings.setValue('editor/large_file_size', value)
+        self._large_file_size = value
+        value = self._settings.value(
+            'editor/large_file_line_length', self._large_file_line_length, type=int)
+        self._settings.setValue('editor/large_file_line_length', value)
+        self._large_file_line_length = value
+        value = self._settings.value(
+            'editor/background_load_size', self._background_load_size, type=int)
+        self._settings.setValue('editor/background_load_size', value)
+        self._background_load_size = value
+        # flush file to disk before it replaces old one
+        value = self._settings.value('editor/save_fsync', self._save_fsync, type=bool)
+        self._settings.setValue('editor/save_fsync', value)
+        self._save_fsync = value
+        value = self._settings.value('editor/journal', self._enable_journal, type=bool)
+        self._settings.setValue('editor/journal', value)
+        self._enable_journal = value
+        # every editor has its own journal, even of the same file name
+        self._journal_key = new_journal_key()
+
         self.cursorPositionChanged.connect(self.onCursorPositionChanged)
         self.linesChanged.connect(self.onLinesChanged)
         self.textChanged.connect(self.onTextChanged)
+        self.chunkLoaded.connect(self.onChunkLoaded)
+        self.saveDone.connect(self.onSaveDone)
+
+        self._outline = OutlineIndex()
+        self.SCN_MODIFIED.connect(self.onModified)
+
+        # reStructuredText tokenizer: regex or line
+        value = self._settings.value('editor/rst_tokenizer', self._rst_tokenizer, type=str)
+        self._settings.setValue('editor/rst_tokenizer', value)
+        self._rst_tokenizer = value
+        # tokenize large reStructuredText in worker thread
+        value = self._settings.value('editor/rst_async_styling', self._rst_async_styling, type=bool)
+        self._settings.setValue('editor/rst_async_styling', value)
+        self._rst_async_styling = value
+        # style lines on screen first, others are styled in idle time
+        value = self._settings.value('editor/rst_viewport_styling', self._rst_viewport_styling, type=bool)
+        self._settings.setValue('editor/rst_viewport_styling', value)
+        self._rst_viewport_styling = value
+        if value:
+            self.SendScintilla(QsciScintilla.SCI_SETIDLESTYLING, QsciScintilla.SC_IDLESTYLING_AFTERVISIBLE)
 
         # Font Quality
         value = self._settings.value('editor/font_quality', 'cleartype', type=str)
@@ -143,6 +302,9 @@ class Editor(QsciScintilla):
         return ext in EXTENSION_LEXER
 
     def closeEvent(self, event):
+        self.cancelLoading()
+        self.waitSaving()
+        self.stopJournal()
         g_action = GlobalAction()
         g_action.unregister_by_widget(self)
 
@@ -410,6 +572,12 @@ class Editor(QsciScintilla):
     def getStyleAt(self, pos):
         return self.SendScintilla(QsciScintilla.SCI_GETSTYLEAT, pos)
 
+    def getLineState(self, line):
+        return self.SendScintilla(QsciScintilla.SCI_GETLINESTATE, line)
+
+    def setLineState(self, line, state):
+        self.SendScintilla(QsciScintilla.SCI_SETLINESTATE, line, state)
+
     def getCurrentPosition(self):
         return self.SendScintilla(QsciScintilla.SCI_GETCURRENTPOS)
 
@@ -417,17 +585,26 @@ class Editor(QsciScintilla):
         # always return 1 ??!!
         return self.SendScintilla(QsciScintilla.SCI_GETLINEVISIBLE, line) > 0
 
+    def getLines(self, first, last):
+        """ text of lines without line end """
+        start = self.SendScintilla(QsciScintilla.SCI_POSITIONFROMLINE, first)
+        end = self.SendScintilla(QsciScintilla.SCI_GETLINEENDPOSITION, last)
+        return line_end_regex.split(self.text(start, end))
+
+    def getOutline(self):
+        return self._outline
+
     def getSyncScrollText(self):
-        # TODO: need to test more!!!
+        """ title of section at cursor or top line, or text of the line """
         line, index = self.getCursorPosition()
-        text = ''
-        top_line = self.firstVisibleLine()
-        if line >= top_line:
-            text = self.text(line)
-        else:
+        top_line = self.SendScintilla(
+            QsciScintilla.SCI_DOCLINEFROMVISIBLE, self.firstVisibleLine())
+        if line < top_line:
             line = top_line
-            text = self.text(line)
-        return text
+        section = self._outline.sectionAt(line)
+        if section >= 0:
+            return self._outline.heading(section)[2]
+        return self.text(line)
 
     def getPrinter(self, resolution):
         return QsciPrinter(resolution)
@@ -493,7 +670,7 @@ class Editor(QsciScintilla):
         self.do_set_margin_width()
 
     def onTextChanged(self):
-        if not self._preedit_show:
+        if not self._preedit_show and not self._large_file and not self._loader:
             text_length = len(self.text())
             if abs(text_length - self._text_length) > 5:
                 self.inputPreviewRequest.emit()
@@ -501,6 +678,44 @@ class Editor(QsciScintilla):
         value = self.toFriendlyValue(self.length())
         self.statusChanged.emit('length:%s' % value)
 
+    def onModified(self, position, mtype, text, length, lines_added, *args):
+        if not mtype & (QsciScintilla.SC_MOD_INSERTTEXT | QsciScintilla.SC_MOD_DELETETEXT):
+            return
+        self._revision += 1
+        if self._journal:
+            try:
+                if mtype & QsciScintilla.SC_MOD_INSERTTEXT:
+                    data = bytes(self.bytes(position, position + length))[:length]
+                    self._journal.insert(position, data)
+                else:
+                    self._journal.delete(position, length)
+            except (OSError, ValueError) as err:
+                logger.error('Journal error: %s' % err)
+                self._journal = None
+        if not self._outline.kind:
+            return
+        first = self.SendScintilla(QsciScintilla.SCI_LINEFROMPOSITION, position)
+        if mtype & QsciScintilla.SC_MOD_INSERTTEXT:
+            old_last, new_last = first, first + lines_added
+        else:
+            old_last, new_last = first - lines_added, first
+        revision = self._outline.revision
+        self._outline.update(first, old_last, new_last, self.getLines, self.lines())
+        if revision != self._outline.revision:
+            self.outlineChanged.emit()
+
+    def setOutlineKind(self, filename):
+        """ scan all of headings if kind of outline is changed """
+        kind = None if self._large_file else outline_kind(filename)
+        if kind == self._outline.kind:
+            return
+        self._outline.reset(kind, self.getLines(0, self.lines() - 1) if kind else [])
+        self.outlineChanged.emit()
+
+    def onStylingProgress(self, percent):
+        self._styling_progress = percent
+        self.statusChanged.emit('styling:%s' % ('' if percent >= 100 else '%s%%' % percent))
+
     def isPasteAvailable(self):
         """ always return 1 in GTK+ """
         result = self.SendScintilla(QsciScintilla.SCI_CANPASTE)
@@ -526,6 +741,7 @@ class Editor(QsciScintilla):
         """
         self._filename = path
         self.setLexerByFilename(self._filename)
+        self.setOutlineKind(self._filename)
 
     def enableLexer(self, enable=True):
         self._enable_lexer = enable
@@ -548,7 +764,18 @@ class Editor(QsciScintilla):
         set utf8 text
         modified state is false
         """
-        self.setText(text)
+        if self._large_file:
+            # no undo history and no conversion by QString
+            read_only = self.isReadOnly()
+            self.setReadOnly(False)
+            self.SendScintilla(QsciScintilla.SCI_SETUNDOCOLLECTION, False)
+            self.SendScintilla(
+                QsciScintilla.SCI_SETTEXT, 0, text.encode('utf8', errors='surrogateescape'))
+            self.SendScintilla(QsciScintilla.SCI_SETUNDOCOLLECTION, True)
+            self.SendScintilla(QsciScintilla.SCI_EMPTYUNDOBUFFER)
+            self.setReadOnly(read_only)
+        else:
+            self.setText(text)
         self.setModified(False)
         self.setEolMode(self._qsciEolModeFromLine(self.text(0)))
         self.do_set_margin_width()
@@ -627,40 +854,171 @@ class Editor(QsciScintilla):
     def encoding(self):
         return self._file_encoding
 
-    def detect_file_encoding(self, filename=None):
+    def detect_file_encoding(self, filename=None, size=ENCODING_SAMPLE, data=None):
+        """
+        size: bytes of file head to detect, -1 is all
+        data: content of file if it has been read
+        """
         ansi_encoding = locale.getpreferredencoding()
 
         if filename and os.path.exists(filename):
-            encoding = ''
-            with open(filename, 'rb') as f:
-                encoding = chardet.detect(f.read()).get('encoding')
-                if not encoding:
-                    return 'Unknown'
+            key = file_key(filename)
+            if key in encoding_cache:
+                encoding_cache.move_to_end(key)
+                return encoding_cache[key]
+            if data is None:
+                with open(filename, 'rb') as f:
+                    encoding = detect_encoding(f, size)
+            else:
+                encoding = detect_encoding(io.BytesIO(data), size)
+            if not encoding:
+                return 'Unknown'
 
             encoding = encoding.upper()
             if encoding in ['ASCII', 'GB2312']:
                 encoding = ansi_encoding
+            cache_encoding(filename, encoding)
         else:
             encoding = ansi_encoding
         return encoding
 
-    def _open(self, filename, encoding=None):
+    def isLargeFile(self):
+        return self._large_file
+
+    def checkLargeFile(self, filename):
+        """ file size or line length exceeds threshold """
+        if os.path.getsize(filename) >= self._large_file_size * 1024 * 1024:
+            return True
+        with open(filename, 'rb') as f:
+            data = f.read(LARGE_FILE_SAMPLE)
+        return any(len(line) >= self._large_file_line_length for line in data.splitlines())
+
+    def setLargeFileMode(self, enable):
+        """ disable lexer, wrap, caret line and preview """
+        if enable == self._large_file:
+            return
+        self._large_file = enable
+        if enable:
+            self._wrap_mode = self.wrapMode()
+            self.setWrapMode(QsciScintilla.WrapNone)
+            self.setCaretLineVisible(False)
+        else:
+            self.setWrapMode(self._wrap_mode)
+            self.setCaretLineVisible(
+                self._settings.value('editor/caretline_visible', True, type=bool))
+        self.statusChanged.emit('mode:%s' % ('large' if enable else ''))
+
+    def isLoading(self):
+        return self._loader is not None
+
+    def _load(self, filename, encoding=None):
+        """ load file in background, return at once """
+        self.cancelLoading()
+        self.stopJournal()
         try:
+            large_file = self.checkLargeFile(filename)
+            if large_file:
+                logger.info('Large file mode: %s' % filename)
+            self.setLargeFileMode(large_file)
             if encoding is None:
                 encoding = self.detect_file_encoding(filename)
+            size = os.path.getsize(filename)
+        except Exception as err:
+            QtWidgets.QMessageBox.information(
+                self,
+                self.tr('Read file'),
+                self.tr('Do not open "%s": %s') % (filename, err),
+            )
+            return False
+        self._file_encoding = 'ascii' if encoding == 'Unknown' else encoding
+        # no undo history, read only until loading completes
+        self.setReadOnly(False)
+        self.SendScintilla(QsciScintilla.SCI_SETUNDOCOLLECTION, False)
+        self.SendScintilla(QsciScintilla.SCI_CLEARALL)
+        self.setReadOnly(True)
+        self.setFileName(filename)
+        # raw bytes are kept in large file only, as "setValue"
+        self._loader = FileLoader(
+            self, filename, encoding, size, 'surrogateescape' if large_file else 'replace')
+        # appending to wrapped lines and idle styling block GUI thread
+        self._loader.wrap_mode = self.wrapMode()
+        self.setWrapMode(QsciScintilla.WrapNone)
+        self.SendScintilla(QsciScintilla.SCI_SETIDLESTYLING, QsciScintilla.SC_IDLESTYLING_NONE)
+        self._loader.start()
+        return True
+
+    def onChunkLoaded(self, loader, data, finished):
+        if loader is not self._loader:
+            return
+        if data:
+            first = self.length() == 0
+            self.setReadOnly(False)
+            self.SendScintilla(QsciScintilla.SCI_APPENDTEXT, len(data), data)
+            self.setReadOnly(True)
+            self.SendScintilla(QsciScintilla.SCI_SETSAVEPOINT)
+            if first:
+                self.setEolMode(self._qsciEolModeFromLine(self.text(0)))
+        loader.done()
+        if finished:
+            self.finishLoading(loader.error is None)
+        else:
+            self.loadProgress.emit(loader.percent())
+
+    def cancelLoading(self):
+        """ loaded text is kept read only """
+        if self._loader:
+            self._loader.cancel()
+            self.finishLoading(False)
+
+    def finishLoading(self, completed):
+        loader = self._loader
+        self._loader = None
+        self.setWrapMode(loader.wrap_mode)
+        if self._rst_viewport_styling:
+            self.SendScintilla(
+                QsciScintilla.SCI_SETIDLESTYLING, QsciScintilla.SC_IDLESTYLING_AFTERVISIBLE)
+        self.SendScintilla(QsciScintilla.SCI_SETUNDOCOLLECTION, True)
+        self.SendScintilla(QsciScintilla.SCI_EMPTYUNDOBUFFER)
+        self.setModified(False)
+        self.do_set_margin_width()
+        if completed:
+            self.setReadOnly(loader.encoding == 'Unknown' and self.length() > 0)
+            self.updateFileStat()
+            loader.error or self.startJournal()
+        if loader.error:
+            QtWidgets.QMessageBox.information(
+                self,
+                self.tr('Read file'),
+                self.tr('Do not open "%s": %s') % (loader.filename, loader.error),
+            )
+        self.loadFinished.emit(completed)
+
+    def _open(self, filename, encoding=None):
+        self.cancelLoading()
+        self.stopJournal()
+        try:
+            large_file = self.checkLargeFile(filename)
+            if large_file:
+                logger.info('Large file mode: %s' % filename)
+            self.setLargeFileMode(large_file)
+            # read file once for detecting and decoding
+            with open(filename, 'rb') as f:
+                data = f.read()
+            if encoding is None:
+                encoding = self.detect_file_encoding(filename, data=data)
             if encoding != 'Unknown':
-                with open(filename, 'rt', encoding=encoding, errors='surrogateescape', newline='') as f:
-                    text = f.read()
+                text = data.decode(encoding, errors='surrogateescape')
             else:
                 encoding = 'ascii'
-                with open(filename, 'rb') as f:
-                    data = f.read()
-                    text = data.decode(encoding, errors='surrogateescape').replace('\0', 'x')
+                text = data.decode(encoding, errors='surrogateescape').replace('\0', 'x')
                 if len(text) > 0:
                     self.setReadOnly(True)
+            del data
             self._file_encoding = encoding
             self.setFileName(filename)
             self.setValue(text)
+            self.updateFileStat()
+            self.startJournal()
             return True
         except Exception as err:
             QtWidgets.QMessageBox.information(
@@ -678,15 +1036,12 @@ class Editor(QsciScintilla):
                 self.tr('The file "%s" is read only!') % (filename),
             )
             return False
-        err_bak = filename + '.bak~'
         try:
-            text = self.getValue()
-            with open(err_bak, 'wt', encoding=self.encoding(), newline='') as f:
-                f.write(text)
-            if os.path.exists(filename):
-                os.remove(filename)
-            os.rename(err_bak, filename)
+            write_file(filename, self.getValue(), self.encoding(), self._save_fsync)
+            cache_encoding(filename, self.encoding())
+            self.updateFileStat()
             self.setModified(False)
+            self.startJournal()
             return True
         except Exception as err:
             QtWidgets.QMessageBox.information(
@@ -696,6 +1051,107 @@ class Editor(QsciScintilla):
             )
         return False
 
+    def saveFile(self, filename):
+        """ save in background, "saveFinished" is emitted when it is done """
+        if self.isReadOnly():
+            QtWidgets.QMessageBox.information(
+                self,
+                self.tr('Save file'),
+                self.tr('The file "%s" is read only!') % (filename),
+            )
+            return False
+        if self._save_job:
+            # save latest text after current one
+            self._save_pending = filename
+            return True
+        self._save_job = SaveJob(
+            self, filename, self.getValue(), self.encoding(), self._revision, self._save_fsync)
+        submit_save(self._save_job)
+        return True
+
+    def onSaveDone(self, job):
+        if job is not self._save_job:
+            return
+        self._save_job = None
+        if job.error:
+            QtWidgets.QMessageBox.information(
+                self,
+                self.tr('Write file'),
+                self.tr('Do not write "%s": %s') % (job.filename, job.error),
+            )
+        else:
+            cache_encoding(job.filename, job.encoding)
+            if job.filename == self._filename:
+                self.updateFileStat()
+            # text is not modified during saving
+            if job.revision == self._revision:
+                self.setModified(False)
+                self.startJournal()
+            else:
+                # compact journal to current text
+                self.startJournal(self.getValue())
+                self._journal and self._journal.start()
+        self.saveFinished.emit(job.filename, job.error is None)
+        if self._save_pending:
+            filename, self._save_pending = self._save_pending, None
+            self.saveFile(filename)
+
+    def startJournal(self, base_text=None):
+        """ journal edits from now, base of document is file or base_text """
+        self.stopJournal()
+        if not self._enable_journal or not self._filename:
+            return
+        try:
+            self._journal = Journal(
+                self._filename, self.encoding(), base_text, self._journal_key)
+        except OSError as err:
+            logger.error('Journal error: %s' % err)
+
+    def stopJournal(self):
+        """ edits are not journaled and journal is removed """
+        if self._journal:
+            self._journal.remove()
+            self._journal = None
+
+    def replayJournal(self, edits):
+        for edit in edits:
+            if edit[0] == 'i':
+                position, data = edit[1], edit[2].encode('utf8', errors='surrogateescape')
+                if position > self.length():
+                    raise ValueError('insert out of text: %s' % position)
+                # text may contain NUL
+                self.SendScintilla(QsciScintilla.SCI_SETTARGETRANGE, position, position)
+                self.SendScintilla(QsciScintilla.SCI_REPLACETARGET, len(data), data)
+            elif edit[0] == 'd':
+                position, length = edit[1], edit[2]
+                if position + length > self.length():
+                    raise ValueError('delete out of text: %s' % position)
+                self.SendScintilla(QsciScintilla.SCI_DELETERANGE, position, length)
+
+    def updateFileStat(self):
+        """ remember file on disk to find changes by other programs """
+        try:
+            self._file_stat = file_stat(self._filename)
+        except (OSError, TypeError):
+            self._file_stat = None
+
+    def isChangedOnDisk(self):
+        try:
+            stat = file_stat(self._filename)
+        except (OSError, TypeError):
+            stat = None
+        return stat != self._file_stat
+
+    def isSaving(self):
+        return self._save_job is not None
+
+    def waitSaving(self):
+        """ finish saving before editor is closed """
+        while self._save_job:
+            job = self._save_job
+            job.wait()
+            self.onSaveDone(job)
+
     def newFile(self, filepath):
         """filepath:
         1. /dir/filename.ext
@@ -722,8 +1178,12 @@ class Editor(QsciScintilla):
                     text = f.read()
                 break
         self._file_encoding = encoding
+        self.cancelLoading()
+        self.stopJournal()
+        self.setLargeFileMode(False)
         self.setFileName(filepath)
         self.setValue(text)
+        self.startJournal(text)
 
     def status(self):
         if not self.getFileName():
@@ -732,18 +1192,24 @@ class Editor(QsciScintilla):
         line, index = self.getCursorPosition()
         cursor = 'Ln %s/%s Col %s/80' % (line + 1, lines, index + 1)
         length = self.toFriendlyValue(self.length())
-        self._text_length = len(self.text())
+        if not self._large_file:
+            self._text_length = len(self.text())
         status = [
             'encoding:%s' % self.encoding().upper(),
             'eol:%s' % EOL_DESCRIPTION[self.eolMode()],
             'lexer:%s' % (self.lexer().language() if self.lexer() else '--'),
             'cursor:%s' % cursor,
             'length:%s' % length,
+            'styling:%s' % ('' if self._styling_progress >= 100 else '%s%%' % self._styling_progress),
+            'mode:%s' % ('large' if self._large_file else ''),
         ]
         return ';'.join(status)
 
     def emptyFile(self):
+        self.cancelLoading()
+        self.stopJournal()
         self.clear()
+        self.setLargeFileMode(False)
         self.setFileName(None)
         self.setModified(False)
 
@@ -843,14 +1309,33 @@ class Editor(QsciScintilla):
     def setLexerByFilename(self, filename):
         lexer = None
         t1 = time.process_time()
-        if self._enable_lexer and filename:
+        old_lexer = self.lexer()
+        if old_lexer:
+            if hasattr(old_lexer, 'detach'):
+                old_lexer.detach()
+            if hasattr(old_lexer, 'setViewportStyling'):
+                try:
+                    old_lexer.stylingProgress.disconnect(self.onStylingProgress)
+                except TypeError as err:
+                    logger.debug(err)
+        if self._enable_lexer and filename and not self._large_file:
             _, ext = os.path.splitext(filename)
             ext = ext.lower()
             LexerClass = EXTENSION_LEXER.get(ext)
             if LexerClass:
                 lexer = LexerClass(self)
+                if hasattr(lexer, 'setTokenizer'):
+                    lexer.setTokenizer(self._rst_tokenizer)
+                if hasattr(lexer, 'setAsyncStyling'):
+                    lexer.setAsyncStyling(self._rst_async_styling)
+                if hasattr(lexer, 'setViewportStyling'):
+                    lexer.setViewportStyling(self._rst_viewport_styling)
+                    lexer.stylingProgress.connect(self.onStylingProgress)
 
         self.setLexer(lexer)
+        if old_lexer:
+            old_lexer.deleteLater()
+        self._styling_progress = 100
         if lexer:
             self.setLexerFont(self._font)
             self.statusChanged.emit('lexer:%s' % lexer.language())
@@ -933,9 +1418,14 @@ class Editor(QsciScintilla):
             self.zoomOut()
         elif action == 'wrap_line':
             if value:
-                self.setWrapMode(QsciScintilla.WrapCharacter)
+                self._wrap_mode = QsciScintilla.WrapCharacter
+            else:
+                self._wrap_mode = QsciScintilla.WrapNone
+            if self._loader:
+                # applied after loading
+                self._loader.wrap_mode = self._wrap_mode
             else:
-                self.setWrapMode(QsciScintilla.WrapNone)
+                self.setWrapMode(self._wrap_mode)
         elif action == 'show_ws_eol':
             self.setWhitespaceVisibility(value)
             self.setEolVisibility(value)
@@ -1039,8 +1529,81 @@ class Editor(QsciScintilla):
         self.statusChanged.emit('eol:%s' % EOL_DESCRIPTION[self.eolMode()])
 
     def do_open(self, filename, encoding=None):
+        if os.path.isfile(filename) and \
+                os.path.getsize(filename) >= self._background_load_size * 1024 * 1024:
+            return self._load(filename, encoding)
         return self._open(filename, encoding)
 
+    def do_recover(self, path):
+        """ open document of journal and replay edits """
+        try:
+            header, edits = read_journal(path)
+        except (OSError, ValueError) as err:
+            logger.error('Read journal error: %s' % err)
+            return False
+        if not header:
+            os.remove(path)
+            return False
+        filename = header['file']
+        if 'text' in header:
+            self._file_encoding = header['encoding']
+            self.setLargeFileMode(False)
+            self.setFileName(filename)
+            self.setValue(header['text'])
+            self.startJournal(header['text'])
+        else:
+            try:
+                stat = os.stat(filename)
+                changed = (stat.st_size, stat.st_mtime_ns) != (header['size'], header['mtime'])
+            except OSError:
+                changed = True
+            if changed:
+                QtWidgets.QMessageBox.information(
+                    self,
+                    self.tr('Recover file'),
+                    self.tr('"%s" has been changed after crash, '
+                            'unsaved edits are kept in "%s"') % (filename, path + '.bak'),
+                )
+                os.replace(path, path + '.bak')
+                return False
+            if not self._open(filename, header['encoding']):
+                return False
+        try:
+            self.replayJournal(edits)
+        except (ValueError, IndexError, TypeError) as err:
+            logger.error('Replay journal error: %s' % err)
+        os.remove(path)
+        return True
+
+    def do_reload(self):
+        """
+        reload file changed by other program, ask before modified text is
+        discarded. Encoding of document is kept and not detected again.
+        """
+        filename = self._filename
+        if self.isModified():
+            ret = QtWidgets.QMessageBox.question(
+                self,
+                self.tr('Reload file'),
+                self.tr('"%s" has been changed by other program.\n'
+                        'Do you want to reload it and discard your changes?') % filename,
+                QtWidgets.QMessageBox.Yes,
+                QtWidgets.QMessageBox.No)
+            if ret != QtWidgets.QMessageBox.Yes:
+                # ask again after next change
+                self.updateFileStat()
+                return False
+        line, index = self.getCursorPosition()
+        first_line = self.firstVisibleLine()
+        # binary file is detected again for replacing NUL
+        encoding = None if self.isReadOnly() else self.encoding()
+        if not self.do_open(filename, encoding):
+            return False
+        if not self.isLoading():
+            self.setCursorPosition(min(line, self.lines() - 1), index)
+            self.setFirstVisibleLine(first_line)
+        return True
+
     def do_save(self):
         fname = self.getFileName()
         dir_name = os.path.dirname(fname)
@@ -1049,7 +1612,7 @@ class Editor(QsciScintilla):
         if not dir_name and basename == __default_basename__:
             return self.do_save_as()
         else:
-            self._save(fname)
+            self.saveFile(fname)
             return fname, None
 
     def do_save_as(self, new_fname=None):
@@ -1075,7 +1638,7 @@ class Editor(QsciScintilla):
             new_fname = new_fname + ext
 
         self.setFileName(new_fname)
-        self._save(new_fname)
+        self.saveFile(new_fname)
 
         return old_fname, new_fname
 
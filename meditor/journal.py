@@ -0,0 +1,161 @@
+"""
+crash recovery journal of unsaved documents
+
+Every modified document has an append-only journal in home data path. The
+first record is the base of document: size and mtime of file on disk, or the
+whole text if it is not a saved file. The following records are edits in
+bytes of Scintilla document:
+
+    ["i", position, text]
+    ["d", position, length]
+
+A journal is written when the document is modified first time, removed when
+the document is saved or closed, so only journals of crashed process are
+left. They are replayed at next start. Journal name has the key of editor, so
+editors of the same file or of new documents with the same name have their
+own journals.
+"""
+import os
+import sys
+import json
+import uuid
+import hashlib
+import logging
+
+from . import __home_data_path__
+
+logger = logging.getLogger(__name__)
+
+journal_dir = os.path.join(__home_data_path__, 'journal')
+
+
+def new_journal_key():
+    """ key of an editor """
+    return uuid.uuid4().hex[:16]
+
+
+def journal_path(filename, key):
+    """ journal of document of an editor in this process """
+    digest = hashlib.sha1(os.path.abspath(filename).encode('utf8', errors='surrogateescape'))
+    return os.path.join(
+        journal_dir, '%s-%s-%s.journal' % (digest.hexdigest()[:16], key, os.getpid()))
+
+
+def pid_alive(pid):
+    if pid == os.getpid():
+        return True
+    if sys.platform == 'win32':
+        import ctypes
+        # PROCESS_QUERY_LIMITED_INFORMATION
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if handle:
+            ctypes.windll.kernel32.CloseHandle(handle)
+            return True
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_journal(path):
+    """
+    return: (header, [edit, ...])
+    a broken record at end is skipped, which is being written at crash
+    """
+    header = None
+    edits = []
+    with open(path, 'rt', encoding='utf8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warn('Broken journal record: %s' % path)
+                break
+            if header is None:
+                header = record
+            else:
+                edits.append(record)
+    return header, edits
+
+
+def orphan_journals():
+    """ return: paths of journals which process has exited """
+    journals = []
+    if not os.path.isdir(journal_dir):
+        return journals
+    for name in sorted(os.listdir(journal_dir)):
+        root, ext = os.path.splitext(name)
+        if ext != '.journal':
+            continue
+        try:
+            pid = int(root.rsplit('-', 1)[1])
+        except (IndexError, ValueError):
+            continue
+        if not pid_alive(pid):
+            journals.append(os.path.join(journal_dir, name))
+    return journals
+
+
+class Journal(object):
+    """ journal of one document """
+    def __init__(self, filename, encoding, base_text=None, key=None):
+        """
+        base_text: text of document if it is different from file
+        key: key of editor
+        """
+        # name of new document is not absolute
+        self.filename = filename
+        self.encoding = encoding
+        self.key = key or new_journal_key()
+        self.path = journal_path(filename, self.key)
+        self._base_text = base_text
+        self._base_stat = None
+        if base_text is None:
+            stat = os.stat(filename)
+            self._base_stat = (stat.st_size, stat.st_mtime_ns)
+        self._file = None
+
+    def start(self):
+        """ write base of document """
+        if self._file:
+            return
+        os.makedirs(journal_dir, exist_ok=True)
+        self._file = open(self.path, 'wt', encoding='utf8')
+        header = {
+            'file': self.filename,
+            'encoding': self.encoding,
+            'key': self.key,
+        }
+        if self._base_stat:
+            header['size'], header['mtime'] = self._base_stat
+        else:
+            header['text'] = self._base_text
+            self._base_text = None
+        self._write(header)
+
+    def _write(self, record):
+        # flush to OS, which is kept if process crashes
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def insert(self, position, data):
+        """ data: inserted bytes """
+        self.start()
+        self._write(['i', position, data.decode('utf8', errors='surrogateescape')])
+
+    def delete(self, position, length):
+        self.start()
+        self._write(['d', position, length])
+
+    def remove(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(self.path)
+            except OSError as err:
+                logger.error('Remove journal error: %s' % err)
@@ -0,0 +1,91 @@
+"""
+load file into editor in background
+
+Worker thread reads and decodes file in chunks and sends them as UTF-8 to GUI
+thread by the signal of editor, where they are appended to document, so the
+first screen is shown before loading completes. Only a few chunks wait for GUI
+thread at a time, so memory is about the size of document.
+"""
+import codecs
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# bytes of file read at a time
+LOAD_CHUNK = 1024 * 1024
+# most chunks waiting for GUI thread
+LOAD_QUEUE = 4
+
+
+class FileLoader(object):
+    """
+    read file in worker thread
+
+    Every chunk is emitted by "editor.chunkLoaded" and GUI thread calls
+    "done" after it has been appended. The last chunk is marked finished,
+    "error" is set if reading failed.
+    """
+    wrap_mode = None
+
+    def __init__(self, editor, filename, encoding, size, errors='surrogateescape'):
+        """
+        encoding: 'Unknown' is read as ASCII with NUL replaced
+        errors: error handler of decoding
+        """
+        self.editor = editor
+        self.filename = filename
+        self.encoding = encoding
+        self.size = size
+        self.errors = errors
+        self.loaded = 0
+        self.cancelled = False
+        self.error = None
+        self._slots = threading.Semaphore(LOAD_QUEUE)
+        self._thread = threading.Thread(target=self._run, name='meditor-loader', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self.cancelled = True
+        # wake up worker waiting for slot
+        self._slots.release()
+
+    def done(self):
+        """ a chunk has been appended """
+        self._slots.release()
+
+    def percent(self):
+        return self.loaded * 100 // self.size if self.size else 100
+
+    def _run(self):
+        unknown = self.encoding == 'Unknown'
+        try:
+            decoder = codecs.getincrementaldecoder('ascii' if unknown else self.encoding)(
+                errors=self.errors)
+            with open(self.filename, 'rb') as f:
+                while True:
+                    data = f.read(LOAD_CHUNK)
+                    text = decoder.decode(data, final=not data)
+                    if unknown:
+                        text = text.replace('\0', 'x')
+                    self._slots.acquire()
+                    if self.cancelled:
+                        return
+                    self.loaded += len(data)
+                    self._emit(text.encode('utf8', errors='surrogateescape'), not data)
+                    if not data:
+                        return
+        except Exception as err:
+            logger.error('Load error: %s' % err)
+            self.error = err
+            self._emit(b'', True)
+
+    def _emit(self, data, finished):
+        try:
+            self.editor.chunkLoaded.emit(self, data, finished)
+        except RuntimeError as err:
+            # editor has been deleted
+            logger.debug(err)
+            self.cancelled = True
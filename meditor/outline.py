@@ -0,0 +1,247 @@
+"""
+outline index of reStructuredText and Markdown headings
+
+Headings are kept in a list sorted by line number. The list is updated from
+edit notifications: entries after the edit are moved by the number of added
+lines and only the lines around the edit are scanned again, so a key stroke
+never scans the whole document. Levels of headings are decided again only if
+a heading or code fence is changed, otherwise line numbers of headings are
+moved in place. Section of a line is found by bisect.
+
+Title rules of reStructuredText are the same as "scan_titles" of
+rst_incremental, a title is decided by the line before it and two lines after
+it, but title like lines in simple tables are not skipped, which would need
+lines far before an edit. Markdown headings in fenced code blocks are ignored.
+"""
+import os
+import re
+import bisect
+import logging
+
+from docutils import utils
+
+from .rst_incremental import ADORNMENT, NOT_TITLE
+
+logger = logging.getLogger(__name__)
+
+line_end_regex = re.compile(r'\r\n|\r|\n')
+md_atx_regex = re.compile(r' {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+md_setext_regex = re.compile(r' {0,3}(=+|-+)[ \t]*$')
+md_fence_regex = re.compile(r' {0,3}(```|~~~)')
+
+EXTENSION_KIND = {
+    '.rst': 'rst',
+    '.rest': 'rst',
+    '.md': 'md',
+    '.markdown': 'md',
+}
+
+
+def outline_kind(filename):
+    """ return: 'rst', 'md' or None """
+    if not filename:
+        return None
+    _, ext = os.path.splitext(filename)
+    return EXTENSION_KIND.get(ext.lower())
+
+
+def rst_heading(lines, x):
+    """
+    lines: source lines, lines[x - 1] is blank or x is the first line
+    return: (style, title) or None
+    """
+    line = lines[x]
+    mo = ADORNMENT.match(line)
+    if mo:
+        # overline title
+        if x + 2 < len(lines) and lines[x + 1].strip() \
+                and lines[x + 2].rstrip() == line.rstrip():
+            return mo.group(1) * 2, lines[x + 1].strip()
+    elif x + 1 < len(lines) and line[:1].strip() and not NOT_TITLE.match(line):
+        # underline title
+        underline = lines[x + 1].rstrip()
+        mo = ADORNMENT.match(underline)
+        if mo and (len(underline) >= 4 or
+                   len(underline) >= utils.column_width(line.rstrip())):
+            return mo.group(1), line.strip()
+    return None
+
+
+def md_heading(lines, x, blank_before):
+    """ return: ('#' * level, title) or None """
+    line = lines[x]
+    mo = md_atx_regex.match(line)
+    if mo:
+        return mo.group(1), (mo.group(2) or '').strip()
+    # setext heading, only a paragraph of one line
+    if blank_before and x + 1 < len(lines) and line.strip() and not line.startswith('    ') \
+            and not md_fence_regex.match(line):
+        mo = md_setext_regex.match(lines[x + 1])
+        if mo:
+            return '#' if mo.group(1)[0] == '=' else '##', line.strip()
+    return None
+
+
+class OutlineIndex(object):
+    """
+    headings of one document
+
+    "revision" is increased when titles or levels are changed, but not when
+    headings are only moved to other lines.
+    """
+    # lines before and after an edited line which may be a heading again
+    context = 2
+    kind = None
+    revision = 0
+
+    def __init__(self, kind=None):
+        self.kind = kind
+        self.clear()
+
+    def clear(self):
+        self._lines = []
+        self._styles = []
+        self._titles = []
+        # line numbers of Markdown code fences
+        self._fences = []
+        # headings not in code blocks, None if not built
+        self._heading_lines = None
+        self._heading_levels = None
+        self._heading_titles = None
+        self.revision += 1
+
+    def reset(self, kind, lines):
+        """ lines: all lines of document without line end """
+        self.clear()
+        self.kind = kind
+        if kind:
+            self._scan(lines, 0, 0, len(lines) - 1)
+
+    def update(self, first, old_last, new_last, get_lines, count):
+        """
+        lines from "first" to "old_last" are replaced by lines from "first" to
+        "new_last"
+
+        get_lines: function(first, last) returns lines without line end
+        count: number of lines after edit
+        """
+        if not self.kind:
+            return
+        delta = new_last - old_last
+        start = max(0, first - self.context)
+        old_end = old_last + self.context
+        new_end = min(count - 1, new_last + self.context)
+        # headings and fences around edit are scanned again
+        head = bisect.bisect_left(self._lines, start)
+        tail = bisect.bisect_right(self._lines, old_end)
+        removed = list(zip(self._styles[head:tail], self._titles[head:tail]))
+        del self._lines[head:tail]
+        del self._styles[head:tail]
+        del self._titles[head:tail]
+        fence_head = bisect.bisect_left(self._fences, start)
+        fence_tail = bisect.bisect_right(self._fences, old_end)
+        removed_fences = self._fences[fence_head:fence_tail]
+        del self._fences[fence_head:fence_tail]
+        if delta:
+            self._lines[head:] = [line + delta for line in self._lines[head:]]
+            self._fences[fence_head:] = [line + delta for line in self._fences[fence_head:]]
+        # a heading is decided by one line before and two lines after it
+        window = max(0, start - 1)
+        lines = get_lines(window, min(count - 1, new_end + 2))
+        added, added_fences = self._scan(lines, window, start, new_end)
+        if removed != added or \
+                [line - first for line in removed_fences] != \
+                [line - first for line in added_fences]:
+            self.revision += 1
+            self._heading_lines = None
+        elif self._heading_lines is not None:
+            self._moveHeadings(start, old_end, delta, self._lines[head:head + len(added)])
+
+    def _scan(self, lines, window, start, end):
+        """
+        lines: source lines from line "window"
+        return: [(style, title), ...] and fences of lines from "start" to "end"
+        """
+        found = []
+        fences = []
+        for line_no in range(start, end + 1):
+            x = line_no - window
+            if x >= len(lines):
+                break
+            blank_before = line_no == 0 or not lines[x - 1].strip()
+            if self.kind == 'md':
+                if md_fence_regex.match(lines[x]):
+                    fences.append(line_no)
+                    continue
+                heading = md_heading(lines, x, blank_before)
+            elif blank_before:
+                heading = rst_heading(lines, x)
+            else:
+                heading = None
+            if heading:
+                found.append((line_no, heading))
+        index = bisect.bisect_left(self._lines, start)
+        self._lines[index:index] = [line_no for line_no, _ in found]
+        self._styles[index:index] = [style for _, (style, _) in found]
+        self._titles[index:index] = [title for _, (_, title) in found]
+        index = bisect.bisect_left(self._fences, start)
+        self._fences[index:index] = fences
+        return [heading for _, heading in found], fences
+
+    def inCode(self, line):
+        # odd number of fences before line: in code block
+        return bool(self._fences) and bisect.bisect_left(self._fences, line) % 2 == 1
+
+    def _moveHeadings(self, start, old_end, delta, new_lines):
+        """
+        headings are not changed, but lines from "start" to "old_end" are
+        replaced by "new_lines" and following lines are moved by "delta"
+        """
+        heading_lines = self._heading_lines
+        new_lines = [line for line in new_lines if not self.inCode(line)]
+        head = bisect.bisect_left(heading_lines, start)
+        tail = bisect.bisect_right(heading_lines, old_end)
+        if tail - head != len(new_lines):
+            self._heading_lines = None
+            return
+        heading_lines[head:tail] = new_lines
+        if delta:
+            heading_lines[tail:] = [line + delta for line in heading_lines[tail:]]
+
+    def _build(self):
+        if self._heading_lines is not None:
+            return
+        heading_lines = []
+        heading_levels = []
+        heading_titles = []
+        levels = {}
+        for line, style, title in zip(self._lines, self._styles, self._titles):
+            if self.inCode(line):
+                continue
+            if self.kind == 'md':
+                level = len(style)
+            else:
+                # level of reStructuredText is the order of style
+                level = levels.setdefault(style, len(levels) + 1)
+            heading_lines.append(line)
+            heading_levels.append(level)
+            heading_titles.append(title)
+        self._heading_lines = heading_lines
+        self._heading_levels = heading_levels
+        self._heading_titles = heading_titles
+
+    def headings(self):
+        """ return: [(line, level, title), ...] """
+        self._build()
+        return list(zip(self._heading_lines, self._heading_levels, self._heading_titles))
+
+    def sectionAt(self, line):
+        """ return: index of heading at or before line, -1 if none """
+        self._build()
+        return bisect.bisect_right(self._heading_lines, line) - 1
+
+    def heading(self, index):
+        """ return: (line, level, title) """
+        self._build()
+        return (self._heading_lines[index], self._heading_levels[index],
+                self._heading_titles[index])
@@ -0,0 +1,96 @@
+
+import logging
+
+from PyQt5 import QtCore, QtWidgets
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutlineView(QtWidgets.QTreeWidget):
+    """ headings of current editor, click to jump to section """
+    _editor = None
+    _revision = -1
+    _items = None
+
+    def __init__(self, parent=None):
+        super(OutlineView, self).__init__(parent)
+        self._items = []
+        self.setHeaderHidden(True)
+        self.itemClicked.connect(self.onItemClicked)
+        self.itemActivated.connect(self.onItemClicked)
+        # typing in a title changes outline at every key stroke
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(300)
+        self._timer.timeout.connect(self.refresh)
+
+    def setEditor(self, editor):
+        if editor is self._editor:
+            return
+        if self._editor:
+            try:
+                self._editor.outlineChanged.disconnect(self.onOutlineChanged)
+                self._editor.cursorPositionChanged.disconnect(self.onCursorPositionChanged)
+            except (TypeError, RuntimeError) as err:
+                # editor has been deleted
+                logger.debug(err)
+        self._editor = editor
+        if editor:
+            editor.outlineChanged.connect(self.onOutlineChanged)
+            editor.cursorPositionChanged.connect(self.onCursorPositionChanged)
+        self._revision = -1
+        self.refresh()
+
+    def onOutlineChanged(self):
+        self._timer.start()
+
+    def onCursorPositionChanged(self, line, index):
+        if self.isVisible():
+            self.selectSection(line)
+
+    def onItemClicked(self, item, column):
+        outline = self._editor.getOutline()
+        if outline.revision != self._revision:
+            self.refresh()
+            return
+        line = outline.heading(item.data(0, QtCore.Qt.UserRole))[0]
+        self._editor.setFirstVisibleLine(
+            self._editor.SendScintilla(self._editor.SCI_VISIBLEFROMDOCLINE, line))
+        self._editor.setCursorPosition(line, 0)
+        self._editor.setFocus()
+
+    def refresh(self):
+        """ build tree if outline is changed, only when visible """
+        if not self.isVisible() or not self._editor:
+            return
+        outline = self._editor.getOutline()
+        if outline.revision != self._revision:
+            self._revision = outline.revision
+            self.clear()
+            self._items = []
+            # parents of levels
+            parents = []
+            for x, (line, level, title) in enumerate(outline.headings()):
+                while parents and parents[-1][0] >= level:
+                    parents.pop()
+                if parents:
+                    item = QtWidgets.QTreeWidgetItem(parents[-1][1], [title])
+                else:
+                    item = QtWidgets.QTreeWidgetItem(self, [title])
+                item.setData(0, QtCore.Qt.UserRole, x)
+                parents.append((level, item))
+                self._items.append(item)
+            self.expandAll()
+        line, index = self._editor.getCursorPosition()
+        self.selectSection(line)
+
+    def selectSection(self, line):
+        outline = self._editor.getOutline()
+        if outline.revision != self._revision:
+            return
+        section = outline.sectionAt(line)
+        if section >= 0:
+            self.setCurrentItem(self._items[section])
+        else:
+            self.clearSelection()
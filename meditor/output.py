@@ -1,6 +1,9 @@
 import os.path
+import re
+import copy
 import logging
 import json
+import threading
 import subprocess
 from collections import OrderedDict
 
@@ -14,14 +17,22 @@ import mdx_mathjax
 import mdx_graphviz
 import docutils_graphviz
 
-from docutils.core import publish_string
+from docutils.core import Publisher
 from docutils.core import publish_cmdline
 from docutils.core import publish_cmdline_to_binary
 from docutils.writers.odf_odt import Writer, Reader
+from docutils import io as docutils_io
 from docutils.writers import html5_polyglot
+from docutils.readers import standalone
+from docutils.parsers import rst
 from docutils.parsers.rst import directives
+from docutils.transforms import Transform
 
 from . import __data_path__, __home_data_path__
+from .rst_incremental import (
+    IncrementalReader, ChunkReader, SectionCache, FragmentCache, FragmentTranslator,
+    split_fragments, CHUNK_MARK_REGEX)
+from .preview import StageTimer
 
 logger = logging.getLogger(__name__)
 
@@ -30,90 +41,359 @@ default_overrides = {
     'output_encoding': 'utf-8',
 }
 
+# docutils components for preview, key: settings overrides
+rst_renderers = OrderedDict()
+rst_lock = threading.Lock()
+# chunk marks and new lines at end of a writer part
+chunk_tail_regex = re.compile('(?:\n|%s)+$' % CHUNK_MARK_REGEX.pattern)
 
-def get_rst_themes():
+# register graphviz directive
+directives.register_directive('dot', docutils_graphviz.Graphviz)
+
+
+class ThemeRegistry(object):
     """
-    result: { 'theme': theme_dict, ... }
+    index of reStructuredText and Markdown themes
+
+    Theme directories are scanned once. The index, resolved docutils
+    settings and loaded CSS are kept until mtime of a theme directory,
+    theme.json, css or pygments.css is changed.
     """
-    themes_dirs = [
-        os.path.join(__home_data_path__, 'themes', 'reStructuredText'),
-        os.path.join(__data_path__, 'themes', 'reStructuredText'),
-    ]
-    themes = OrderedDict()
-    for themes_dir in themes_dirs:
-        if os.path.exists(themes_dir):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watched = []
+        self._signature = None
+        self._rst_themes = OrderedDict()
+        self._md_themes = OrderedDict()
+        self._rst_settings = {}
+        self._css = {}
+        self._docutils_theme_path = None
+
+    @staticmethod
+    def _themes_dirs(kind):
+        return [
+            os.path.join(__home_data_path__, 'themes', kind),
+            os.path.join(__data_path__, 'themes', kind),
+        ]
+
+    @staticmethod
+    def _pygments_path(kind):
+        return os.path.join(__home_data_path__, 'themes', kind, 'pygments.css')
+
+    @staticmethod
+    def _stat(paths):
+        signature = []
+        for path in paths:
+            try:
+                signature.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _check(self):
+        if self._signature is None or self._stat(self._watched) != self._signature:
+            self._scan()
+
+    def _scan(self):
+        watched = []
+        rst_themes = OrderedDict()
+        for themes_dir in self._themes_dirs('reStructuredText'):
+            watched.append(themes_dir)
+            if not os.path.isdir(themes_dir):
+                continue
             for theme in os.listdir(themes_dir):
-                theme_json = os.path.join(themes_dir, theme, 'theme.json')
+                theme_dir = os.path.join(themes_dir, theme)
+                if os.path.isdir(theme_dir):
+                    watched.append(theme_dir)
+                theme_json = os.path.join(theme_dir, 'theme.json')
                 if os.path.exists(theme_json):
+                    watched.append(theme_json)
                     try:
-                        styles = json.load(open(theme_json))
+                        with open(theme_json) as f:
+                            styles = json.load(f)
                         for name, style in styles.items():
                             style['stylesheet_dirs'] = [os.path.dirname(theme_json)]
-                            themes[name] = style
+                            rst_themes[name] = style
                     except Exception as err:
                         logger.error(err)
                         continue
-    return themes
+        md_themes = OrderedDict()
+        for themes_dir in self._themes_dirs('Markdown'):
+            watched.append(themes_dir)
+            if not os.path.isdir(themes_dir):
+                continue
+            for theme_dir in os.listdir(themes_dir):
+                theme_dir = os.path.join(themes_dir, theme_dir)
+                if os.path.isdir(theme_dir):
+                    watched.append(theme_dir)
+                    for theme in os.listdir(theme_dir):
+                        name, ext = os.path.splitext(theme)
+                        if ext.lower() == '.css':
+                            md_themes[name] = os.path.join(theme_dir, theme)
+                            watched.append(md_themes[name])
+        watched.append(self._pygments_path('reStructuredText'))
+        watched.append(self._pygments_path('Markdown'))
+        self._watched = watched
+        self._signature = self._stat(watched)
+        self._rst_themes = rst_themes
+        self._md_themes = md_themes
+        self._rst_settings.clear()
+        logger.debug('theme index: %s rst, %s md themes' % (len(rst_themes), len(md_themes)))
+
+    def _read_css(self, path):
+        """ CSS text, reload if file is changed """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._css.pop(path, None)
+            return ''
+        cached = self._css.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path) as f:
+            text = f.read()
+        self._css[path] = (mtime, text)
+        return text
+
+    def docutilsThemePath(self):
+        if self._docutils_theme_path is None:
+            search_paths = [
+                os.path.abspath(os.path.dirname(os.path.dirname(html5_polyglot.__file__))),
+            ]
+            self._docutils_theme_path = ''
+            for path in search_paths:
+                if os.path.exists(os.path.join(path, 'html5_polyglot', 'template.txt')):
+                    self._docutils_theme_path = path
+                    break
+            logger.debug('docutils theme path: %s' % self._docutils_theme_path)
+        return self._docutils_theme_path
+
+    def rstThemes(self):
+        with self._lock:
+            self._check()
+            return self._rst_themes
+
+    def mdThemes(self):
+        with self._lock:
+            self._check()
+            return self._md_themes
+
+    def rstSettings(self, theme):
+        """ docutils settings of theme, docutils writer will load css file. """
+        with self._lock:
+            self._check()
+            theme = theme or 'default'
+            if theme not in self._rst_settings:
+                self._rst_settings[theme] = self._resolveRstSettings(theme)
+            return copy.deepcopy(self._rst_settings[theme])
+
+    def _resolveRstSettings(self, theme):
+        stylesheet = {}
+        docutils_theme_path = self.docutilsThemePath()
+        stylesheet['stylesheet_dirs'] = [
+            os.path.join(docutils_theme_path, 'html4css1'),
+            os.path.join(docutils_theme_path, 'html5_polyglot'),
+        ]
+
+        pygments_path = self._pygments_path('reStructuredText')
+        if os.path.exists(pygments_path):
+            stylesheet['stylesheet_path'] = pygments_path
+            stylesheet['syntax_highlight'] = 'short'
+        # docutils default theme
+        if theme == 'default':
+            return stylesheet
+
+        # third part theme
+        styles = self._rst_themes.get(theme)
+
+        # stylesheet_path : css file path
+        # syntax_highlight: short
+        # template: template file path
+        stylesheet['stylesheet_dirs'].extend(styles['stylesheet_dirs'])
+        if 'syntax_highlight' in styles:
+            stylesheet['syntax_highlight'] = styles['syntax_highlight']
+        if 'stylesheet_path' in styles:
+            css_paths = styles['stylesheet_path'].split(',')
+            if 'stylesheet_path' in stylesheet:
+                css_paths += stylesheet['stylesheet_path'].split(',')
+            stylesheet['stylesheet_path'] = ','.join(css_paths)
+        if 'template' in styles:
+            old_path = styles['template']
+            new_path = os.path.abspath(
+                os.path.join(__home_data_path__,
+                             'themes', 'reStructuredText',
+                             theme,
+                             old_path))
+            stylesheet['template'] = new_path
+        return stylesheet
+
+    def mdCss(self, theme):
+        """ return: (theme css, pygments css) """
+        with self._lock:
+            self._check()
+            theme_path = self._md_themes.get(theme)
+            theme_css = self._read_css(theme_path) if theme_path else ''
+            pygments_css = self._read_css(self._pygments_path('Markdown'))
+            return theme_css, pygments_css
+
+
+theme_registry = ThemeRegistry()
+
+
+def get_rst_themes():
+    """
+    result: { 'theme': theme_dict, ... }
+    """
+    return theme_registry.rstThemes()
 
 
 def get_theme_settings(theme):
     """
     docutils writer will load css file.
     """
-    stylesheet = {}
-    search_paths = [
-        os.path.abspath(os.path.dirname(os.path.dirname(html5_polyglot.__file__))),
-    ]
-    docutils_theme_path = ''
-    for path in search_paths:
-        if os.path.exists(os.path.join(path, 'html5_polyglot', 'template.txt')):
-            docutils_theme_path = path
-            break
-    logger.debug('docutils theme path: %s' % docutils_theme_path)
-
-    stylesheet['stylesheet_dirs'] = [
-        os.path.join(docutils_theme_path, 'html4css1'),
-        os.path.join(docutils_theme_path, 'html5_polyglot'),
-    ]
-
-    pygments_path = os.path.join(__home_data_path__, 'themes', 'reStructuredText', 'pygments.css')
-    if os.path.exists(pygments_path):
-        stylesheet['stylesheet_path'] = pygments_path
-        stylesheet['syntax_highlight'] = 'short'
-    # docutils default theme
-    if not theme or theme == 'default':
-        return stylesheet
+    return theme_registry.rstSettings(theme)
+
+
+class ParseFinished(Transform):
+    """ the first transform, mark time of parse """
+    default_priority = 0
+
+    def apply(self):
+        writer = self.document.transformer.components.get('writer')
+        if getattr(writer, 'timer', None):
+            writer.timer.mark('parse')
+
+
+class TimedWriter(html5_polyglot.Writer):
+    """
+    html5 writer which marks time of transforms and writer
+
+    html of incremental chunks is kept in "pieces".
+    """
+    def __init__(self, timer):
+        super(TimedWriter, self).__init__()
+        self.timer = timer
+        self.translator_class = FragmentTranslator
+        self.pieces = None
+        self.chunk_levels = None
+        self.has_messages = False
+
+    def interpolation_dict(self):
+        subs = super(TimedWriter, self).interpolation_dict()
+        # trailing new lines before chunk marks are stripped too
+        for attr in self.visitor_attributes:
+            mo = chunk_tail_regex.search(subs[attr])
+            if mo:
+                subs[attr] = subs[attr][:mo.start()] + mo.group().replace('\n', '')
+        return subs
+
+    def translate(self):
+        super(TimedWriter, self).translate()
+        self.output, self.pieces = split_fragments(self.output)
+        self.chunk_levels = self.visitor.chunk_levels
+        self.has_messages = self.visitor.has_messages
+        for attr in self.visitor_attributes:
+            setattr(self, attr, [split_fragments(text)[0] for text in getattr(self, attr)])
+
+    def get_transforms(self):
+        return super(TimedWriter, self).get_transforms() + [ParseFinished]
+
+    def write(self, document, destination):
+        self.timer and self.timer.mark('transforms')
+        output = super(TimedWriter, self).write(document, destination)
+        self.timer and self.timer.mark('writer')
+        return output
+
+
+class RstRenderer(object):
+    """
+    docutils reader, parser, writer and settings for preview
+
+    They are built once for the same settings overrides. Every render only
+    creates a publisher, a copy of settings and the document.
+    """
+    def __init__(self, overrides):
+        self.parser = rst.Parser()
+        self.reader = standalone.Reader(parser=self.parser)
+        sections = SectionCache()
+        self.incremental_reader = IncrementalReader(sections, parser=self.parser)
+        self.chunk_reader = ChunkReader(sections, parser=self.parser)
+        self.fragments = FragmentCache(sections, self.renderChunk)
+        self.writer = TimedWriter(None)
+        self.chunk_writer = TimedWriter(None)
+        publisher = Publisher(
+            self.reader, self.parser, self.writer,
+            source_class=docutils_io.StringInput,
+            destination_class=docutils_io.StringOutput,
+        )
+        publisher.process_programmatic_settings(None, overrides, None)
+        self.settings = publisher.settings
+        # a chunk alone is not the document title or docinfo
+        self.chunk_settings = copy.copy(self.settings)
+        self.chunk_settings.doctitle_xform = False
+        self.chunk_settings.docinfo_xform = False
+        # references to other chunks are not found, messages are not printed.
+        # report level is kept, or messages are removed from html of chunk
+        self.chunk_settings.warning_stream = ''
+
+    def render(self, text, incremental=False, timer=None):
+        if incremental:
+            try:
+                html = self.fragments.render(text, self.parser, self.settings)
+            except Exception as err:
+                logger.error('incremental render: %s' % err)
+                self.fragments.clear()
+                html = None
+            if html is not None:
+                timer and timer.mark('writer')
+                output = docutils_io.StringOutput(
+                    encoding=self.settings.output_encoding,
+                    error_handler=self.settings.output_encoding_error_handler)
+                return output.write(html)
+        reader = self.incremental_reader if incremental else self.reader
+        self.writer.timer = timer
+        publisher = Publisher(
+            reader, self.parser, self.writer,
+            source_class=docutils_io.StringInput,
+            destination_class=docutils_io.StringOutput,
+            settings=copy.copy(self.settings),
+        )
+        publisher.set_source(text, None)
+        publisher.set_destination(None, None)
+        output = publisher.publish()
+        if incremental:
+            self.fragments.record(
+                self.writer.pieces, self.writer.chunk_levels, self.writer.has_messages)
+        return output
+
+    def renderChunk(self, chunk, section_level, line_offset):
+        """ return: html pieces of chunk rendered alone """
+        self.chunk_reader.chunk = chunk
+        self.chunk_reader.section_level = section_level
+        self.chunk_reader.line_offset = line_offset
+        publisher = Publisher(
+            self.chunk_reader, self.parser, self.chunk_writer,
+            source_class=docutils_io.StringInput,
+            destination_class=docutils_io.StringOutput,
+            settings=copy.copy(self.chunk_settings),
+        )
+        publisher.set_source('', None)
+        publisher.set_destination(None, None)
+        publisher.publish()
+        return [html for index, html in self.chunk_writer.pieces if index == 0]
+
+
+def get_rst_renderer(overrides):
+    key = repr(sorted(overrides.items()))
+    renderer = rst_renderers.pop(key, None) or RstRenderer(overrides)
+    rst_renderers[key] = renderer
+    while len(rst_renderers) > 4:
+        rst_renderers.popitem(last=False)
+    return renderer
 
-    # third part theme
-    themes = get_rst_themes()
-    styles = themes.get(theme)
-
-    # stylesheet_path : css file path
-    # syntax_highlight: short
-    # template: template file path
-    stylesheet['stylesheet_dirs'].extend(styles['stylesheet_dirs'])
-    if 'syntax_highlight' in styles:
-        stylesheet['syntax_highlight'] = styles['syntax_highlight']
-    if 'stylesheet_path' in styles:
-        css_paths = styles['stylesheet_path'].split(',')
-        if 'stylesheet_path' in stylesheet:
-            css_paths += stylesheet['stylesheet_path'].split(',')
-        stylesheet['stylesheet_path'] = ','.join(css_paths)
-    if 'template' in styles:
-        old_path = styles['template']
-        new_path = os.path.abspath(
-            os.path.join(__home_data_path__,
-                         'themes', 'reStructuredText',
-                         theme,
-                         old_path))
-        stylesheet['template'] = new_path
-    return stylesheet
-
-
-def rst2htmlcode(rst_text, theme=None, settings={}):
-    # register graphviz directive
-    directives.register_directive('dot', docutils_graphviz.Graphviz)
 
+def rst2htmlcode(rst_text, theme=None, settings={}, timer=None):
+    timer = timer or StageTimer()
     output = None
     try:
         overrides = {}
@@ -121,15 +401,18 @@ def rst2htmlcode(rst_text, theme=None, settings={}):
         if mathjax:
             overrides['math_output'] = ' '.join(['MathJax', mathjax])
             del settings['mathjax']
+        incremental = settings.get('incremental')
+        if 'incremental' in settings:
+            del settings['incremental']
         overrides.update(default_overrides)
         overrides.update(settings)
         overrides.update(get_theme_settings(theme))
         logger.debug(overrides)
-        output = publish_string(
-            rst_text,
-            writer_name='html5',
-            settings_overrides=overrides,
-        )
+        timer.mark('theme')
+        with rst_lock:
+            renderer = get_rst_renderer(overrides)
+            timer.mark('setup')
+            output = renderer.render(rst_text, incremental, timer)
     except Exception as err:
         logger.error(err)
         output = str(err)
@@ -137,9 +420,6 @@ def rst2htmlcode(rst_text, theme=None, settings={}):
 
 
 def rst2html(rst_file, filename, theme=None, settings={}):
-    # register graphviz directive
-    directives.register_directive('dot', docutils_graphviz.Graphviz)
-
     output = None
     try:
         overrides = {}
@@ -166,9 +446,6 @@ def rst2html(rst_file, filename, theme=None, settings={}):
 
 
 def rst2odt(rst_file, filename, theme=None, settings={}):
-    # register graphviz directive
-    directives.register_directive('dot', docutils_graphviz.Graphviz)
-
     output = None
     try:
         overrides = {}
@@ -195,78 +472,75 @@ def rst2odt(rst_file, filename, theme=None, settings={}):
 
 def get_md_themes():
     """
-    result: { 'theme': theme_dict, ... }
+    result: { 'theme': css_path, ... }
     """
-    themes_dirs = [
-        os.path.join(__home_data_path__, 'themes', 'Markdown'),
-        os.path.join(__data_path__, 'themes', 'Markdown'),
-    ]
-    themes = OrderedDict()
-    for themes_dir in themes_dirs:
-        if os.path.isdir(themes_dir):
-            for theme_dir in os.listdir(themes_dir):
-                theme_dir = os.path.join(themes_dir, theme_dir)
-                if os.path.isdir(theme_dir):
-                    for theme in os.listdir(theme_dir):
-                        name, ext = os.path.splitext(theme)
-                        if ext.lower() == '.css':
-                            themes[name] = os.path.join(theme_dir, theme)
-    return themes
+    return theme_registry.mdThemes()
+
+
+md_extensions = [
+    'markdown.extensions.abbr',
+    'markdown.extensions.attr_list',
+    'markdown.extensions.def_list',
+    'markdown.extensions.fenced_code',
+    'markdown.extensions.footnotes',
+    # 'markdown.extensions.md_in_html',
+    'markdown.extensions.tables',
+    'markdown.extensions.admonition',
+    'markdown.extensions.codehilite',
+    # 'markdown.extensions.legacy_attrs',
+    # 'markdown.extensions.legacy_em',
+    'markdown.extensions.meta',
+    'markdown.extensions.nl2br',
+    'markdown.extensions.sane_lists',
+    'markdown.extensions.smarty',
+    'markdown.extensions.toc',
+    'markdown.extensions.wikilinks',
+]
+
+# configured markdown converters, key: mathjax
+md_converters = {}
+md_lock = threading.Lock()
+
+
+def get_md_converter(mathjax):
+    """ reuse converter of the same extensions, reset state of last document """
+    md = md_converters.get(mathjax)
+    if md is None:
+        extensions = list(md_extensions)
+        if mathjax:
+            extensions.append(mdx_mathjax.MathJaxExtension(asciimath_escape=True))
+        extensions.append(mdx_graphviz.makeExtension())
+        md = markdown.Markdown(
+            output_format='html5',
+            extensions=extensions,
+            extension_configs={},
+        )
+        md_converters[mathjax] = md
+    md.reset()
+    # abbr extension adds a pattern for every abbreviation and never removes it
+    for name in [k for k in md.inlinePatterns.keys() if k.startswith('abbr-')]:
+        del md.inlinePatterns[name]
+    return md
 
 
-def md2htmlcode(markup_file, theme=None, settings={}):
+def md2htmlcode(markup_file, theme=None, settings={}, timer=None):
+    timer = timer or StageTimer()
     mathjax = settings.get('mathjax')
-    extensions = [
-        'markdown.extensions.abbr',
-        'markdown.extensions.attr_list',
-        'markdown.extensions.def_list',
-        'markdown.extensions.fenced_code',
-        'markdown.extensions.footnotes',
-        # 'markdown.extensions.md_in_html',
-        'markdown.extensions.tables',
-        'markdown.extensions.admonition',
-        'markdown.extensions.codehilite',
-        # 'markdown.extensions.legacy_attrs',
-        # 'markdown.extensions.legacy_em',
-        'markdown.extensions.meta',
-        'markdown.extensions.nl2br',
-        'markdown.extensions.sane_lists',
-        'markdown.extensions.smarty',
-        'markdown.extensions.toc',
-        'markdown.extensions.wikilinks',
-    ]
-    extension_configs = {
-    }
-
-    if mathjax:
-        extensions.append(mdx_mathjax.MathJaxExtension(asciimath_escape=True))
-    extensions.append(mdx_graphviz.makeExtension())
 
-    try:
-        overrides = {}
-        logger.debug(overrides)
-        body = markdown.markdown(
-            markup_file, output_format='html5',
-            extensions=extensions,
-            extension_configs=extension_configs,
-        )
-    except Exception as err:
-        logger.error(err)
-        body = err
-
-    themes = get_md_themes()
-    theme_path = themes.get(theme, 'default')
-    theme_css = ''
-    if os.path.exists(theme_path):
-        with open(theme_path) as f:
-            theme_css = f.read()
-
-    pygments_path = os.path.join(
-        __home_data_path__, 'themes', 'Markdown', 'pygments.css')
-    pygment_css = ''
-    if os.path.exists(pygments_path):
-        with open(pygments_path) as f:
-            pygment_css = f.read()
+    with md_lock:
+        try:
+            md = get_md_converter(bool(mathjax))
+            timer.mark('setup')
+            body = md.convert(markup_file)
+        except Exception as err:
+            logger.error(err)
+            # state of converter is unknown
+            md_converters.pop(bool(mathjax), None)
+            body = err
+    timer.mark('parse')
+
+    theme_css, pygment_css = theme_registry.mdCss(theme)
+    timer.mark('theme')
 
     html = []
     html.append('<!DOCTYPE html>')
@@ -316,7 +590,9 @@ MathJax = {
     html.append('</body>')
     html.append('</html>')
 
-    return '\n'.join(html)
+    html = '\n'.join(html)
+    timer.mark('writer')
+    return html
 
 
 def md2html(md_file, filename, theme):
@@ -330,20 +606,24 @@ def md2html(md_file, filename, theme):
         f.write(html)
 
 
-def htmlcode(text, filepath):
+def htmlcode(text, filepath, timer=None):
+    timer = timer or StageTimer()
     try:
         lexer = get_lexer_for_filename(filepath, stripall=True)
     except ClassNotFound:
         lexer = get_lexer_for_filename(filepath + '.txt', stripall=True)
     formatter = HtmlFormatter(linenos='inline', full=True, filename=filepath)
 
-    return highlight(text, lexer, formatter)
+    html = highlight(text, lexer, formatter)
+    timer.mark('highlight')
+    return html
 
 
-def graphviz2htmlcode(markup_text, theme=None, settings={}):
+def graphviz2htmlcode(markup_text, theme=None, settings={}, timer=None):
     import base64
     import graphviz
 
+    timer = timer or StageTimer()
     filetype = settings.get('filetype', 'svg')
     alt = settings.get('filename', 'dot-file')
 
@@ -369,6 +649,7 @@ def graphviz2htmlcode(markup_text, theme=None, settings={}):
     except Exception as err:
         img = '%s<br />%s' % (err, output)
         logger.error(img)
+    timer.mark('dot')
 
     html = []
     html.append('<!DOCTYPE html>')
@@ -385,4 +666,6 @@ def graphviz2htmlcode(markup_text, theme=None, settings={}):
     html.append('</body>')
     html.append('</html>')
 
-    return '\n'.join(html)
+    html = '\n'.join(html)
+    timer.mark('writer')
+    return html
@@ -0,0 +1,229 @@
+import sys
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class PreviewJob(object):
+    """ text snapshot of a editor waiting for rendering """
+    def __init__(self, key, generation, text, path, mathjax):
+        self.key = key
+        self.generation = generation
+        self.text = text
+        self.path = path
+        self.mathjax = mathjax
+        self.cache_key = None
+        self.html = ''
+        self.timer = StageTimer()
+
+
+class PreviewScheduler(object):
+    """
+    latest-wins preview scheduler
+
+    Every request gets a increasing generation number. Only the newest job of
+    every editor is kept in queue, and worker always takes the newest job of
+    all, so a burst of input is coalesced into one rendering.  A result is
+    current only if no newer job has been submitted after it.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._generation = 0
+        self._quit = False
+
+    def submit(self, key, text, path, mathjax=False, cache_key=None, timer=None):
+        """ replace queued job of editor "key" with a new snapshot """
+        with self._cond:
+            self._generation += 1
+            job = PreviewJob(key, self._generation, text, path, mathjax)
+            job.cache_key = cache_key
+            if timer:
+                job.timer = timer
+            if key in self._jobs:
+                logger.debug('Preview coalesce generation %s => %s' % (
+                    self._jobs[key].generation, job.generation))
+            self._jobs[key] = job
+            self._cond.notify()
+            return job
+
+    def take(self):
+        """ wait for the newest job. return None when quit """
+        with self._cond:
+            while not self._jobs and not self._quit:
+                self._cond.wait()
+            if self._quit:
+                return None
+            key = max(self._jobs, key=lambda k: self._jobs[k].generation)
+            job = self._jobs.pop(key)
+            # a older job of other editor will be never shown
+            self._jobs.clear()
+            job.timer.mark('queue')
+            return job
+
+    def complete(self, key, text, path, mathjax, html, timer=None):
+        """ a job has been finished without rendering, such as cache hit """
+        with self._cond:
+            self._generation += 1
+            job = PreviewJob(key, self._generation, text, path, mathjax)
+            job.html = html
+            if timer:
+                job.timer = timer
+            self._jobs.pop(key, None)
+            return job
+
+    def isCurrent(self, job):
+        with self._cond:
+            return job.generation == self._generation
+
+    def generation(self):
+        with self._cond:
+            return self._generation
+
+    def quit(self):
+        with self._cond:
+            self._quit = True
+            self._jobs.clear()
+            self._cond.notify_all()
+
+
+class PreviewCache(object):
+    """
+    content-addressed preview HTML cache
+
+    key is hash of text and all options which affect HTML. Least recently used
+    items are evicted when total size exceeds max_bytes.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self._max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def makeKey(text, *options):
+        h = hashlib.sha1()
+        for option in options:
+            h.update(('%s\0' % (option,)).encode('utf-8'))
+        h.update(text.encode('utf-8', errors='surrogateescape'))
+        return h.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            html = self._items.get(key)
+            if html is not None:
+                self._items.move_to_end(key)
+            return html
+
+    def put(self, key, html):
+        size = sys.getsizeof(html)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._bytes -= sys.getsizeof(self._items.pop(key))
+            self._items[key] = html
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, old = self._items.popitem(last=False)
+                self._bytes -= sys.getsizeof(old)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def size(self):
+        return self._bytes
+
+
+class StageTimer(object):
+    """ elapsed seconds of every stage, in order """
+    def __init__(self):
+        self.stages = OrderedDict()
+        self._last = time.perf_counter()
+
+    def restart(self):
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        """ time since last mark is spent on "stage" """
+        now = time.perf_counter()
+        self.add(stage, now - self._last)
+        self._last = now
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def update(self, stages):
+        for stage, seconds in stages.items():
+            self.add(stage, seconds)
+
+    def total(self):
+        return sum(self.stages.values())
+
+    def __str__(self):
+        return ' '.join(
+            '%s=%.1fms' % (stage, seconds * 1000)
+            for stage, seconds in self.stages.items())
+
+
+class PreviewStats(object):
+    """
+    rolling timings of the last "window" previews
+
+    histogram buckets are powers of two in milliseconds: <1, <2, <4, ...
+    """
+    buckets = 12
+
+    def __init__(self, window=200):
+        self._window = window
+        self._stages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, stages):
+        with self._lock:
+            for stage, seconds in stages.items():
+                if stage not in self._stages:
+                    self._stages[stage] = deque(maxlen=self._window)
+                self._stages[stage].append(seconds)
+
+    def clear(self):
+        with self._lock:
+            self._stages.clear()
+
+    def stages(self):
+        with self._lock:
+            return list(self._stages.keys())
+
+    def summary(self, stage):
+        """ return: (count, last, median, p95, max) in seconds """
+        with self._lock:
+            values = list(self._stages.get(stage, []))
+        if not values:
+            return (0, 0.0, 0.0, 0.0, 0.0)
+        last = values[-1]
+        values.sort()
+        count = len(values)
+        median = values[count // 2]
+        p95 = values[min(count - 1, int(count * 0.95))]
+        return (count, last, median, p95, values[-1])
+
+    def histogram(self, stage):
+        with self._lock:
+            values = list(self._stages.get(stage, []))
+        counts = [0] * self.buckets
+        for seconds in values:
+            ms = seconds * 1000
+            x = 0
+            while x < self.buckets - 1 and ms >= (1 << x):
+                x += 1
+            counts[x] += 1
+        return counts
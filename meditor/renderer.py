@@ -0,0 +1,153 @@
+import time
+import threading
+import logging
+import multiprocessing
+
+from . import output
+from .preview import StageTimer
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait for html of one request
+RENDER_TIMEOUT = 60
+# seconds before restarting a failed process, doubled by every failure
+RETRY_DELAY = 5
+# render in this process after failures in a row
+MAX_FAILURES = 3
+
+
+def _serve(conn):
+    """ main loop of render process
+
+    request: (function name in output, args, kwargs)
+    response: (ok, html or error message, timings of stages)
+    """
+    # pre-warm: load docutils parser, writer, markdown extensions and pygments
+    try:
+        output.rst2htmlcode('Meditor\n=======\n\n*warm up*\n')
+        output.md2htmlcode('# Meditor\n\n*warm up*\n')
+        output.htmlcode('warm up', 'warm_up.py')
+    except Exception as err:
+        logger.error(err)
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        func_name, args, kwargs = request
+        timer = StageTimer()
+        try:
+            html = getattr(output, func_name)(*args, timer=timer, **kwargs)
+            conn.send((True, html, timer.stages))
+        except Exception as err:
+            conn.send((False, '%s' % err, timer.stages))
+    conn.close()
+
+
+class RenderServer(object):
+    """
+    persistent render process for preview.
+
+    docutils and markdown hold GIL during rendering. Rendering in a separate
+    process, GUI process only ships text and receives HTML.  If the process
+    is gone or does not answer in time, current request is rendered in this
+    process, and it will be restarted after a delay. After too many failures
+    in a row, all requests are rendered in this process.
+    """
+    _process = None
+    _conn = None
+    _failures = 0
+    _retry_time = 0
+
+    def __init__(self, enable=True):
+        self._enable = enable
+        self._lock = threading.Lock()
+        # fork is unsafe with Qt
+        self._context = multiprocessing.get_context('spawn')
+
+    def start(self):
+        if not self._enable:
+            return
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        if self._process and self._process.is_alive():
+            return
+        parent_conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_serve, args=(child_conn,),
+            name='meditor-render', daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        logger.debug('Render process start: %s' % self._process.pid)
+
+    def _stop(self):
+        if self._conn:
+            try:
+                self._conn.send(None)
+            except (OSError, ValueError):
+                pass
+            self._conn.close()
+            self._conn = None
+        if self._process:
+            self._process.join(1)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+    def _failed(self):
+        self._failures += 1
+        if self._failures >= MAX_FAILURES:
+            logger.error('Render process is disabled after %s failures' % self._failures)
+            self._enable = False
+        else:
+            self._retry_time = time.monotonic() + RETRY_DELAY * 2 ** (self._failures - 1)
+
+    def render(self, func_name, *args, timer=None, **kwargs):
+        """ call output.<func_name> in render process
+
+        timer: StageTimer, receives timings of render stages
+        return: (ok, html), html is error message if not ok
+        """
+        timer = timer or StageTimer()
+        if not self._enable:
+            return self._render(func_name, *args, timer=timer, **kwargs)
+        with self._lock:
+            if self._failures and time.monotonic() < self._retry_time:
+                return self._render(func_name, *args, timer=timer, **kwargs)
+            try:
+                self._start()
+                timer.restart()
+                self._conn.send((func_name, args, kwargs))
+                if not self._conn.poll(RENDER_TIMEOUT):
+                    raise TimeoutError('no response in %s seconds' % RENDER_TIMEOUT)
+                ok, result, stages = self._conn.recv()
+            except (EOFError, OSError, ValueError) as err:
+                logger.error('Render process error: %s' % err)
+                self._stop()
+                self._failed()
+                return self._render(func_name, *args, timer=timer, **kwargs)
+            self._failures = 0
+        timer.update(stages)
+        # round trip out of render functions: pickle, pipe and wake up
+        timer.mark('ipc')
+        timer.stages['ipc'] = max(0.0, timer.stages['ipc'] - sum(stages.values()))
+        if not ok:
+            logger.error(result)
+        return ok, result
+
+    def _render(self, func_name, *args, timer=None, **kwargs):
+        """ call output.<func_name> in this process """
+        try:
+            return True, getattr(output, func_name)(*args, timer=timer, **kwargs)
+        except Exception as err:
+            logger.error(err)
+            return False, '%s' % err
@@ -0,0 +1,626 @@
+"""
+incremental reStructuredText rendering
+
+The source is split at section titles. Every chunk is parsed alone and its
+doctree is cached by the hash of chunk text, so only edited chunks are parsed
+again. Cached doctrees are copied into a new document, nested by section
+level, and document-wide names, ids, footnotes, substitutions and pending
+transforms (such as "contents") are registered again, then all transforms and
+writer run on the whole document as usual.
+
+The writer marks html of every chunk in output. When only a few chunks are
+edited and they define and refer to the same names, titles and footnotes as
+before, other chunks render the same html, so only edited chunks are rendered
+alone and their html replaces the old one. A chunk is replaced only if its
+old text rendered alone gives the same html as in the whole document, such as
+a chunk without references to other chunks or auto numbered footnotes.
+
+If the document could not be split safely, such as a inconsistent title level,
+a title in a broken simple table, or a name defined in two chunks which is not
+an implicit target, it is parsed as a whole.
+"""
+import re
+import copy
+import hashlib
+import logging
+from functools import partial
+from collections import OrderedDict
+
+from docutils import nodes, utils
+from docutils.io import StringInput
+from docutils.readers import standalone
+from docutils.writers import html5_polyglot
+
+logger = logging.getLogger(__name__)
+
+# repeated 7-bit punctuation, see docutils.parsers.rst.states.Line
+ADORNMENT = re.compile(r'''^([!-/:-@\[-`{-~])\1* *$''')
+# body elements which are not section title
+NOT_TITLE = re.compile(r'''^([-+*•‣⁃]( |$)|\.\.( |$)|\|( |$)|>>>( |$)|:[^:\s][^:]*:( |$))''')
+# simple table, see docutils.parsers.rst.states.Body
+SIMPLE_TABLE_TOP = re.compile('=+( +=+)+ *$')
+SIMPLE_TABLE_BORDER = re.compile('=+[ =]*$')
+# mark of chunk html in writer output, which chunk owns following html
+CHUNK_MARK = '\0chunk:%d\0'
+CHUNK_MARK_REGEX = re.compile('\0chunk:(-?\\d+)\0')
+# text of these nodes is copied to other chunks by transforms
+GLOBAL_TEXT = (nodes.title, nodes.subtitle, nodes.substitution_definition, nodes.label)
+
+
+def simple_table_end(lines, start):
+    """ return: last line of simple table, as "isolate_simple_table" of docutils """
+    limit = len(lines) - 1
+    top_length = len(lines[start].strip())
+    found_at = None
+    for x in range(start + 1, limit + 1):
+        line = lines[x].rstrip()
+        if not SIMPLE_TABLE_BORDER.match(line):
+            continue
+        if len(line.strip()) != top_length:
+            return x
+        if found_at is not None or x == limit or not lines[x + 1].strip():
+            return x
+        found_at = x
+    # malformed table
+    return limit if found_at is None else found_at
+
+
+def scan_titles(lines):
+    """
+    lines: source lines without line end
+    return: [(line_no, style), ...], None if a table may hide titles
+    """
+    titles = []
+    # [(first line, last line), ...] of simple tables, and of table tops
+    # which may start a table, such as after an indented block
+    tables = []
+    count = len(lines)
+    x = 0
+    # line after a title or a table starts a block without blank line
+    block = True
+    while x < count - 1:
+        if not block and lines[x - 1].strip():
+            if SIMPLE_TABLE_TOP.match(lines[x]):
+                tables.append((x, simple_table_end(lines, x)))
+            x += 1
+            continue
+        block = False
+        line = lines[x]
+        if SIMPLE_TABLE_TOP.match(line):
+            # title like lines in table, even a broken one, are not titles
+            tables.append((x, simple_table_end(lines, x)))
+            x = tables[-1][1] + 1
+            block = True
+            continue
+        mo = ADORNMENT.match(line)
+        if mo:
+            # overline title
+            if x + 2 < count and lines[x + 1].strip() \
+                    and lines[x + 2].rstrip() == line.rstrip():
+                titles.append((x, mo.group(1) * 2))
+                x += 3
+                block = True
+                continue
+        elif line[:1].strip() and not NOT_TITLE.match(line):
+            # underline title
+            underline = lines[x + 1].rstrip()
+            mo = ADORNMENT.match(underline)
+            if mo and (len(underline) >= 4 or
+                       len(underline) >= utils.column_width(line.rstrip())):
+                titles.append((x, mo.group(1)))
+                x += 2
+                block = True
+                continue
+        x += 1
+    # title in table, or title after table which misses a blank line
+    for start, end in tables:
+        for line_no, style in titles:
+            if start < line_no <= end + 1:
+                logger.debug('line %s: title in table' % (line_no + 1))
+                return None
+    return titles
+
+
+def _findall(node):
+    if hasattr(node, 'findall'):
+        return node.findall()
+    return node.traverse()
+
+
+def chunk_signature(chunk):
+    """
+    everything of parsed chunk which other chunks may depend on: structure,
+    names, ids, references and text of titles, labels and substitutions
+    """
+    signature = []
+    for node in _findall(chunk):
+        if isinstance(node, nodes.Text):
+            parent = node.parent
+            while parent is not None and not isinstance(parent, GLOBAL_TEXT):
+                parent = parent.parent
+            if parent is not None:
+                signature.append(node.astext())
+            continue
+        signature.append((node.__class__.__name__, sorted(
+            (name, repr(value)) for name, value in node.attributes.items()
+            if name != 'source')))
+        if isinstance(node, nodes.pending):
+            signature.append(repr(node.details))
+    if chunk.parse_messages:
+        signature.append('parse messages')
+    return signature
+
+
+def defined_names(chunk):
+    """
+    return: {name: True if only implicit targets define it, ...}, names of
+    substitutions start with "|"
+
+    Implicit targets are section titles and named hyperlink references, which
+    are noted again in document as rst parser does.
+    """
+    names = {}
+    for node in _findall(chunk):
+        if not isinstance(node, nodes.Element):
+            continue
+        keys = node['names'] + node['dupnames']
+        if isinstance(node, nodes.substitution_definition):
+            keys = ['|' + key for key in keys]
+        for key in keys:
+            implicit = isinstance(node, nodes.section) or (
+                isinstance(node, nodes.target) and not chunk.nametypes.get(key, True))
+            names[key] = names.get(key, True) and implicit
+    return names
+
+
+class IncrementalReader(standalone.Reader):
+    """ standalone reader which builds document from cached chunks """
+    def __init__(self, sections, parser=None, parser_name=None):
+        super(IncrementalReader, self).__init__(parser, parser_name)
+        self.sections = sections
+
+    def parse(self):
+        self.document = document = self.new_document()
+        try:
+            if self.sections.build(self.input, document, self.parser):
+                return
+        except Exception as err:
+            logger.error('incremental parse: %s' % err)
+        self.sections.last_chunks = None
+        self.document = document = self.new_document()
+        self.parser.parse(self.input, document)
+        document.current_source = document.current_line = None
+
+
+class ChunkReader(standalone.Reader):
+    """ reader of one parsed chunk nested in empty sections """
+    # title of parent sections, which is not used by chunk
+    parent_title = 'meditor chunk parent'
+
+    def __init__(self, sections, parser=None, parser_name=None):
+        super(ChunkReader, self).__init__(parser, parser_name)
+        self.sections = sections
+        self.chunk = None
+        self.section_level = 0
+        # first line of chunk in document
+        self.line_offset = 0
+
+    def parse(self):
+        self.document = document = self.new_document()
+        parent = document
+        for x in range(self.section_level):
+            section = nodes.section()
+            section += nodes.title(self.parent_title, self.parent_title)
+            # table of contents in chunk needs ids of all sections
+            document.set_id(section)
+            parent += section
+            parent = section
+        for node in self.sections.graft(self.chunk, parent, self.line_offset):
+            node.chunk_index = 0
+
+
+class FragmentTranslator(html5_polyglot.HTMLTranslator):
+    """ html5 translator which marks html of chunks """
+    def __init__(self, document):
+        super(FragmentTranslator, self).__init__(document)
+        self.chunk_stack = [-1]
+        # section level of chunk when it is visited
+        self.chunk_levels = {}
+        self.has_messages = False
+
+    def chunkOwner(self, node):
+        """ return: index of chunk which node is the root of, None if not a root """
+        index = getattr(node, 'chunk_index', None)
+        if index is None and isinstance(node, nodes.title) and \
+                getattr(node.parent, 'chunk_index', None) is not None:
+            # section title is changed by "contents" and "sectnum", which is
+            # kept as a part of document
+            index = -1
+        return index
+
+    def dispatch_visit(self, node):
+        index = self.chunkOwner(node)
+        if index is None:
+            return super(FragmentTranslator, self).dispatch_visit(node)
+        if index >= 0:
+            self.chunk_levels.setdefault(index, self.section_level)
+        self.chunk_stack.append(index)
+        self.body.append(CHUNK_MARK % index)
+        try:
+            return super(FragmentTranslator, self).dispatch_visit(node)
+        except nodes.SkipNode:
+            self.leaveChunk()
+            raise
+        except nodes.SkipDeparture:
+            # end of chunk is unknown
+            self.chunk_levels[self.chunk_stack[-2]] = None
+            raise
+
+    def dispatch_departure(self, node):
+        index = self.chunkOwner(node)
+        if index is not None and index >= 0:
+            # end tag is a piece whether child chunks are before it or not
+            self.body.append(CHUNK_MARK % index)
+        super(FragmentTranslator, self).dispatch_departure(node)
+        if index is not None:
+            self.leaveChunk()
+
+    def visit_system_message(self, node):
+        self.has_messages = True
+        super(FragmentTranslator, self).visit_system_message(node)
+
+    def leaveChunk(self):
+        self.chunk_stack.pop()
+        self.body.append(CHUNK_MARK % self.chunk_stack[-1])
+
+
+def split_fragments(html):
+    """
+    html: writer output with chunk marks
+    return: html without marks, [(chunk index, html), ...]
+    """
+    parts = CHUNK_MARK_REGEX.split(html)
+    pieces = [(-1, parts[0])]
+    for x in range(1, len(parts), 2):
+        index = int(parts[x])
+        # empty html of chunk between its child chunks
+        if index < 0 or parts[x + 1]:
+            pieces.append((index, parts[x + 1]))
+    return ''.join(parts[::2]), pieces
+
+
+def strip_last(pieces):
+    """ return: pieces without new lines at end of the last one """
+    return pieces[:-1] + [pieces[-1].rstrip('\n')] if pieces else pieces
+
+
+class FragmentCache(object):
+    """
+    html of chunks in the last render
+
+    render_chunk: function(chunk, section_level, line_offset) returns html
+    pieces of chunk rendered alone
+    """
+    def __init__(self, sections, render_chunk):
+        self.sections = sections
+        self.render_chunk = render_chunk
+        # result of chunk rendered alone is the same as in document
+        self._standalone = OrderedDict()
+        self.clear()
+
+    def clear(self):
+        self._chunks = None
+        self._pieces = None
+        self._levels = None
+        self._has_messages = False
+
+    def record(self, pieces, levels, has_messages):
+        """ save chunks and html of a render of whole document """
+        chunks = self.sections.last_chunks
+        if not chunks or not pieces:
+            self.clear()
+            return
+        self._chunks = chunks
+        self._pieces = pieces
+        self._levels = levels
+        self._has_messages = has_messages
+
+    def isStandalone(self, x):
+        """ chunk x renders alone as in document """
+        key, level, lines, chunk = self._chunks[x]
+        section_level = self._levels.get(x)
+        if section_level is None:
+            return False
+        start = sum(chunk_lines for _, _, chunk_lines, _ in self._chunks[:x])
+        # line numbers of messages depend on start
+        cache_key = (key, section_level, start)
+        if cache_key not in self._standalone:
+            pieces = [text for index, text in self._pieces if index == x]
+            html = self.render_chunk(chunk, section_level, start)
+            self._standalone[cache_key] = strip_last(html) == strip_last(pieces)
+            while len(self._standalone) > 2000:
+                self._standalone.popitem(last=False)
+        return self._standalone[cache_key]
+
+    def render(self, text, parser, settings):
+        """ return: html by replacing edited chunks, or None """
+        if not self._chunks:
+            return None
+        bounds = self.sections.split(text)
+        if not bounds or len(bounds) != len(self._chunks):
+            return None
+        edited = []
+        for x, (start, end, level, chunk_text, key) in enumerate(bounds):
+            old_key, old_level, old_lines, old_chunk = self._chunks[x]
+            if level != old_level:
+                return None
+            if key != old_key:
+                edited.append(x)
+        # too many for rendering one by one
+        if len(edited) > 2:
+            return None
+        pieces = list(self._pieces)
+        chunks = list(self._chunks)
+        for x in edited:
+            start, end, level, chunk_text, key = bounds[x]
+            old_key, old_level, old_lines, old_chunk = self._chunks[x]
+            # line numbers of messages in other chunks are changed
+            if self._has_messages and end - start != old_lines:
+                return None
+            if not self.isStandalone(x):
+                return None
+            chunk = self.sections.parse(
+                key, chunk_text, parser, settings, StringInput.default_source_path)
+            if chunk_signature(chunk) != chunk_signature(old_chunk):
+                return None
+            section_level = self._levels[x]
+            new_pieces = strip_last(self.render_chunk(chunk, section_level, start))
+            indexes = [i for i, (index, _) in enumerate(pieces) if index == x]
+            if not new_pieces or len(new_pieces) != len(indexes):
+                return None
+            # new lines at end of document is stripped by writer
+            old_last = pieces[indexes[-1]][1]
+            new_pieces[-1] += old_last[len(old_last.rstrip('\n')):]
+            for i, html in zip(indexes, new_pieces):
+                pieces[i] = (x, html)
+            chunks[x] = (key, level, end - start, chunk)
+            self._standalone[(key, section_level, start)] = True
+        self._chunks = chunks
+        self._pieces = pieces
+        logger.debug('incremental render: %s/%s chunks' % (len(edited), len(chunks)))
+        return ''.join(html for _, html in pieces)
+
+
+class SectionCache(object):
+    """ parsed doctree of every chunk, keyed by hash of chunk text """
+    def __init__(self, max_chunks=2000):
+        self._max_chunks = max_chunks
+        self._chunks = OrderedDict()
+        self._parsed = 0
+        # [(key, level, number of lines, chunk), ...] of last built document
+        self.last_chunks = None
+
+    def split(self, text):
+        """
+        return: [(start line, end line, level, text, key), ...] of chunks,
+        None if no title
+        """
+        lines = text.splitlines(True)
+        titles = scan_titles([line.rstrip('\r\n') for line in lines])
+        if not titles:
+            return None
+        styles = []
+        bounds = [(0, 0)]
+        for line_no, style in titles:
+            if style not in styles:
+                styles.append(style)
+            bounds.append((line_no, styles.index(style) + 1))
+        bounds.append((len(lines), 0))
+        chunks = []
+        for x in range(len(bounds) - 1):
+            start, level = bounds[x]
+            end = bounds[x + 1][0]
+            chunk_text = ''.join(lines[start:end])
+            key = hashlib.sha1(chunk_text.encode('utf-8', errors='surrogateescape')).digest()
+            chunks.append((start, end, level, chunk_text, key))
+        return chunks
+
+    def parse(self, key, text, parser, settings, source):
+        """ return: cached doctree of chunk """
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = utils.new_document(source, settings)
+            parser.parse(text, chunk)
+            # or copied nodes take them as a whole parse does not
+            chunk.current_source = chunk.current_line = None
+            # titles which are not found by scan_titles
+            chunk.section_count = sum(
+                isinstance(node, nodes.section) for node in _findall(chunk))
+            chunk.defined_names = defined_names(chunk)
+            self._chunks[key] = chunk
+            self._parsed += 1
+        else:
+            self._chunks.move_to_end(key)
+        return chunk
+
+    def build(self, text, document, parser):
+        """ populate document. return False if could not split """
+        self.last_chunks = None
+        bounds = self.split(text)
+        if not bounds:
+            return False
+        self._parsed = 0
+        last_chunks = []
+        stack = [document]
+        names = {}
+        for x, (start, end, level, chunk_text, key) in enumerate(bounds):
+            chunk = self.parse(
+                key, chunk_text, parser, document.settings, document.get('source', ''))
+            last_chunks.append((key, level, end - start, chunk))
+
+            if chunk.section_count != min(level, 1):
+                logger.debug('line %s: unknown title' % (start + 1))
+                return False
+            # ids and messages of duplicate names depend on the whole parse,
+            # such as substitutions, citations, explicit targets and "contents"
+            for name, implicit in chunk.defined_names.items():
+                if name in names and not (implicit and names[name]):
+                    logger.debug('line %s: duplicate name "%s"' % (start + 1, name))
+                    return False
+                names[name] = implicit
+            if level == 0:
+                parent = document
+            else:
+                if len(chunk.children) != 1 or not isinstance(chunk[0], nodes.section):
+                    logger.debug('line %s: not a section' % (start + 1))
+                    return False
+                if level > len(stack):
+                    logger.debug('line %s: inconsistent title level' % (start + 1))
+                    return False
+                del stack[level:]
+                parent = stack[level - 1]
+            children = self.graft(chunk, parent, start)
+            for child in children:
+                child.chunk_index = x
+            if level > 0:
+                stack.append(children[0])
+
+        # transforms report messages at the end of source, as a whole parse
+        get_line = getattr(chunk.reporter, 'get_source_and_line', None)
+        if get_line:
+            document.reporter.get_source_and_line = partial(self.sourceLine, get_line, start)
+
+        while len(self._chunks) > max(self._max_chunks, len(bounds)):
+            self._chunks.popitem(last=False)
+        logger.debug('incremental parse: %s/%s chunks' % (self._parsed, len(bounds)))
+        self.last_chunks = last_chunks
+        return True
+
+    def sourceLine(self, get_line, line_offset, lineno=None):
+        """ line of last chunk in document """
+        if lineno is not None:
+            lineno -= line_offset
+        source, line = get_line(lineno)
+        if line is not None:
+            line += line_offset
+        return source, line
+
+    def graft(self, chunk, parent, line_offset):
+        """ copy nodes of chunk into parent and register them to document """
+        document = parent.document
+        children = [child.deepcopy() for child in chunk.children]
+        tree = [node for child in children for node in _findall(child)]
+        parent.extend(children)
+        old_ids = {}
+        for node in tree:
+            node.document = document
+            if node.line is not None:
+                node.line += line_offset
+            if not isinstance(node, nodes.Element):
+                continue
+            if isinstance(node, nodes.system_message) and node.get('line'):
+                node['line'] += line_offset
+            if isinstance(node, nodes.pending):
+                node.details = copy.deepcopy(node.details)
+            for old_id in node['ids']:
+                old_ids[old_id] = node
+            node['ids'] = []
+        local_names = set()
+        for node in tree:
+            if isinstance(node, nodes.Element):
+                self.register(document, node, chunk.nametypes, local_names)
+        # ids of which are not registered by names
+        for node in old_ids.values():
+            if not node['ids']:
+                document.set_id(node)
+        for node in tree:
+            if not isinstance(node, nodes.Element):
+                continue
+            refid = node.get('refid')
+            if refid in old_ids:
+                node['refid'] = old_ids[refid]['ids'][0]
+            if refid:
+                document.note_refid(node)
+            if node.get('backrefs'):
+                node['backrefs'] = [
+                    old_ids[i]['ids'][0] if i in old_ids else i
+                    for i in node['backrefs']]
+        for msg in chunk.parse_messages:
+            if msg.parent is None:
+                msg = msg.deepcopy()
+                msg.document = document
+                if msg.get('line'):
+                    msg['line'] += line_offset
+                document.parse_messages.append(msg)
+        return children
+
+    def register(self, document, node, nametypes, local_names):
+        """ take note of node like rst parser """
+        names = node['names'] + node['dupnames']
+        node['names'] = names
+        node['dupnames'] = []
+        if isinstance(node, nodes.substitution_definition):
+            node['names'] = []
+            if names:
+                document.note_substitution_def(node, names[0])
+                if not node['names'] and not node['dupnames']:
+                    node['names'].append(nodes.whitespace_normalize_name(names[0]))
+            return
+        if isinstance(node, nodes.footnote):
+            auto = node.get('auto')
+            if auto == 1:
+                document.note_autofootnote(node)
+            elif auto == '*':
+                document.note_symbol_footnote(node)
+            else:
+                document.note_footnote(node)
+        elif isinstance(node, nodes.citation):
+            document.note_citation(node)
+        elif isinstance(node, nodes.footnote_reference):
+            auto = node.get('auto')
+            if auto == 1:
+                document.note_autofootnote_ref(node)
+            elif auto == '*':
+                document.note_symbol_footnote_ref(node)
+            if node.get('refname'):
+                document.note_footnote_ref(node)
+            return
+        elif isinstance(node, nodes.citation_reference):
+            document.note_citation_ref(node)
+            return
+        elif isinstance(node, nodes.substitution_reference):
+            document.note_substitution_ref(node, node['refname'])
+        elif isinstance(node, nodes.pending):
+            document.note_pending(node)
+        elif isinstance(node, nodes.target):
+            if node.get('refname'):
+                document.note_indirect_target(node)
+            if node.get('anonymous'):
+                document.note_anonymous_target(node)
+        elif isinstance(node, nodes.reference):
+            if node.get('refname'):
+                document.note_refname(node)
+            if node.get('anonymous') and hasattr(document, 'note_anonymous_ref'):
+                document.note_anonymous_ref(node)
+        if not node['names']:
+            return
+        # names in the same chunk are reported by parser already, names of
+        # other chunks are implicit targets only, see "build"
+        local = any(name in local_names for name in names)
+        local_names.update(names)
+        if not local and isinstance(node, nodes.section):
+            msgnode = node
+        else:
+            msgnode = nodes.container()
+        if isinstance(node, nodes.section) or not nametypes.get(names[0], True):
+            document.note_implicit_target(node, msgnode)
+        else:
+            document.note_explicit_target(node, msgnode)
+        if not local and msgnode is not node and msgnode.children:
+            # message of a hyperlink reference is before its paragraph
+            block = node
+            while isinstance(block.parent, nodes.TextElement):
+                block = block.parent
+            parent = block.parent
+            index = parent.index(block)
+            parent[index:index] = msgnode.children
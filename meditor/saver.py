@@ -0,0 +1,111 @@
+"""
+save files in worker threads
+
+GUI thread takes a snapshot of text, a worker thread encodes it, writes it to
+a temporary file in the same directory and replaces the file by it, so the
+file is always complete, either old or new. Result is emitted by the signal of
+editor. Files of different editors are saved at the same time.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SAVE_WORKERS = 4
+
+
+def get_umask():
+    """ return: umask of process, which is read without changing it on Linux """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    # umask is only read by setting it, which changes it for all threads
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# permission of new file, read on import before worker threads start
+UMASK = get_umask()
+
+
+def write_file(filename, text, encoding, fsync=False):
+    """ write text to a temporary file and replace file by it """
+    dir_name, basename = os.path.split(os.path.abspath(filename))
+    fd, temp_name = tempfile.mkstemp(prefix='.%s.' % basename, suffix='.tmp', dir=dir_name)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(text.encode(encoding))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp_name)
+        else:
+            os.chmod(temp_name, 0o666 & ~UMASK)
+        os.replace(temp_name, filename)
+    except BaseException:
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+        raise
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        # entry of new file
+        fd = os.open(dir_name, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class SaveJob(object):
+    """ text snapshot of an editor waiting for writing """
+    def __init__(self, editor, filename, text, encoding, revision, fsync=False):
+        self.editor = editor
+        self.filename = filename
+        self.text = text
+        self.encoding = encoding
+        # revision of document when snapshot is taken
+        self.revision = revision
+        self.fsync = fsync
+        self.error = None
+        self._finished = threading.Event()
+
+    def run(self):
+        try:
+            write_file(self.filename, self.text, self.encoding, self.fsync)
+        except Exception as err:
+            logger.error('Save error: %s' % err)
+            self.error = err
+        self.text = None
+        self._finished.set()
+        try:
+            self.editor.saveDone.emit(self)
+        except RuntimeError as err:
+            # editor has been deleted
+            logger.debug(err)
+
+    def wait(self):
+        self._finished.wait()
+
+
+save_executor = None
+save_executor_lock = threading.Lock()
+
+
+def submit_save(job):
+    global save_executor
+    with save_executor_lock:
+        if save_executor is None:
+            save_executor = ThreadPoolExecutor(
+                max_workers=SAVE_WORKERS, thread_name_prefix='meditor-save')
+    save_executor.submit(job.run)
@@ -0,0 +1,315 @@
+"""
+block tokenizers of reStructuredText lexer
+
+RegexTokenizer tries every block regex of QsciLexerRest at every offset.
+
+LineTokenizer gives the same tokens with a line classifier: the first line of
+a block is recognized by a short regex on one line and the following lines are
+taken by simple line tests, so no multiline regex backtracks. Tables and
+explicit markup labels, which may be searched to the end of text and fail,
+are memorized, so tokenizing is O(n).
+
+Tokens are the same for text with LF line ends only. LineTokenizer splits
+lines at CR, LF and CRLF as Scintilla does, while "." of block regex takes a
+CR and "^" does not match after a lone CR, so blocks of RegexTokenizer may
+run over CR line ends and differ.
+"""
+import re
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+line_end_regex = re.compile(r'\r\n|\r|\n')
+word_regex = re.compile(r'\w')
+adornment_regex = re.compile(r'''[=`'"~^_*+#-]+''')
+enumerated_regex = re.compile(r'\(?(#|\w+)[.)] +\S')
+field_regex = re.compile(r':[ \w\-]+:')
+option_regex = re.compile(r'[\-/]+\w.')
+line2_regex = re.compile(r' +\| ')
+quote_regex = re.compile(r'( {2,})\w.')
+table1_regex = re.compile(r'( *)[\-+]{3,}')
+table2_regex = re.compile(r'( *)={2,} [= ]+')
+equals_regex = re.compile(r'=+')
+literal3_regex = re.compile(r'\.\. +code::', re.IGNORECASE)
+directive_regex = re.compile(r'\.\. +[\-\w]+::')
+comment_regex = re.compile(r'\.\. +[\-\w]')
+colon_regex = re.compile(r':+')
+
+
+class RegexTokenizer(object):
+    def __init__(self, block_tokens):
+        """ block_tokens: [(key, compiled regex), ...] """
+        self.block_tokens = block_tokens
+
+    def tokenize(self, text):
+        """ yield: (key, start, end) """
+        offset = 0
+        while offset < len(text):
+            mo = None
+            for key, tok in self.block_tokens:
+                mo = tok.match(text, offset)
+                if mo:
+                    break
+            assert mo, text[offset:]
+            yield key, offset, mo.end()
+            offset = mo.end()
+
+
+class LineTokenizer(object):
+    def tokenize(self, text):
+        """ yield: (key, start, end) """
+        return LineScanner(text).tokenize()
+
+
+def is_indented1(line):
+    return line[:1] == ' '
+
+
+def is_indented2(line):
+    return len(line) > 2 and line[:2] == '  '
+
+
+def is_indented3(line):
+    return len(line) > 3 and line[:3] == '   '
+
+
+def is_quoted(line):
+    return line[:1] == '>'
+
+
+def is_table1_tail(line, indent):
+    """ line: indent + [|+] + .+ + indent + [-+]{3,} """
+    head = len(line.rstrip('-+'))
+    if len(line) - head < 3:
+        return False
+    if indent == 0:
+        return len(line) >= 5
+    return head - indent >= indent + 2 and line[head - indent:head] == ' ' * indent
+
+
+def is_table2_tail(line, indent):
+    """ line: indent + .{4,} + indent + ={2,} + ' ' + [= ]+ """
+    for mo in equals_regex.finditer(line, len(line.rstrip('= '))):
+        start, end = mo.span()
+        if end - start < 2 or end > len(line) - 2:
+            continue
+        if indent == 0:
+            if end >= 6:
+                return True
+        elif start >= indent * 2 + 4 and line[start - indent:start] == ' ' * indent:
+            return True
+    return False
+
+
+class LineScanner(object):
+    """ tokenize one text, lines end with CR, LF or CRLF """
+    def __init__(self, text):
+        self.text = text
+        # line content without line end
+        self.lines = []
+        self.starts = []
+        self.nexts = []
+        pos = 0
+        for mo in line_end_regex.finditer(text):
+            self.lines.append(text[pos:mo.start()])
+            self.starts.append(pos)
+            pos = mo.end()
+            self.nexts.append(pos)
+        if pos < len(text):
+            self.lines.append(text[pos:])
+            self.starts.append(pos)
+            self.nexts.append(len(text))
+        self.count = len(self.lines)
+        # last line may be without line end
+        self.last_newline = text[-1:] in ('\r', '\n')
+        self._found = {}
+        self._tables = {}
+
+    def has_newline(self, line_no):
+        return line_no < self.count - 1 or self.last_newline
+
+    def find(self, char, pos):
+        """ find char from pos, return length of text if not found """
+        start, found = self._found.get(char, (-1, -1))
+        if start <= pos <= found:
+            return found
+        found = self.text.find(char, pos)
+        if found < 0:
+            found = len(self.text)
+        self._found[char] = (pos, found)
+        return found
+
+    def line_at(self, pos):
+        return bisect.bisect_right(self.starts, pos) - 1
+
+    def follow(self, last, test):
+        """
+        take following lines which pass test, blank lines between them
+        return: number of last line
+        """
+        lines = self.lines
+        x = last + 1
+        while True:
+            while x < self.count and not lines[x]:
+                x += 1
+            if x < self.count and self.has_newline(x) and test(lines[x]):
+                last = x
+                x += 1
+            else:
+                return last
+
+    def table(self, kind, line_no, indent, is_row, is_tail):
+        """ return: number of last line of table or None """
+        first = line_no + 1
+        if first >= self.count or not is_row(self.lines[first], indent):
+            return None
+        key = (kind, first, indent)
+        if key not in self._tables:
+            end = first
+            while end < self.count and is_row(self.lines[end], indent):
+                end += 1
+            last = None
+            for x in range(end - 1, first - 1, -1):
+                if last is None and self.has_newline(x) and is_tail(self.lines[x], indent):
+                    last = x
+                self._tables[(kind, x, indent)] = last
+        return self._tables[key]
+
+    def block(self, line_no):
+        """ return: (key, end) of block token at line start or None """
+        lines = self.lines
+        nexts = self.nexts
+        count = self.count
+        line = lines[line_no]
+        # all of block tokens end with a line end
+        if not self.has_newline(line_no):
+            return None
+        has_next = line_no + 1 < count and self.has_newline(line_no + 1)
+        has_next2 = has_next and line_no + 2 < count and self.has_newline(line_no + 2)
+        if not line:
+            if has_next2 and not lines[line_no + 2] and len(lines[line_no + 1]) >= 4 and \
+                    adornment_regex.fullmatch(lines[line_no + 1]):
+                return 'transition', nexts[line_no + 2]
+            return None
+        char = line[0]
+        is_word = word_regex.match(char)
+        if has_next2 and adornment_regex.fullmatch(line) and lines[line_no + 2] == line and \
+                len(lines[line_no + 1]) >= 2 and word_regex.match(lines[line_no + 1]):
+            return 'title', nexts[line_no + 2]
+        if is_word and has_next and adornment_regex.fullmatch(lines[line_no + 1]):
+            return 'section', nexts[line_no + 1]
+        if char in '-+*' and len(line) >= 3 and line[1] == ' ':
+            return 'bullet', nexts[self.follow(line_no, is_indented2)]
+        if enumerated_regex.match(line):
+            return 'enumerated', nexts[self.follow(line_no, is_indented2)]
+        if char == ':' and field_regex.match(line):
+            return 'field', nexts[self.follow(line_no, is_indented1)]
+        if char in '-/' and option_regex.match(line):
+            return 'option', nexts[self.follow(line_no, is_indented1)]
+        if line.startswith('| '):
+            last = line_no
+            while last + 1 < count and self.has_newline(last + 1) and \
+                    is_indented1(lines[last + 1]):
+                last += 1
+            return 'line', nexts[last]
+        if char == ' ':
+            if line2_regex.match(line):
+                return 'line2', nexts[line_no]
+            mo = quote_regex.match(line)
+            if mo:
+                indent = mo.group(1)
+                last = self.follow(
+                    line_no,
+                    lambda x: len(x) > len(indent) and x.startswith(indent))
+                return 'quote', nexts[last]
+        if is_word and has_next and is_indented1(lines[line_no + 1]):
+            return 'definition', nexts[self.follow(line_no + 1, is_indented1)]
+        if line.startswith('>>> ') and len(line) > 4:
+            return 'doctest', nexts[line_no]
+        if char in ' -+':
+            mo = table1_regex.fullmatch(line)
+            if mo:
+                last = self.table(
+                    'table1', line_no, len(mo.group(1)),
+                    lambda x, indent: len(x) >= indent + 2 and x[indent:indent + 1] in ('|', '+')
+                    and x[:indent] == ' ' * indent,
+                    is_table1_tail)
+                if last is not None:
+                    return 'table1', nexts[last]
+        if char in ' =':
+            mo = table2_regex.fullmatch(line)
+            if mo:
+                last = self.table(
+                    'table2', line_no, len(mo.group(1)),
+                    lambda x, indent: len(x) >= indent + 4 and x[:indent] == ' ' * indent,
+                    is_table2_tail)
+                if last is not None:
+                    return 'table2', nexts[last]
+        if line.startswith('..'):
+            if literal3_regex.match(line) and line_no + 1 < count and not lines[line_no + 1]:
+                return 'literal3', nexts[self.follow(line_no + 1, is_indented2)]
+            if directive_regex.match(line):
+                return 'directive', nexts[self.follow(line_no, is_indented2)]
+            start = self.starts[line_no] + 4
+            if line.startswith('.. ['):
+                pos = self.find(']', start)
+                if start < pos < len(self.text) - 2 and self.text[pos + 1] == ' ':
+                    last = self.line_at(pos)
+                    if pos + 2 < self.starts[last] + len(lines[last]) and self.has_newline(last):
+                        return 'footnote', nexts[self.follow(last, is_indented3)]
+            if line.startswith('.. _'):
+                pos = self.find(':', start)
+                if start < pos < len(self.text) - 1 and self.text[pos + 1] == ' ':
+                    last = self.line_at(pos)
+                    if self.has_newline(last):
+                        return 'target1', nexts[last]
+            if comment_regex.match(line):
+                return 'comment', nexts[self.follow(line_no, is_indented2)]
+        if line.startswith('__ ') and len(line) > 3:
+            return 'target2', nexts[line_no]
+        return None
+
+    def literal(self, line_no, test):
+        """ '::' at line end, a blank line and lines passed test """
+        if line_no + 1 >= self.count or self.lines[line_no + 1]:
+            return None
+        last = self.follow(line_no + 1, test)
+        if last == line_no + 1:
+            return None
+        return self.nexts[last]
+
+    def inline(self, line_no, pos):
+        """ return: (key, end) of token in line """
+        line_end = self.starts[line_no] + len(self.lines[line_no])
+        if pos == line_end:
+            last = line_no
+            while last + 1 < self.count and not self.lines[last + 1]:
+                last += 1
+            return 'newline', self.nexts[last]
+        if self.text[pos] == ':':
+            if pos + 2 == line_end and self.text[pos + 1] == ':' and self.has_newline(line_no):
+                end = self.literal(line_no, is_indented1)
+                if end is not None:
+                    return 'literal', end
+                end = self.literal(line_no, is_quoted)
+                if end is not None:
+                    return 'literal2', end
+            return 'colon', colon_regex.match(self.text, pos, line_end).end()
+        end = self.text.find(':', pos, line_end)
+        return 'string', line_end if end < 0 else end
+
+    def tokenize(self):
+        pos = 0
+        line_no = 0
+        while pos < len(self.text):
+            token = None
+            if pos == self.starts[line_no]:
+                token = self.block(line_no)
+            if token is None:
+                token = self.inline(line_no, pos)
+            key, end = token
+            yield key, pos, end
+            pos = end
+            while line_no + 1 < self.count and self.starts[line_no + 1] <= pos:
+                line_no += 1
@@ -0,0 +1,97 @@
+"""
+tokenize reStructuredText in a worker thread
+
+GUI thread submits a text snapshot with the document revision, worker thread
+tokenizes it and sends compact style runs back by the signal of lexer. Styles
+are applied in GUI thread only if the revision is still current.
+"""
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+run_regex = re.compile(rb'(.)\1*', re.DOTALL)
+
+
+def style_runs(styles):
+    """ styles: style of every byte. return: [(style, length), ...] """
+    return [(styles[mo.start()], mo.end() - mo.start()) for mo in run_regex.finditer(styles)]
+
+
+def expand_runs(runs):
+    """ return: style of every byte """
+    return b''.join(bytes((style,)) * length for style, length in runs)
+
+
+class StylingJob(object):
+    """ text snapshot of a lexer waiting for tokenizing """
+    def __init__(self, lexer, revision, start, text):
+        self.lexer = lexer
+        self.revision = revision
+        self.start = start
+        self.text = text
+        # None if tokenizing failed
+        self.runs = None
+        self.states = None
+
+
+class StylingWorker(object):
+    """
+    latest-wins tokenizer thread shared by all lexers
+
+    Only the newest job of every lexer is kept in queue. Result is emitted by
+    "lexer.stylingDone" and received in GUI thread.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._thread = None
+
+    def submit(self, job):
+        with self._cond:
+            self._jobs[id(job.lexer)] = job
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='meditor-styling', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, lexer):
+        with self._cond:
+            self._jobs.pop(id(lexer), None)
+
+    def _take(self):
+        with self._cond:
+            while not self._jobs:
+                self._cond.wait()
+            key = next(iter(self._jobs))
+            return self._jobs.pop(key)
+
+    def _run(self):
+        while True:
+            job = self._take()
+            try:
+                styles, job.states = job.lexer.tokenizeText(job.text)
+                job.runs = style_runs(styles)
+            except Exception as err:
+                # GUI thread styles it again
+                logger.error('Styling error: %s' % err)
+            job.text = None
+            try:
+                job.lexer.stylingDone.emit(job)
+            except RuntimeError as err:
+                # lexer has been deleted
+                logger.debug(err)
+
+
+styling_worker = None
+styling_worker_lock = threading.Lock()
+
+
+def get_styling_worker():
+    global styling_worker
+    with styling_worker_lock:
+        if styling_worker is None:
+            styling_worker = StylingWorker()
+        return styling_worker
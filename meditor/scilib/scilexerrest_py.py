@@ -1,14 +1,124 @@
 import re
+import bisect
 import os.path
 import logging
+import threading
+import itertools
 
 from PyQt5 import Qsci, QtGui, QtCore
 from PyQt5.Qsci import QsciScintilla
 
 from .. import __home_data_path__, __data_path__, globalvars
+from .rest_tokenizer import RegexTokenizer, LineTokenizer
+from .rest_worker import StylingJob, get_styling_worker, expand_runs
 
 logger = logging.getLogger(__name__)
 
+# line state: lexer tag, style at line start and flags
+LINE_TAG = 0xffffff
+LINE_STYLE_SHIFT = 24
+LINE_TOKEN_START = 1 << 29
+LINE_STYLED = 1 << 30
+# line states of other lexer are ignored
+line_tags = itertools.count(1)
+# a line which is not indented, quoted or adornment of transition
+clean_line_regex = re.compile(r'''(?![=`'"~^_*+#-]+\s*$)[^\s>]''')
+# lines as Scintilla, only split by CR, LF and CRLF
+line_regex = re.compile(r'''[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+''')
+
+# LexerResources, key: (properties file, mtime)
+lexer_resources = {}
+lexer_resources_lock = threading.Lock()
+
+
+class LexerResources(object):
+    """ compiled patterns and resolved styles, shared by all lexers """
+    def __init__(self, lexer_class, rst_prop_file=None):
+        self.rstyles = dict(zip(*(lexer_class.styles.values(), lexer_class.styles.keys())))
+        self.inline_rstyles = dict(zip(
+            *(lexer_class.inline_styles.values(), lexer_class.inline_styles.keys())))
+
+        self.block_tokens = []
+        self.inline_tokens = []
+        for key, regex in lexer_class.token_regex:
+            if key.startswith('in_'):
+                # search in all of lines, a token does not cross line end
+                self.inline_tokens.append((key, re.compile(
+                    regex,
+                    re.UNICODE | re.MULTILINE | re.IGNORECASE,
+                )))
+            else:
+                self.block_tokens.append((key, re.compile(
+                    regex,
+                    re.UNICODE | re.MULTILINE | re.IGNORECASE,
+                )))
+
+        # style: {'color': QColor, 'paper': QColor, 'font': QFont}
+        self.style_table = {}
+        logger.debug('Loading properties')
+        for style, value in lexer_class.properties.items():
+            self.do_read_style(value.split(','), style)
+        if rst_prop_file:
+            logger.debug('Loading %s', rst_prop_file)
+            self.readConfig(lexer_class, rst_prop_file)
+
+    def do_read_style(self, prop_list, style):
+        table = self.style_table.setdefault(style, {})
+        font = QtGui.QFont(table['font']) if 'font' in table else QtGui.QFont()
+        for prop in prop_list:
+            if prop.startswith('face:'):
+                table['color'] = QtGui.QColor(prop.split(':')[1])
+            elif prop.startswith('back:'):
+                table['paper'] = QtGui.QColor(prop.split(':')[1])
+            else:
+                if ':' in prop:
+                    continue
+                if prop.startswith('$(font.'):
+                    mo = re.match(r'^\$\(font\.(.+)\)', prop)
+                    font = QtGui.QFont(mo.group(1))
+                elif prop == 'bold':
+                    font.setBold(True)
+                elif prop == 'italic':
+                    font.setItalic(True)
+                elif prop == 'underline':
+                    font.setUnderline(True)
+                table['font'] = QtGui.QFont(font)
+
+    def readConfig(self, lexer_class, rst_prop_file):
+        prop_settings = QtCore.QSettings(rst_prop_file, QtCore.QSettings.IniFormat)
+        for style in lexer_class.properties.keys():
+            value = prop_settings.value('style.rst.%s' % style, type=str)
+            if not value:
+                continue
+            if isinstance(value, str):
+                v = value.split(',')
+            else:
+                v = value
+            self.do_read_style(v, style)
+
+
+def get_lexer_resources(lexer_class):
+    """ reload resources if rst.properties is changed """
+    rst_prop_files = [
+        os.path.join(__home_data_path__, 'rst.properties'),
+        os.path.join(__data_path__, 'rst.properties'),
+    ]
+    for rst_prop_file in rst_prop_files:
+        if os.path.exists(rst_prop_file):
+            mtime = os.path.getmtime(rst_prop_file)
+            break
+    else:
+        rst_prop_file = mtime = None
+    key = (rst_prop_file, mtime)
+    with lexer_resources_lock:
+        resources = lexer_resources.get(key)
+        if resources is None:
+            resources = LexerResources(lexer_class, rst_prop_file)
+            # only the newest one is used
+            lexer_resources.clear()
+            lexer_resources[key] = resources
+        return resources
+
 
 class QsciLexerRest(Qsci.QsciLexerCustom):
     keyword_list = [
@@ -156,59 +266,74 @@ class QsciLexerRest(Qsci.QsciLexerCustom):
         ('in_emphasis', r'''(\*\w[^*\r\n]*\*)'''),
         ('in_strong',   r'''(\*{2}\w[^*\r\n]*\*{2})'''),
         ('in_literal',  r'''(`{2}\w[^`\r\n]*`{2})'''),
-        ('in_url1',     r'''\W(\w+://[\w\-\.:/]+)\W'''),
+        ('in_url1',     r'''[^\w\r\n](\w+://[\w\-\.:/]+)\W'''),
         ('in_url2',     r'''^(\w+://[\w\-\.:/]+)\W'''),
-        ('in_link1',    r'''\W(\w+_)\W'''),
+        ('in_link1',    r'''[^\w\r\n](\w+_)\W'''),
         ('in_link2',    r'''(`\w[^`\r\n]*`_)'''),
         ('in_footnote', r'''(\[[\w*#]+\]_)'''),
-        ('in_substitution', r'''(\|\w[^\|]*\|)'''),
+        ('in_substitution', r'''(\|\w[^\|\r\n]*\|)'''),
         ('in_target',    r'''(_`\w[^`\r\n]*`)'''),
         ('in_reference', r'''(:\w+:`\w+`)'''),
         ('in_directive', r'''^\.{2} +(%s):{2}''' % '|'.join(keyword_list)),
-        ('in_field',     r'''^:([^:]+):[ \r\n]'''),
+        ('in_field',     r'''^:([^:\r\n]+):[ \r\n]'''),
         ('in_unusedspace', r'''( +)(\r\n?|\n)'''),
     ]
     block_tokens = None
     inline_tokens = None
+    tokenizer = None
+    # text before it is not modified since last styling
+    _modified_end = 0
+    # tokenize in worker thread if text is not less than async_min_bytes
+    async_min_bytes = 64 * 1024
+    stylingDone = QtCore.pyqtSignal(object)
+    _async = False
+    # increased by every modification
+    _revision = 0
+    # range waiting for styles of worker thread
+    _pending = None
+    _job = None
+    # style lines on screen first, the former text is styled in idle time
+    viewport_margin = 100
+    viewport_min_bytes = 256 * 1024
+    idle_slice_bytes = 32 * 1024
+    # percent of styled text
+    stylingProgress = QtCore.pyqtSignal(int)
+    _viewport = False
+    # unstyled ranges before viewport: [[start, end], ...]
+    _unstyled = None
+    _progress = 100
 
     def __init__(self, parent=None):
         super(QsciLexerRest, self).__init__(parent)
-        self.rstyles = dict(zip(*(self.styles.values(), self.styles.keys())))
-        self.inline_rstyles = dict(zip(*(self.inline_styles.values(), self.inline_styles.keys())))
+        resources = get_lexer_resources(QsciLexerRest)
+        self.rstyles = resources.rstyles
+        self.inline_rstyles = resources.inline_rstyles
 
         self.setDefaultColor(QtGui.QColor('#000000'))
         self.setDefaultPaper(QtGui.QColor('#ffffff'))
         self.setDefaultFont(QtGui.QFont())
 
-        self.block_tokens = []
-        self.inline_tokens = []
-        for key, regex in self.token_regex:
-            if key.startswith('in_'):
-                self.inline_tokens.append((key, re.compile(
-                    regex,
-                    re.UNICODE | re.IGNORECASE,
-                )))
-            else:
-                self.block_tokens.append((key, re.compile(
-                    regex,
-                    re.UNICODE | re.MULTILINE | re.IGNORECASE,
-                )))
+        self.block_tokens = resources.block_tokens
+        self.inline_tokens = resources.inline_tokens
+
+        self.setTokenizer('regex')
+        if isinstance(parent, QsciScintilla):
+            parent.SCN_MODIFIED.connect(self.onModified)
+        self.stylingDone.connect(self.onStylingDone)
+        self._unstyled = []
+        self._idle_timer = QtCore.QTimer(self)
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.timeout.connect(self.onIdleStyling)
 
         self.setDebugLevel(globalvars.logging_level)
 
-        logger.debug('Loading properties')
-        self.readProperties()
-
-        rst_prop_files = [
-            os.path.join(__home_data_path__, 'rst.properties'),
-            os.path.join(__data_path__, 'rst.properties'),
-        ]
-        for rst_prop_file in rst_prop_files:
-            if os.path.exists(rst_prop_file):
-                break
-        if os.path.exists(rst_prop_file):
-            logger.debug('Loading %s', rst_prop_file)
-            self.readConfig(rst_prop_file)
+        for style, table in resources.style_table.items():
+            if 'color' in table:
+                self.setColor(table['color'], style)
+            if 'paper' in table:
+                self.setPaper(table['paper'], style)
+            if 'font' in table:
+                self.setFont(table['font'], style)
 
     def language(self):
         return 'reStructuredText'
@@ -216,50 +341,219 @@ class QsciLexerRest(Qsci.QsciLexerCustom):
     def description(self, style):
         return self.rstyles.get(style) or self.inline_rstyles.get(style)
 
-    def do_StylingText(self, start, end):
-        text = self.parent().text(start, end)
-        self.startStyling(start)
-        offset = 0
-        b_offset = start
-        while offset < len(text):
-            # logger.debug('try match: %s %s' % (offset, repr(text[offset:])))
-            mo = None
-            for key, tok in self.block_tokens:
-                mo = tok.match(text, offset)
-                if mo:
-                    break
-            assert mo, text[offset:]
-            # !! must match a style
-            m_string = mo.group(0)
-            length = len(m_string.encode('utf8'))
-            b_offset += length
-            logger.info('match range: %s, %s' % (key, length))
-            logger.debug('match text: %s' % (m_string))
-            self.setStyling(length, self.styles[key])
-            offset = mo.end()
-        self.do_InlineStylingText(start, end)
-        logger.debug('end styled: %s(%s)' % (self.editor().getEndStyled(), end))
-
-    def do_InlineStylingText(self, start, end):
-        start_line, _ = self.editor().lineIndexFromPosition(start)
-        end_line, _ = self.editor().lineIndexFromPosition(end)
-        for x in range(start_line, end_line + 1):
-            pos = self.editor().positionFromLineIndex(x, 0)
-            if self.parent().getStyleAt(pos) == self.styles['literal']:
-                continue
-            text = self.editor().text(x)
-            for key, tok in self.inline_tokens:
-                mo_list = tok.finditer(text)
-                for mo in mo_list:
-                    m_string = mo.group(1)
-                    length = len(m_string.encode('utf8'))
-                    m_start = self.editor().positionFromLineIndex(x, mo.start(1))
-                    logger.debug('inline match: %s:%s: %s' % (key, length, m_string))
-                    self.startStyling(m_start)
-                    self.setStyling(length, self.inline_styles[key])
-        # fix, set last styled char
-        self.startStyling(end - 1)
-        self.setStyling(1, self.editor().getStyleAt(end - 1))
+    def setTokenizer(self, name):
+        """ name: regex or line """
+        if name == 'line':
+            self.tokenizer = LineTokenizer()
+        else:
+            if name != 'regex':
+                logger.warning('unknown rst tokenizer: %s' % name)
+            self.tokenizer = RegexTokenizer(self.block_tokens)
+        # line states of other tokenizer are not trusted
+        self._line_tag = next(line_tags) & LINE_TAG
+
+    def detach(self):
+        """ stop styling before lexer is replaced """
+        get_styling_worker().cancel(self)
+        self._job = None
+        self._pending = None
+        self._unstyled = []
+        self._idle_timer.stop()
+        parent = self.parent()
+        if isinstance(parent, QsciScintilla):
+            try:
+                parent.SCN_MODIFIED.disconnect(self.onModified)
+            except TypeError as err:
+                logger.debug(err)
+
+    def setAsyncStyling(self, enable):
+        """ tokenize large text in worker thread """
+        self._async = enable
+
+    def setViewportStyling(self, enable):
+        """ style lines on screen first """
+        self._viewport = enable
+
+    def lineState(self, style, token_start):
+        state = LINE_STYLED | style << LINE_STYLE_SHIFT | self._line_tag
+        if token_start:
+            state |= LINE_TOKEN_START
+        return state
+
+    def isCleanLine(self, line_no):
+        """
+        a line after a blank line which is not indented, quoted or adornment.
+        no token crosses the blank line into it, tokenizer could start from it.
+        """
+        editor = self.editor()
+        if editor.text(line_no - 1).strip('\r\n'):
+            return False
+        return bool(clean_line_regex.match(editor.text(line_no)))
+
+    def onModified(self, position, mtype, text, length, *args):
+        if mtype & QsciScintilla.SC_MOD_INSERTTEXT:
+            if position < self._modified_end:
+                self._modified_end += length
+            else:
+                self._modified_end = position + length
+        elif mtype & QsciScintilla.SC_MOD_DELETETEXT:
+            if position + length <= self._modified_end:
+                self._modified_end -= length
+            else:
+                self._modified_end = position
+            length = -length
+        else:
+            return
+        self._revision += 1
+        # following text is moved
+        if self._pending:
+            self._pending = [
+                max(pos + length, position) if pos > position else pos
+                for pos in self._pending]
+        if self._unstyled:
+            unstyled = []
+            for r in self._unstyled:
+                r = [max(pos + length, position) if pos > position else pos for pos in r]
+                if r[0] < r[1]:
+                    unstyled.append(r)
+            self._unstyled = unstyled
+
+    def do_StylingText(self, start, end, modified_end=None):
+        """
+        tokenize text and save state of every line.
+        modified_end: stop at line after it if line state is not changed,
+        the following text and styles are not changed.
+        return: end position of styled text
+        """
+        editor = self.editor()
+        text = editor.text(start, end)
+        first_line, _ = editor.lineIndexFromPosition(start)
+
+        def converged(line_no, length, state):
+            pos = start + length
+            if pos > modified_end and not self.isUnstyled(pos) and \
+                    state == editor.getLineState(first_line + line_no):
+                logger.debug('line state matched: %s', first_line + line_no)
+                return True
+            return False
+
+        styles, states = self.tokenizeText(text, None if modified_end is None else converged)
+        for line_no, state in enumerate(states):
+            editor.setLineState(first_line + line_no, state)
+        if styles:
+            self.startStyling(start)
+            editor.SendScintilla(QsciScintilla.SCI_SETSTYLINGEX, len(styles), bytes(styles))
+        logger.debug('end styled: %s(%s)', editor.getEndStyled(), end)
+        return start + len(styles)
+
+    def tokenizeText(self, text, converged=None):
+        """
+        text: text from a line start. it is called in worker thread too.
+        converged: converged(line_no, bytes of styles, state of line), stop at
+        the line if it returns True
+        return: (style of every byte, state of every line)
+        """
+        lines = line_regex.findall(text)
+        # style of every byte, applied at once
+        styles = bytearray()
+        states = []
+        line_no = 0
+        line_start = 0
+        for key, offset, m_end in self.tokenizer.tokenize(text):
+            style = self.styles[key]
+            if converged and offset == line_start and \
+                    converged(line_no, len(styles), self.lineState(style, True)):
+                break
+            length = len(text[offset:m_end].encode('utf8'))
+            styles += bytes((style,)) * length
+            while line_no < len(lines) and line_start < m_end:
+                states.append(self.lineState(style, line_start == offset))
+                line_start += len(lines[line_no])
+                line_no += 1
+        if styles:
+            self.do_InlineStylingText(text, lines[:line_no], styles)
+        return styles, states
+
+    def submitStyling(self, start, end):
+        """ tokenize text in worker thread, "start" is at line beginning """
+        if self._job and self._job.revision == self._revision \
+                and self._pending[0] <= start and end <= self._pending[1]:
+            # text is not changed, pending job gives its styles
+            return
+        if self._pending:
+            start = min(start, self._pending[0])
+            end = max(end, self._pending[1])
+        self._pending = [start, end]
+        text = self.editor().text(start, end)
+        self._job = StylingJob(self, self._revision, start, text)
+        get_styling_worker().submit(self._job)
+        logger.debug('submit styling: %s %s (revision %s)', start, end, self._revision)
+
+    def onStylingDone(self, job):
+        if job is not self._job:
+            return
+        self._job = None
+        editor = self.editor()
+        if not editor:
+            self._pending = None
+            return
+        start, end = self._pending
+        if job.revision != self._revision:
+            logger.debug('styling revision %s is out of date', job.revision)
+            # request styles of text again
+            editor.SendScintilla(QsciScintilla.SCI_COLOURISE, start, end)
+            return
+        self._pending = None
+        if job.runs is None:
+            styled_end = self.do_StylingText(start, end)
+        else:
+            styles = expand_runs(job.runs)
+            first_line, _ = editor.lineIndexFromPosition(start)
+            for line_no, state in enumerate(job.states):
+                editor.setLineState(first_line + line_no, state)
+            self.startStyling(start)
+            editor.SendScintilla(QsciScintilla.SCI_SETSTYLINGEX, len(styles), styles)
+            styled_end = start + len(styles)
+        if self._unstyled:
+            self.markStyled(start, styled_end)
+            self.updateProgress()
+        if styled_end >= self._modified_end:
+            self._modified_end = 0
+
+    def do_InlineStylingText(self, text, lines, styles):
+        """
+        text: text of lines
+        lines: text lines with line end
+        styles: style of every byte of lines, inline styles are set in it
+        """
+        # char and byte offset of line start
+        char_starts = []
+        byte_starts = []
+        c_offset = b_offset = 0
+        for line in lines:
+            char_starts.append(c_offset)
+            byte_starts.append(b_offset)
+            c_offset += len(line)
+            b_offset += len(line) if line.isascii() else len(line.encode('utf8'))
+        char_starts.append(c_offset)
+        literal = self.styles['literal']
+        # later token overrides the former
+        for key, tok in self.inline_tokens:
+            style = bytes((self.inline_styles[key],))
+            for mo in tok.finditer(text, 0, c_offset):
+                m_start, m_end = mo.span(1)
+                line_no = bisect.bisect_right(char_starts, m_start) - 1
+                b_start = byte_starts[line_no]
+                if styles[b_start] == literal:
+                    continue
+                m_start -= char_starts[line_no]
+                m_end -= char_starts[line_no]
+                line = lines[line_no]
+                if not line.isascii():
+                    length = len(line[m_start:m_end].encode('utf8'))
+                    m_start = len(line[:m_start].encode('utf8'))
+                    m_end = m_start + length
+                styles[b_start + m_start:b_start + m_end] = style * (m_end - m_start)
 
     def styleText(self, start, end):
         """start and end is based bytes
@@ -270,84 +564,141 @@ class QsciLexerRest(Qsci.QsciLexerCustom):
             return
         if self.editor()._pause_lexer:
             return
-        logger.debug(('styling %s:%s' % (start, end)).center(70, '-'))
-        logger.debug('end styled: %s' % self.editor().getEndStyled())
+        logger.debug('styling %s:%s, end styled: %s', start, end, self.editor().getEndStyled())
         # for multiple line syntax
-        # fix start
-        line_no, _ = self.editor().lineIndexFromPosition(start)
-        line_no = max(line_no - 1, 0)
-        pos = self.editor().positionFromLineIndex(line_no, 0)
-        while pos > 0:
-            style = self.editor().getStyleAt(pos)
-            if style == self.styles['newline']:
-                break
-            line_no = max(line_no - 1, 0)
-            pos = self.editor().positionFromLineIndex(line_no, 0)
-        fix_start = pos
+        # fix start, text before start is not changed
+        start_line, _ = self.editor().lineIndexFromPosition(start)
+        fix_start = self.cleanLineBefore(start_line - 1)
         # fix end
-        line_max = self.editor().lines()
         line_no, _ = self.editor().lineIndexFromPosition(end)
-        line_no = min(line_no + 1, line_max)
-        pos = self.editor().positionFromLineIndex(line_no, 0)
-        while line_no < line_max:
-            style = self.editor().getStyleAt(pos)
-            if style == self.styles['newline']:
-                break
-            line_no = min(line_no + 1, line_max)
-            pos = self.editor().positionFromLineIndex(line_no, 0)
-        if line_no == line_max:
-            pos = self.editor().length()
-        fix_end = pos
+        fix_end = self.cleanLineAfter(line_no + 1)
 
-        text = self.editor().text(start, end)
-        fix_text = self.editor().text(fix_start, fix_end)
-        logger.info('text range: %s %s' % (start, end))
-        logger.debug(text)
-        logger.info('text range: %s %s' % (fix_start, fix_end))
-        logger.debug(fix_text)
-        self.do_StylingText(fix_start, fix_end)
+        logger.debug('text range: %s %s', fix_start, fix_end)
+        if self._viewport:
+            view_start = self.viewportStart()
+            if view_start - fix_start >= self.viewport_min_bytes and end > view_start:
+                logger.debug('skip to viewport: %s', view_start)
+                self.addUnstyled(fix_start, view_start)
+                fix_start = view_start
+        if self._async:
+            size = min(fix_end, max(end, self._modified_end)) - fix_start
+            if self._pending or size >= self.async_min_bytes:
+                # show previous styles until worker thread finishes
+                self.submitStyling(fix_start, fix_end)
+                self.startStyling(end)
+                return
+        styled_end = self.do_StylingText(fix_start, fix_end, self._modified_end)
+        if self._unstyled:
+            self.markStyled(fix_start, styled_end)
+            self.updateProgress()
+        if styled_end < end:
+            # styles of following text are not changed
+            self.startStyling(end)
+        if max(styled_end, end) >= self._modified_end:
+            self._modified_end = 0
 
-    def defaultStyle(self):
-        return self.styles['string']
+    def cleanLineBefore(self, line_no):
+        """ return: position of clean line at or before line_no """
+        line_no = max(line_no, 0)
+        while line_no > 0 and not self.isCleanLine(line_no):
+            line_no -= 1
+        return self.editor().positionFromLineIndex(line_no, 0)
 
-    def setDebugLevel(self, logging_level):
-        pass
+    def cleanLineAfter(self, line_no):
+        """ return: position of clean line at or after line_no """
+        line_max = self.editor().lines()
+        line_no = min(line_no, line_max)
+        while line_no < line_max and not self.isCleanLine(line_no):
+            line_no += 1
+        if line_no == line_max:
+            return self.editor().length()
+        return self.editor().positionFromLineIndex(line_no, 0)
 
-    def do_read_style(self, prop_list, style):
-        font = self.font(style)
-        for prop in prop_list:
-            if prop.startswith('face:'):
-                fgcolor = QtGui.QColor(prop.split(':')[1])
-                self.setColor(fgcolor, style)
-            elif prop.startswith('back:'):
-                bgcolor = QtGui.QColor(prop.split(':')[1])
-                self.setPaper(bgcolor, style)
+    def viewportStart(self):
+        """ return: position of clean line before lines on screen """
+        editor = self.editor()
+        line_no = editor.SendScintilla(
+            QsciScintilla.SCI_DOCLINEFROMVISIBLE,
+            editor.SendScintilla(QsciScintilla.SCI_GETFIRSTVISIBLELINE))
+        return self.cleanLineBefore(line_no - self.viewport_margin)
+
+    def addUnstyled(self, start, end):
+        unstyled = []
+        for r in self._unstyled:
+            if r[1] < start or r[0] > end:
+                unstyled.append(r)
             else:
-                if ':' in prop:
-                    continue
-                if prop.startswith('$(font.'):
-                    mo = re.match(r'^\$\(font\.(.+)\)', prop)
-                    font = QtGui.QFont(mo.group(1))
-                elif prop == 'bold':
-                    font.setBold(True)
-                elif prop == 'italic':
-                    font.setItalic(True)
-                elif prop == 'underline':
-                    font.setUnderline(True)
-                self.setFont(font, style)
+                start = min(start, r[0])
+                end = max(end, r[1])
+        unstyled.append([start, end])
+        unstyled.sort()
+        self._unstyled = unstyled
+        self.updateProgress()
+        self._idle_timer.start(0)
 
-    def readProperties(self):
-        for style, value in self.properties.items():
-            self.do_read_style(value.split(','), style)
+    def isUnstyled(self, pos):
+        for r in self._unstyled:
+            if r[0] <= pos < r[1]:
+                return True
+        return False
 
-    def readConfig(self, rst_prop_file):
-        prop_settings = QtCore.QSettings(rst_prop_file, QtCore.QSettings.IniFormat)
-        for style in self.properties.keys():
-            value = prop_settings.value('style.rst.%s' % style, type=str)
-            if not value:
+    def markStyled(self, start, end):
+        unstyled = []
+        for r in self._unstyled:
+            if r[1] <= start or r[0] >= end:
+                unstyled.append(r)
                 continue
-            if isinstance(value, str):
-                v = value.split(',')
-            else:
-                v = value
-            self.do_read_style(v, style)
+            if r[0] < start:
+                unstyled.append([r[0], start])
+            if r[1] > end:
+                unstyled.append([end, r[1]])
+        self._unstyled = unstyled
+
+    def updateProgress(self):
+        editor = self.editor()
+        length = editor.length() if editor else 0
+        if self._unstyled and length:
+            unstyled = sum(r[1] - r[0] for r in self._unstyled)
+            progress = min(99, 100 - unstyled * 100 // length)
+        else:
+            progress = 100
+        if progress != self._progress:
+            self._progress = progress
+            self.stylingProgress.emit(progress)
+
+    def onIdleStyling(self):
+        """ style a slice of unstyled text, the nearest one to viewport first """
+        editor = self.editor()
+        if not editor or not self._unstyled:
+            self._unstyled = []
+            self.updateProgress()
+            return
+        if editor._pause_lexer or self._pending:
+            self._idle_timer.start(50)
+            return
+        view_start = self.viewportStart()
+        gap_start, gap_end = self._unstyled[0]
+        for r in self._unstyled:
+            if r[0] <= view_start < r[1]:
+                # scrolled into unstyled text
+                gap_start, gap_end = view_start, r[1]
+                break
+        start_line, _ = editor.lineIndexFromPosition(gap_start)
+        start = self.cleanLineBefore(start_line)
+        line_no, _ = editor.lineIndexFromPosition(min(start + self.idle_slice_bytes, gap_end))
+        end = self.cleanLineAfter(line_no + 1)
+        end_styled = editor.getEndStyled()
+        # stop at styled text after gap if line state is not changed
+        styled_end = self.do_StylingText(start, end, gap_end)
+        self.markStyled(start, max(styled_end, end))
+        if end_styled > styled_end:
+            self.startStyling(end_styled)
+        self.updateProgress()
+        if self._unstyled:
+            self._idle_timer.start(0)
+
+    def defaultStyle(self):
+        return self.styles['string']
+
+    def setDebugLevel(self, logging_level):
+        pass
@@ -6,6 +6,8 @@ from functools import partial
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 from .editor import Editor, FILTER
+from .journal import orphan_journals
+from .watcher import FileWatcher
 from .gaction import GlobalAction
 from . import __monospace__
 
@@ -13,6 +15,27 @@ from . import __monospace__
 logger = logging.getLogger(__name__)
 
 
+class LoadingWidget(QtWidgets.QWidget):
+    """ progress and cancel button of background loading in tab """
+    def __init__(self, editor, parent=None):
+        super(LoadingWidget, self).__init__(parent)
+        layout = QtWidgets.QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+        self.progress = QtWidgets.QProgressBar(self)
+        self.progress.setRange(0, 100)
+        self.progress.setTextVisible(False)
+        self.progress.setFixedSize(48, 10)
+        layout.addWidget(self.progress)
+        button = QtWidgets.QToolButton(self)
+        button.setAutoRaise(True)
+        button.setText('x')
+        button.setToolTip(self.tr('Cancel loading'))
+        button.clicked.connect(editor.cancelLoading)
+        layout.addWidget(button)
+        editor.loadProgress.connect(self.progress.setValue)
+
+
 class TabEditor(QtWidgets.QTabWidget):
     statusChanged = QtCore.pyqtSignal(int, 'QString')
     showMessageRequest = QtCore.pyqtSignal('QString')
@@ -31,6 +54,7 @@ class TabEditor(QtWidgets.QTabWidget):
     _vim_emulator = None
     _timer = None
     _timer_interval = 1
+    _watcher = None
 
     def __init__(self, settings, find_dialog, parent=None):
         super(TabEditor, self).__init__(parent)
@@ -48,6 +72,10 @@ class TabEditor(QtWidgets.QTabWidget):
         self._show_ws_eol = self._settings.value('editor/show_ws_eol', False, type=bool)
         self._single_instance = self._settings.value('editor/single_instance', False, type=bool)
 
+        # files changed by other programs
+        self._watcher = FileWatcher(self)
+        self._watcher.filesChanged.connect(self._onFilesChanged)
+
         g_action = GlobalAction()
 
         action = QtWidgets.QAction(self.tr('&Open'), self)
@@ -216,6 +244,53 @@ class TabEditor(QtWidgets.QTabWidget):
             return
         self.verticalScrollBarChanged.emit(index)
 
+    def _onLoadFinished(self, completed):
+        widget = self.sender()
+        index = self.indexOf(widget)
+        if index < 0:
+            return
+        button = self.tabBar().tabButton(index, QtWidgets.QTabBar.LeftSide)
+        if button:
+            self.tabBar().setTabButton(index, QtWidgets.QTabBar.LeftSide, None)
+            button.deleteLater()
+        if completed:
+            self.showMessageRequest.emit(self.tr('load "%s"' % self.filepath(index)))
+        else:
+            self.showMessageRequest.emit(self.tr('load "%s" is cancelled' % self.filepath(index)))
+        self.statusChanged.emit(index, widget.status())
+        self.previewRequest.emit(index, 'open')
+
+    def _onSaveFinished(self, filename, succeeded):
+        widget = self.sender()
+        index = self.indexOf(widget)
+        if index < 0:
+            return
+        if succeeded:
+            self.showMessageRequest.emit(self.tr('save to "%s"' % filename))
+            self.updateWatcher()
+        self.updateTitle(index)
+
+    def _onFilesChanged(self, paths):
+        paths = set(paths)
+        for x in range(self.count()):
+            editor = self.widget(x)
+            filename = editor.getFileName()
+            if not filename or os.path.abspath(filename) not in paths:
+                continue
+            # written by editor self
+            if editor.isSaving() or not editor.isChangedOnDisk():
+                continue
+            if not os.path.exists(filename):
+                self.showMessageRequest.emit(self.tr('"%s" is removed' % filename))
+                continue
+            if editor.isModified():
+                self.setCurrentIndex(x)
+            if editor.do_reload():
+                self.updateTitle(x)
+                self.showMessageRequest.emit(self.tr('reload "%s"' % filename))
+                self.statusChanged.emit(x, editor.status())
+                self.previewRequest.emit(x, 'open')
+
     def _onConvertEol(self, value):
         widget = self.currentWidget()
         widget and widget.do_convert_eol(value)
@@ -244,7 +319,6 @@ class TabEditor(QtWidgets.QTabWidget):
         index = self.currentIndex()
         old, new = self.widget(index).do_save()
         self.previewRequest.emit(index, 'save')
-        self.showMessageRequest.emit('save to "%s"' % self.filepath(index))
         if old != new:
             self.filenameChanged.emit(old, new)
 
@@ -287,6 +361,8 @@ class TabEditor(QtWidgets.QTabWidget):
         editor.loadRequest.connect(self.loadFile)
         editor.closeRequest.connect(partial(self.do_close_editor, -1))
         editor.closeAppRequest.connect(self.do_close_app)
+        editor.loadFinished.connect(self._onLoadFinished)
+        editor.saveFinished.connect(self._onSaveFinished)
 
         editor.enableLexer(self._enable_lexer)
 
@@ -322,13 +398,42 @@ class TabEditor(QtWidgets.QTabWidget):
         if editor.do_open(filepath):
             title = ('*' if editor.isModified() else '') + os.path.basename(editor.getFileName())
             index = self.insertTab(0, editor, title)
+            if editor.isLoading():
+                self.tabBar().setTabButton(
+                    index, QtWidgets.QTabBar.LeftSide, LoadingWidget(editor, self.tabBar()))
             self.setCurrentIndex(index)
+            self.updateWatcher()
             self.fileLoaded.emit(index)
             self.showMessageRequest.emit(self.tr('load "%s"' % self.filepath(index)))
             self.statusChanged.emit(index, self.widget(index).status())
             self.previewRequest.emit(index, 'open')
             return index
 
+    def recover(self):
+        """ open documents of journals left by crashed process """
+        for path in orphan_journals():
+            editor = self._newEditor()
+            if not editor.do_recover(path):
+                editor.close()
+                editor.deleteLater()
+                continue
+            index = self.insertTab(0, editor, '')
+            self.updateTitle(index)
+            self.setCurrentIndex(index)
+            self.fileLoaded.emit(index)
+            self.showMessageRequest.emit(self.tr('recover "%s"' % self.filepath(index)))
+            self.statusChanged.emit(index, editor.status())
+        self.updateWatcher()
+
+    def updateWatcher(self):
+        """ watch files of all tabs, new documents have not been saved """
+        paths = []
+        for x in range(self.count()):
+            filename = self.filepath(x)
+            if filename and os.path.isabs(filename):
+                paths.append(filename)
+        self._watcher.setFiles(paths)
+
     def text(self, index):
         if index is None:
             editor = self.currentWidget()
@@ -447,8 +552,10 @@ class TabEditor(QtWidgets.QTabWidget):
             self.removeTab(index)
             widget.close()
             del widget
+            self.updateWatcher()
 
     def do_save_all(self):
+        """ files are written at the same time """
         for x in range(self.count()):
             self.widget(x).do_save()
 
@@ -489,7 +596,9 @@ class TabEditor(QtWidgets.QTabWidget):
             editor = self.widget(x)
             if old == editor.getFileName():
                 editor.setFileName(new)
+                editor.updateFileStat()
                 self.updateTitle(x)
+                self.updateWatcher()
                 self.fileLoaded.emit(x)
                 self.showMessageRequest.emit(self.tr('rename "%s" => "%s"' % (old, new)))
                 return
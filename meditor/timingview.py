@@ -0,0 +1,58 @@
+
+import logging
+
+from PyQt5 import QtCore, QtWidgets
+
+
+logger = logging.getLogger(__name__)
+
+BARS = ' ▁▂▃▄▅▆▇█'
+
+
+class TimingView(QtWidgets.QTreeWidget):
+    """ rolling timings of preview stages """
+    _stats = None
+
+    def __init__(self, stats, parent=None):
+        super(TimingView, self).__init__(parent)
+        self._stats = stats
+        self.setRootIsDecorated(False)
+        self.setHeaderLabels([
+            self.tr('Stage'), self.tr('Last (ms)'), self.tr('Median'),
+            self.tr('P95'), self.tr('Max'), self.tr('Count'),
+            self.tr('Histogram'),
+        ])
+        labels = ['<%sms' % (1 << x) for x in range(stats.buckets - 1)]
+        labels.append('>=%sms' % (1 << (stats.buckets - 2)))
+        self.headerItem().setToolTip(6, ' '.join(labels))
+        self.setContextMenuPolicy(QtCore.Qt.ActionsContextMenu)
+        action = QtWidgets.QAction(self.tr('Clear'), self)
+        action.triggered.connect(self.do_clear)
+        self.addAction(action)
+
+    def refresh(self):
+        self.clear()
+        for stage in self._stats.stages():
+            count, last, median, p95, maximum = self._stats.summary(stage)
+            counts = self._stats.histogram(stage)
+            top = max(counts) or 1
+            histogram = ''.join(
+                BARS[(c * (len(BARS) - 1) + top - 1) // top] for c in counts)
+            item = QtWidgets.QTreeWidgetItem([
+                stage,
+                '%.1f' % (last * 1000),
+                '%.1f' % (median * 1000),
+                '%.1f' % (p95 * 1000),
+                '%.1f' % (maximum * 1000),
+                '%s' % count,
+                histogram,
+            ])
+            for x in range(1, 6):
+                item.setTextAlignment(x, QtCore.Qt.AlignRight)
+            self.addTopLevelItem(item)
+        for x in range(self.columnCount()):
+            self.resizeColumnToContents(x)
+
+    def do_clear(self):
+        self._stats.clear()
+        self.refresh()
@@ -0,0 +1,125 @@
+"""
+watch files and directories changed by other programs
+
+Events of QFileSystemWatcher are collected and emitted together after a short
+delay, so a script writing many files, or a file many times, causes one
+refresh. A file replaced by rename or deleted is no longer watched by
+QFileSystemWatcher, so parent directories of files are watched too and the
+file is watched again when it appears.
+"""
+import os
+import logging
+
+from PyQt5 import QtCore
+
+logger = logging.getLogger(__name__)
+
+# milliseconds after last event
+WATCH_DELAY = 300
+
+
+class FileWatcher(QtCore.QObject):
+    """
+    "filesChanged" and "directoriesChanged" are emitted with lists of
+    changed paths after events have stopped for "delay" milliseconds
+    """
+    filesChanged = QtCore.pyqtSignal(list)
+    directoriesChanged = QtCore.pyqtSignal(list)
+
+    def __init__(self, parent=None, delay=WATCH_DELAY):
+        super(FileWatcher, self).__init__(parent)
+        self._files = set()
+        self._dirs = set()
+        # parent directories of files: number of files
+        self._parents = {}
+        self._changed_files = set()
+        self._changed_dirs = set()
+        self._watcher = QtCore.QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self.onFileChanged)
+        self._watcher.directoryChanged.connect(self.onDirectoryChanged)
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self.onTimeout)
+
+    def setFiles(self, paths):
+        """ watch only these files """
+        paths = set(os.path.abspath(path) for path in paths if path)
+        for path in self._files - paths:
+            self._removePath(path)
+            self._removeParent(os.path.dirname(path))
+        for path in paths - self._files:
+            self._addPath(path)
+            self._addParent(os.path.dirname(path))
+        self._files = paths
+
+    def setDirectories(self, paths):
+        """ watch only these directories """
+        paths = set(os.path.abspath(path) for path in paths if path)
+        for path in self._dirs - paths:
+            if path not in self._parents:
+                self._removePath(path)
+        for path in paths - self._dirs:
+            self._addPath(path)
+        self._dirs = paths
+
+    def files(self):
+        return set(self._files)
+
+    def directories(self):
+        return set(self._dirs)
+
+    def _addPath(self, path):
+        if os.path.exists(path) and not self._watcher.addPath(path):
+            logger.debug('Watch error: %s' % path)
+
+    def _removePath(self, path):
+        self._watcher.removePath(path)
+
+    def _addParent(self, path):
+        count = self._parents.get(path, 0)
+        if not count and path not in self._dirs:
+            self._addPath(path)
+        self._parents[path] = count + 1
+
+    def _removeParent(self, path):
+        count = self._parents.pop(path, 0) - 1
+        if count > 0:
+            self._parents[path] = count
+        elif path not in self._dirs:
+            self._removePath(path)
+
+    def onFileChanged(self, path):
+        if path in self._files:
+            self._changed_files.add(path)
+            self._timer.start()
+
+    def onDirectoryChanged(self, path):
+        if path in self._dirs:
+            self._changed_dirs.add(path)
+            self._timer.start()
+        if path in self._parents:
+            # a file is created again
+            watched = set(self._watcher.files())
+            for filename in self._files - watched:
+                if os.path.dirname(filename) == path and os.path.exists(filename):
+                    self._changed_files.add(filename)
+                    self._timer.start()
+
+    def onTimeout(self):
+        changed_files = sorted(self._changed_files)
+        changed_dirs = sorted(self._changed_dirs)
+        self._changed_files.clear()
+        self._changed_dirs.clear()
+        # replaced file has been removed from watcher
+        watched = set(self._watcher.files()) | set(self._watcher.directories())
+        for path in changed_files + changed_dirs:
+            if path not in watched:
+                self._addPath(path)
+        for path in self._parents:
+            if path not in watched:
+                self._addPath(path)
+        if changed_files:
+            self.filesChanged.emit(changed_files)
+        if changed_dirs:
+            self.directoriesChanged.emit(changed_dirs)
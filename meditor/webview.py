@@ -1,4 +1,6 @@
-
+import re
+import json
+import time
 from functools import partial
 
 from PyQt5 import QtGui, QtCore, QtWidgets, QtWebEngineWidgets
@@ -19,12 +21,255 @@ hello_html = """
 </html>
 """ % (__app_name__, __app_version__, __app_name__, __app_version__)
 
+# split html into shell (head) and body
+body_re = re.compile(r'^(.*?<body[^>]*>)(.*)(</body>.*)$', re.S | re.I)
+
+# typeset math only if its source is changed.
+# math nodes are replaced with placeholders keyed by source, typeset output
+# is cached and copied into placeholders of next render.
+# MathJax v2, such as the bundled single file, typesets script of placeholders
+# by MathJax.Hub, and unchanged placeholders are kept by patch.
+math_js = """
+window.meditorMath = (function () {
+    var cache = new Map();
+    var maxCache = 2000;
+    var queue = Promise.resolve();
+
+    function version() {
+        if (!window.MathJax) {
+            return 0;
+        }
+        if (MathJax.startup && MathJax.startup.promise) {
+            return 3;
+        }
+        if (MathJax.Hub && MathJax.Hub.Queue) {
+            return 2;
+        }
+        return 0;
+    }
+    function enabled() {
+        return version() > 0;
+    }
+    function mathKey(node) {
+        return [node.getAttribute('data-type'),
+                node.getAttribute('data-display'),
+                node.getAttribute('data-math')].join('|');
+    }
+    function remember(key, node) {
+        cache.delete(key);
+        cache.set(key, node);
+        if (cache.size > maxCache) {
+            cache.delete(cache.keys().next().value);
+        }
+    }
+    function source(node) {
+        var text = node.textContent.trim();
+        var mo = text.match(/^\\\\\\(([\\s\\S]*)\\\\\\)$/) || text.match(/^\\\\\\[([\\s\\S]*)\\\\\\]$/);
+        return mo ? mo[1] : text;
+    }
+    /* replace math of docutils and markdown with placeholders */
+    function prepare(root) {
+        var v2 = version() === 2;
+        var nodes = root.querySelectorAll(
+            'span.math, div.math, script[type^="math/tex"], script[type^="math/asciimath"]');
+        nodes.forEach(function (node) {
+            var display, type = 'tex';
+            if (node.nodeName === 'SCRIPT') {
+                display = /mode=display/.test(node.type);
+                if (/asciimath/.test(node.type)) {
+                    type = 'asciimath';
+                }
+            } else {
+                display = node.nodeName === 'DIV';
+            }
+            var holder = document.createElement(display ? 'div' : 'span');
+            holder.className = 'math meditor-math';
+            holder.setAttribute('data-type', type);
+            holder.setAttribute('data-display', display ? '1' : '0');
+            holder.setAttribute('data-math', source(node));
+            if (v2) {
+                var script = document.createElement('script');
+                script.type = 'math/' + type + (display ? '; mode=display' : '');
+                script.text = holder.getAttribute('data-math');
+                holder.appendChild(script);
+            } else {
+                var cached = cache.get(mathKey(holder));
+                if (cached) {
+                    holder.appendChild(cached.cloneNode(true));
+                }
+            }
+            node.parentNode.replaceChild(holder, node);
+        });
+    }
+    function typesetNode(node) {
+        if (!node.isConnected || node.firstChild) {
+            return;
+        }
+        var key = mathKey(node);
+        var cached = cache.get(key);
+        if (cached) {
+            node.appendChild(cached.cloneNode(true));
+            return;
+        }
+        var asciimath = node.getAttribute('data-type') === 'asciimath';
+        var convert = asciimath ? MathJax.asciimath2chtmlPromise : MathJax.tex2chtmlPromise;
+        if (!convert) {
+            return;
+        }
+        if (!asciimath && MathJax.texReset) {
+            MathJax.texReset();
+        }
+        var options = MathJax.getMetricsFor(node, node.getAttribute('data-display') === '1');
+        return convert(node.getAttribute('data-math'), options).then(function (math) {
+            remember(key, math.cloneNode(true));
+            if (node.isConnected && !node.firstChild) {
+                node.appendChild(math);
+            }
+        });
+    }
+    /* typeset placeholders of which script is not processed */
+    function typesetHub() {
+        var scripts = document.querySelectorAll('.meditor-math > script');
+        scripts.forEach(function (script) {
+            if (!script.MathJax) {
+                MathJax.Hub.Queue(['Typeset', MathJax.Hub, script.parentNode]);
+            }
+        });
+    }
+    /* typeset empty placeholders, one by one */
+    function typeset() {
+        var v = version();
+        if (v === 2) {
+            typesetHub();
+        }
+        if (v !== 3) {
+            return;
+        }
+        queue = queue.then(function () {
+            return MathJax.startup.promise;
+        }).then(function () {
+            var nodes = document.querySelectorAll('.meditor-math:empty');
+            var promise = Promise.resolve();
+            nodes.forEach(function (node) {
+                promise = promise.then(function () {
+                    return typesetNode(node);
+                });
+            });
+            return promise.then(function () {
+                if (nodes.length) {
+                    /* update CHTML stylesheet */
+                    MathJax.startup.document.clear();
+                    MathJax.startup.document.updateDocument();
+                }
+            });
+        }).catch(function (err) {
+            console.log('MathJax: ' + err);
+        });
+    }
+    document.addEventListener('DOMContentLoaded', function () {
+        if (enabled()) {
+            prepare(document.body);
+            typeset();
+        }
+    });
+    return {enabled: enabled, prepare: prepare, typeset: typeset};
+})();
+"""
+
+# morph live body into new body, only changed nodes are touched
+patch_js = """
+window.meditorPatch = function (html) {
+    function sameNode(a, b) {
+        return a.nodeType === b.nodeType && a.nodeName === b.nodeName;
+    }
+    function sameMath(a, b) {
+        /* typeset output of "a" is not in cache yet */
+        return a.nodeType === 1 && sameNode(a, b) &&
+            a.classList.contains('meditor-math') &&
+            b.classList.contains('meditor-math') &&
+            a.getAttribute('data-type') === b.getAttribute('data-type') &&
+            a.getAttribute('data-display') === b.getAttribute('data-display') &&
+            a.getAttribute('data-math') === b.getAttribute('data-math');
+    }
+    function morphAttrs(from, to) {
+        var x, attr;
+        for (x = from.attributes.length - 1; x >= 0; x--) {
+            attr = from.attributes[x];
+            if (!to.hasAttribute(attr.name)) {
+                from.removeAttribute(attr.name);
+            }
+        }
+        for (x = 0; x < to.attributes.length; x++) {
+            attr = to.attributes[x];
+            if (from.getAttribute(attr.name) !== attr.value) {
+                from.setAttribute(attr.name, attr.value);
+            }
+        }
+    }
+    function morph(from, to) {
+        var a = from.firstChild, b = to.firstChild, next;
+        while (b) {
+            next = b.nextSibling;
+            if (!a) {
+                from.appendChild(b);
+            } else if (a.isEqualNode(b) || sameMath(a, b)) {
+                a = a.nextSibling;
+            } else if (a.nextSibling && a.nextSibling.isEqualNode(b)) {
+                // removed node
+                next = a.nextSibling;
+                from.removeChild(a);
+                a = next.nextSibling;
+                next = b.nextSibling;
+            } else if (b.nextSibling && a.isEqualNode(b.nextSibling)) {
+                // inserted node
+                from.insertBefore(b, a);
+            } else if (sameNode(a, b) && a.nodeType === 1 && a.nodeName !== 'SCRIPT') {
+                morphAttrs(a, b);
+                morph(a, b);
+                a = a.nextSibling;
+            } else if (sameNode(a, b) && a.nodeType !== 1) {
+                a.nodeValue = b.nodeValue;
+                a = a.nextSibling;
+            } else {
+                from.replaceChild(b, a);
+                a = b.nextSibling;
+            }
+            b = next;
+        }
+        while (a) {
+            next = a.nextSibling;
+            from.removeChild(a);
+            a = next;
+        }
+    }
+    if (!document.body) {
+        return false;
+    }
+    var template = document.createElement('template');
+    template.innerHTML = html;
+    var math = window.meditorMath && meditorMath.enabled();
+    if (math) {
+        meditorMath.prepare(template.content);
+    }
+    morph(document.body, template.content);
+    if (math) {
+        meditorMath.typeset();
+    }
+    return true;
+};
+"""
+
 
 class WebView(QtWebEngineWidgets.QWebEngineView):
     exportHtml = QtCore.pyqtSignal()
+    # seconds from setting html to loaded or patched
+    htmlLoaded = QtCore.pyqtSignal(float)
     _settings = None
     _find_dialog = None
     _loadding = False
+    _shell = None
+    _patch_serial = 0
+    _load_start = 0
 
     def __init__(self, settings, find_dialog, parent=None):
         super(WebView, self).__init__(parent)
@@ -34,6 +279,13 @@ class WebView(QtWebEngineWidgets.QWebEngineView):
         self.setAcceptDrops(False)
 
         self.page().loadFinished.connect(self.onLoadFinished)
+        script = QtWebEngineWidgets.QWebEngineScript()
+        script.setName('meditor_patch')
+        script.setSourceCode(math_js + patch_js)
+        script.setInjectionPoint(script.DocumentCreation)
+        script.setWorldId(script.MainWorld)
+        script.setRunsOnSubFrames(False)
+        self.page().scripts().insert(script)
         # self.page().pdfPrintingFinished.connect(self.onPdfPrintingFinished)
         # self.page().renderProcessTerminated.connect(self.onRenderProcessTerminated)
 
@@ -146,6 +398,7 @@ class WebView(QtWebEngineWidgets.QWebEngineView):
 
     def onLoadFinished(self, ok):
         self._loadding = False
+        self.htmlLoaded.emit(time.perf_counter() - self._load_start)
 
     def onPdfPrintingFinished(self, filePath, success):
         pass
@@ -199,7 +452,36 @@ class WebView(QtWebEngineWidgets.QWebEngineView):
     def setHtml(self, html, url=None):
         url = url or ''
         self._loadding = True
-        self.page().setHtml(toUtf8(html), QtCore.QUrl.fromLocalFile(url))
+        self._load_start = time.perf_counter()
+        self._shell = None
+        self._patch_serial += 1
+        html = toUtf8(html)
+        mo = body_re.match(html)
+        if mo:
+            self._shell = (url, mo.group(1), mo.group(3))
+        self.page().setHtml(html, QtCore.QUrl.fromLocalFile(url))
+
+    def updateHtml(self, html, url=None):
+        """ patch body of loaded page if head is not changed, or reload """
+        url = url or ''
+        html = toUtf8(html)
+        mo = body_re.match(html)
+        if self._loadding or not mo or self._shell != (url, mo.group(1), mo.group(3)):
+            self.setHtml(html, url)
+            return
+        self._patch_serial += 1
+        self._load_start = time.perf_counter()
+        self.page().runJavaScript(
+            'window.meditorPatch && window.meditorPatch(%s);' % json.dumps(mo.group(2)),
+            partial(self._onPatched, self._patch_serial, html, url))
+
+    def _onPatched(self, serial, html, url, ok):
+        if serial != self._patch_serial:
+            return
+        if ok:
+            self.htmlLoaded.emit(time.perf_counter() - self._load_start)
+        else:
+            self.setHtml(html, url)
 
     def scrollRatioPage(self, value, maximum):
         scrollJS = 'window.scrollTo(0, document.body.scrollHeight * %s / %s);'
@@ -10,16 +10,27 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 
 from .util import toUtf8
 from .gaction import GlobalAction
+from .watcher import FileWatcher
 
 logger = logging.getLogger(__name__)
 
 
+def path_key(path, name):
+    """ directories before files """
+    if os.path.isdir(os.path.join(path, name)):
+        prefix = '0_'
+    else:
+        prefix = '1_'
+    return (prefix + name).lower()
+
+
 class Workspace(QtWidgets.QTreeWidget):
     type_root = QtWidgets.QTreeWidgetItem.UserType
     type_folder = type_root + 1
     type_file = type_root + 2
     role_path = QtCore.Qt.UserRole
     _settings = None
+    _watcher = None
 
     fileLoaded = QtCore.pyqtSignal('QString')
     fileDeleted = QtCore.pyqtSignal('QString')
@@ -42,6 +53,12 @@ class Workspace(QtWidgets.QTreeWidget):
 
         self.itemActivated.connect(self.onItemActivated)
         self.currentItemChanged.connect(self.onCurrentItemChanged)
+        self.itemExpanded.connect(self.onItemExpanded)
+        self.itemCollapsed.connect(self.updateWatcher)
+
+        # expanded directories changed by other programs
+        self._watcher = FileWatcher(self)
+        self._watcher.directoriesChanged.connect(self.onDirectoriesChanged)
         # popup menu
         g_action = GlobalAction()
 
@@ -164,9 +181,11 @@ class Workspace(QtWidgets.QTreeWidget):
         if item.type() == self.type_root:
             if item.childCount() == 0:
                 self.expandDir(item)
+                self.updateWatcher()
         elif item.type() == self.type_folder:
             if item.childCount() == 0:
                 self.expandDir(item)
+                self.updateWatcher()
         else:
             path = os.path.join(item.data(0, self.role_path), item.text(0))
             self.fileLoaded.emit(os.path.abspath(path))
@@ -183,6 +202,20 @@ class Workspace(QtWidgets.QTreeWidget):
                 path = item.data(0, self.role_path)
                 self.refreshPath(path)
 
+    def onItemExpanded(self, item):
+        # directory is not watched when collapsed
+        if self.itemPath(item) not in self._watcher.directories():
+            self.updateDir(item)
+        self.updateWatcher()
+
+    def onDirectoriesChanged(self, paths):
+        items = self.expandedDirs()
+        for path in paths:
+            item = items.get(path)
+            if item:
+                self.updateDir(item)
+        self.updateWatcher()
+
     def onNewFile(self, label):
         self.fileNew.emit(label)
 
@@ -221,6 +254,7 @@ class Workspace(QtWidgets.QTreeWidget):
                 index = self.indexOfTopLevelItem(item)
                 self.takeTopLevelItem(index)
                 del item
+                self.updateWatcher()
             else:
                 path = os.path.join(item.data(0, self.role_path), item.text(0))
                 if self.doDeletePath(path):
@@ -236,6 +270,7 @@ class Workspace(QtWidgets.QTreeWidget):
                 item = item.parent()
             item.takeChildren()
             self.expandDir(item)
+            self.updateWatcher()
 
     def onWindowsExplorer(self):
         path = self.getCurrentPath()
@@ -347,20 +382,15 @@ class Workspace(QtWidgets.QTreeWidget):
         child.setData(0, self.role_path, path)
         return child
 
-    def expandDir(self, item):
-        def pathkey(key):
-            if os.path.isdir(os.path.join(path, key)):
-                prefix = '0_'
-            else:
-                prefix = '1_'
-            key = prefix + key
-            return key.lower()
+    def itemPath(self, item):
+        """ return: path of root or folder item """
+        if item.type() == self.type_folder:
+            return os.path.join(item.data(0, self.role_path), item.text(0))
+        return item.data(0, self.role_path)
 
-        if item.type() == self.type_root:
-            path = item.data(0, self.role_path)
-        elif item.type() == self.type_folder:
-            path = os.path.join(item.data(0, self.role_path), item.text(0))
-        dirs = sorted(os.listdir(path), key=pathkey)
+    def expandDir(self, item):
+        path = self.itemPath(item)
+        dirs = sorted(os.listdir(path), key=partial(path_key, path))
         children = []
         for d in dirs:
             if d.startswith('.'):
@@ -368,6 +398,45 @@ class Workspace(QtWidgets.QTreeWidget):
             children.append(self.createNode(path, d))
         item.addChildren(children)
 
+    def updateDir(self, item):
+        """
+        update children of item to directory, other children and their
+        expanded subtrees are kept
+        """
+        path = self.itemPath(item)
+        try:
+            names = sorted(os.listdir(path), key=partial(path_key, path))
+        except OSError as err:
+            logger.debug(err)
+            return
+        names = [name for name in names if not name.startswith('.')]
+        exists = set(names)
+        for index in reversed(range(item.childCount())):
+            child = item.child(index)
+            name = child.text(0)
+            is_dir = os.path.isdir(os.path.join(path, name))
+            if name not in exists or is_dir != (child.type() == self.type_folder):
+                item.takeChild(index)
+        children = set(item.child(index).text(0) for index in range(item.childCount()))
+        for index, name in enumerate(names):
+            if name not in children:
+                item.insertChild(index, self.createNode(path, name))
+
+    def expandedDirs(self):
+        """ return: {path: item} of expanded directories """
+        dirs = {}
+        items = [self.topLevelItem(index) for index in range(self.topLevelItemCount())]
+        while items:
+            item = items.pop()
+            if item.type() == self.type_file or not item.isExpanded():
+                continue
+            dirs[self.itemPath(item)] = item
+            items.extend(item.child(index) for index in range(item.childCount()))
+        return dirs
+
+    def updateWatcher(self):
+        self._watcher.setDirectories(self.expandedDirs().keys())
+
     def appendRootPath(self, path, expand=False):
         if not os.path.exists(path):
             return
@@ -387,6 +456,7 @@ class Workspace(QtWidgets.QTreeWidget):
         self.addTopLevelItem(root_item)
         self.expandDir(root_item)
         root_item.setExpanded(expand)
+        self.updateWatcher()
         self.setCurrentItem(root_item)
         self.scrollToItem(root_item)
 
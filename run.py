@@ -4,4 +4,6 @@
 from meditor import app
 
 
-app.main()
+if __name__ == '__main__':
+    # render process of preview imports this module again
+    app.main()
@@ -0,0 +1,184 @@
+"""
+incremental reStructuredText render gives the same html as a whole render
+
+run: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from meditor import output  # noqa: E402
+
+
+SECTIONS = """\
+Document
+########
+
+.. contents::
+
+.. _home: http://example.com
+
+Section A
+=========
+
+Text with *emphasis*, ``literal`` and home_.
+
+Sub A
+-----
+
+Footnote [#]_ and |sub|.
+
+.. [#] note of A
+
+Section B
+=========
+
+- item
+- item
+
+.. |sub| replace:: substitution
+
+Section C
+=========
+
+Last paragraph.
+"""
+
+
+def edit(text, old, new):
+    assert old in text, old
+    return text.replace(old, new, 1)
+
+
+class IncrementalTestCase(unittest.TestCase):
+    def setUp(self):
+        overrides = dict(output.default_overrides)
+        # broken documents are expected
+        overrides['warning_stream'] = ''
+        self.renderer = output.RstRenderer(overrides)
+        self.whole = output.RstRenderer(overrides)
+
+    def assertSameHtml(self, text):
+        html = self.renderer.render(text, incremental=True)
+        self.assertEqual(html.decode('utf-8'), self.whole.render(text).decode('utf-8'))
+
+    def assertEdits(self, text, *edits):
+        """ render text and every edit of it """
+        self.assertSameHtml(text)
+        for old, new in edits:
+            text = edit(text, old, new)
+            self.assertSameHtml(text)
+
+    def assertFragment(self, text, old, new):
+        """ an edit of text only renders the edited section again """
+        self.assertSameHtml(text)
+        text = edit(text, old, new)
+        html = self.renderer.fragments.render(
+            text, self.renderer.parser, self.renderer.settings)
+        self.assertIsNotNone(html)
+        self.assertEqual(html, self.whole.render(text).decode('utf-8'))
+
+    def test_document(self):
+        self.assertSameHtml(SECTIONS)
+
+    def test_fragment(self):
+        self.assertFragment(SECTIONS, 'Last paragraph.', 'Last sentence.')
+
+    def test_edit_in_section(self):
+        self.assertEdits(
+            SECTIONS,
+            ('Text with', 'Text about'),
+            ('- item\n', '- item\n- new item\n'),
+            ('Last paragraph.', 'Last paragraph [#]_.\n\n.. [#] note of C'),
+            ('and home_.', 'and `Sub A`_.'),
+        )
+
+    def test_edit_at_boundary(self):
+        self.assertEdits(
+            SECTIONS,
+            # text before a title
+            ('note of A\n\n', 'note of A\n\nend of A\n\n'),
+            # title is not a title
+            ('Section B\n=========\n', 'Section B\n'),
+            ('Section B\n', 'Section B\n=========\n'),
+            # title level is changed
+            ('Section C\n=========\n', 'Section C\n---------\n'),
+            # no blank line before title
+            ('Last paragraph.', 'Last paragraph.\nSection D\n========='),
+            ('.. |sub| replace:: substitution\n\n', '.. |sub| replace:: substitution\n'),
+            # new title in a section
+            ('Text with', 'New\n===\n\nText with'),
+        )
+
+    def test_duplicate_substitution(self):
+        text = edit(SECTIONS, 'Last paragraph.', 'Last |sub|.\n\n.. |sub| replace:: other')
+        self.assertSameHtml(text)
+
+    def test_duplicate_citation(self):
+        text = edit(SECTIONS, 'Last paragraph.', 'Cite [CIT]_.\n\n.. [CIT] one')
+        self.assertEdits(
+            text,
+            ('- item\n', '- item\n\n.. [CIT] two\n\ncite\n'),
+        )
+
+    def test_duplicate_target(self):
+        self.assertEdits(
+            SECTIONS,
+            ('Last paragraph.', 'Last paragraph.\n\n.. _home: http://example.org'),
+            ('Section B\n=========\n', 'Section B\n=========\n\n.. _section c:\n'),
+        )
+
+    def test_duplicate_reference_name(self):
+        self.assertEdits(
+            SECTIONS,
+            ('Last paragraph.', 'See `docs <http://a>`_ and `Section A`_.'),
+            ('- item\n- item', '- `docs <http://b>`_\n- `docs <http://a>`_'),
+            ('Sub A\n-----', 'Section A\n---------'),
+        )
+
+    def test_contents(self):
+        self.assertEdits(
+            SECTIONS,
+            ('Last paragraph.', '.. contents::\n\nLast paragraph.'),
+            ('- item\n', '.. contents:: Local\n   :local:\n\n- item\n'),
+        )
+
+    def test_broken_table(self):
+        table = '=====  =====\na      b\n\n'
+        self.assertEdits(
+            SECTIONS,
+            ('Last paragraph.', table + 'Title\n=====\n\nmore'),
+            ('Title\n=====\n', 'Title\n-----\n'),
+            ('b\n\nTitle', 'b\n=====  =====\n\nTitle'),
+        )
+
+    def test_table_without_blank_line(self):
+        table = '=====  =====\na      b\n'
+        self.assertEdits(
+            SECTIONS,
+            # table after a list, title in table
+            ('- item\n- item\n', '- item\n- item\n' + table),
+            # table after a title, title after table
+            ('Sub A\n-----\n', 'Sub A\n-----\n' + table + '=======\n'),
+        )
+
+    def test_contents_in_edited_section(self):
+        text = edit(SECTIONS, 'Footnote', '.. contents:: Here\n\nFootnote')
+        self.assertSameHtml(text)
+        # subsection is rendered alone in a parent section
+        text = edit(text, 'note of A', 'note about A')
+        html = self.renderer.fragments.render(
+            text, self.renderer.parser, self.renderer.settings)
+        if html is not None:
+            self.assertEqual(html, self.whole.render(text).decode('utf-8'))
+
+    def test_message_line(self):
+        """ message of edited section has line number in document """
+        text = edit(SECTIONS, 'Last paragraph.', 'Last :math:`x`.')
+        self.assertFragment(text, ':math:`x`', ':math:`\\foo`')
+
+
+if __name__ == '__main__':
+    unittest.main()